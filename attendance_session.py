@@ -0,0 +1,258 @@
+import logging
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from database import async_db_connection
+from notifications import absence_notifier
+from keyboards import (
+    get_attendance_student_rows, get_attendance_exception_rows, get_back_button, get_page_navigation_row
+)
+from config import ATTENDANCE_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+UPSERT_ATTENDANCE_SQL = """
+    INSERT INTO attendance (student_id, lesson_id, status)
+    VALUES (?, ?, ?)
+    ON CONFLICT(student_id, lesson_id) DO UPDATE SET status = excluded.status
+"""
+
+def _load_snapshot(conn, group_id, group_subject_id, date_str):
+    """Загрузить все данные для отметки одним заходом в поток БД"""
+    # Создаем или получаем занятие (уникально по предмету группы и дате)
+    lesson_sql = "SELECT id FROM lessons WHERE group_subject_id = ? AND date = ?"
+    lesson = conn.execute(lesson_sql, (group_subject_id, date_str)).fetchone()
+    if lesson is None:
+        conn.execute("""
+            INSERT OR IGNORE INTO lessons (group_subject_id, date)
+            VALUES (?, ?)
+        """, (group_subject_id, date_str))
+        conn.commit()
+        lesson = conn.execute(lesson_sql, (group_subject_id, date_str)).fetchone()
+    lesson_id = lesson['id']
+
+    students = conn.execute("""
+        SELECT s.id, s.full_name
+        FROM students s
+        WHERE s.group_id = ?
+        ORDER BY s.full_name
+    """, (group_id,)).fetchall()
+
+    statuses = dict(conn.execute("""
+        SELECT student_id, status FROM attendance
+        WHERE lesson_id = ?
+    """, (lesson_id,)).fetchall())
+
+    group_name, subject_name = conn.execute("""
+        SELECT g.name, s.name
+        FROM group_subjects gs
+        JOIN groups g ON gs.group_id = g.id
+        JOIN subjects s ON gs.subject_id = s.id
+        WHERE gs.id = ?
+    """, (group_subject_id,)).fetchone()
+
+    return {
+        'lesson_id': lesson_id,
+        'students': [(row['id'], row['full_name']) for row in students],
+        'statuses': statuses,
+        'group_name': group_name,
+        'subject_name': subject_name,
+    }
+
+# Всем студентам группы без отметки ставится "присутствовал" одним запросом
+MARK_REST_PRESENT_SQL = """
+    INSERT INTO attendance (student_id, lesson_id, status)
+    SELECT s.id, ?, 'present' FROM students s
+    WHERE s.group_id = ?
+    ON CONFLICT(student_id, lesson_id) DO NOTHING
+"""
+
+# Порядок переключения статуса нажатием на имя студента
+STATUS_CYCLE = {None: 'present', 'present': 'absent', 'absent': 'late', 'late': 'present'}
+
+def _write_pending(conn, lesson_id, pending):
+    """Записать накопленные отметки одной транзакцией (выполняется в потоке БД)"""
+    conn.executemany(
+        UPSERT_ATTENDANCE_SQL,
+        [(student_id, lesson_id, status) for student_id, status in pending.items()]
+    )
+    conn.commit()
+
+def _mark_rest_present(conn, lesson_id, group_id, pending):
+    """Сохранить отметки и отметить остальных присутствующими (одна транзакция)"""
+    conn.executemany(
+        UPSERT_ATTENDANCE_SQL,
+        [(student_id, lesson_id, status) for student_id, status in pending.items()]
+    )
+    conn.execute(MARK_REST_PRESENT_SQL, (lesson_id, group_id))
+    conn.commit()
+    return dict(conn.execute("""
+        SELECT student_id, status FROM attendance
+        WHERE lesson_id = ?
+    """, (lesson_id,)).fetchall())
+
+class MarkingSession:
+    """Сессия отметки посещаемости одного занятия.
+
+    Список студентов, названия и статусы загружаются один раз при открытии
+    занятия. Нажатия старосты только меняют словарь pending в памяти и
+    перестраивают ряд одного студента; в БД изменения попадают одной
+    транзакцией при сохранении, /cancel или по таймауту. На экран выводится
+    только текущая страница из page_size студентов.
+    """
+
+    def __init__(self, lesson_id, group_id, group_subject_id, date_str,
+                 group_name, subject_name, students, statuses, page_size=ATTENDANCE_PAGE_SIZE):
+        self.lesson_id = lesson_id
+        self.group_id = group_id
+        self.group_subject_id = group_subject_id
+        self.date_str = date_str
+        self.group_name = group_name
+        self.subject_name = subject_name
+        self.students = students  # [(student_id, full_name)] в порядке отображения
+        self.statuses = statuses  # student_id -> сохраненный статус
+        self.pending = {}  # student_id -> несохраненный статус
+        self.page = 0
+        self.page_size = page_size
+        self.exceptions_mode = False  # после "Все присутствуют" - по одному ряду на студента
+        self._names = dict(students)
+        self._rows = {}  # student_id -> отрисованные ряды клавиатуры
+
+    def __getstate__(self):
+        # Сессия хранится в user_data и сохраняется в БД: без производных данных
+        state = self.__dict__.copy()
+        del state['_names'], state['_rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._names = dict(self.students)
+        self._rows = {}
+
+    @classmethod
+    async def load(cls, group_id, group_subject_id, date_str):
+        """Открыть занятие и загрузить снимок данных для отметки"""
+        async with async_db_connection() as conn:
+            data = await conn.run(_load_snapshot, group_id, group_subject_id, date_str)
+        return cls(group_id=group_id, group_subject_id=group_subject_id, date_str=date_str, **data)
+
+    def matches(self, group_subject_id, date_str):
+        return self.group_subject_id == group_subject_id and self.date_str == date_str
+
+    def status(self, student_id):
+        """Текущий статус студента с учетом несохраненных отметок"""
+        return self.pending.get(student_id, self.statuses.get(student_id))
+
+    def mark(self, student_id, status):
+        """Запомнить статус студента (без обращения к БД) и обновить только его ряд"""
+        if student_id not in self._names:
+            return False
+        self.pending[student_id] = status
+        self._rows.pop(student_id, None)
+        return True
+
+    def toggle(self, student_id):
+        """Переключить статус по кругу: присутствовал -> отсутствовал -> опоздал"""
+        return self.mark(student_id, STATUS_CYCLE[self.status(student_id)])
+
+    async def mark_rest_present(self):
+        """Отметить всех неотмеченных присутствующими и перейти в режим исключений.
+
+        Несохраненные отметки записываются в той же транзакции, поэтому
+        уже отмеченные отсутствия и опоздания не перезаписываются.
+        """
+        pending = dict(self.pending)
+        async with async_db_connection() as conn:
+            self.statuses = await conn.run(_mark_rest_present, self.lesson_id, self.group_id, pending)
+
+        absence_notifier.collect(self.lesson_id, pending)
+
+        for student_id, status in pending.items():
+            if self.pending.get(student_id) == status:
+                del self.pending[student_id]
+        self.exceptions_mode = True
+        self._rows.clear()
+
+    @property
+    def pages(self):
+        return max(1, -(-len(self.students) // self.page_size))
+
+    def set_page(self, page):
+        """Перейти на страницу; вернуть True, если страница изменилась"""
+        page = min(max(page, 0), self.pages - 1)
+        if page == self.page:
+            return False
+        self.page = page
+        return True
+
+    @property
+    def has_changes(self):
+        return bool(self.pending)
+
+    def _student_rows(self, student_id):
+        rows = self._rows.get(student_id)
+        if rows is None:
+            build_rows = get_attendance_exception_rows if self.exceptions_mode else get_attendance_student_rows
+            rows = build_rows(student_id, self._names[student_id], self.status(student_id))
+            self._rows[student_id] = rows
+        return rows
+
+    def render(self):
+        """Текст и клавиатура текущей страницы экрана отметки (без запросов к БД)"""
+        start = self.page * self.page_size
+        page_students = self.students[start:start + self.page_size]
+        
+        keyboard = []
+        for student_id, _ in page_students:
+            keyboard.extend(self._student_rows(student_id))
+        
+        if self.pages > 1:
+            keyboard.append(get_page_navigation_row(self.page, self.pages, 'attendance_page'))
+        
+        if not self.exceptions_mode:
+            keyboard.append([InlineKeyboardButton("✅ Остальные присутствуют", callback_data='mark_all_present')])
+        
+        # Кнопки сохранения и возврата
+        keyboard.append([InlineKeyboardButton("💾 Сохранить посещаемость", callback_data='save_attendance')])
+        keyboard.append(get_back_button('main'))
+        
+        if self.exceptions_mode:
+            hint = "Все отмечены присутствующими. Нажмите на студента, чтобы переключить статус: ✅ → ❌ → ⏰"
+        else:
+            hint = "Выберите статус для каждого студента:"
+        
+        text = (
+            f"📊 Отметка посещаемости\n\nГруппа: {self.group_name}\nПредмет: {self.subject_name}\n"
+            f"Дата: {self.date_str}\n\n{hint}"
+        )
+        if self.pages > 1:
+            text += f"\n\nСтуденты {start + 1}–{start + len(page_students)} из {len(self.students)}"
+        return text, InlineKeyboardMarkup(keyboard)
+
+    async def flush(self):
+        """Сохранить накопленные отметки; вернуть количество записанных строк"""
+        if not self.pending:
+            return 0
+
+        pending = dict(self.pending)
+        async with async_db_connection() as conn:
+            await conn.run(_write_pending, self.lesson_id, pending)
+
+        absence_notifier.collect(self.lesson_id, pending)
+
+        # Отметки, сделанные во время записи, остаются до следующего сохранения
+        self.statuses.update(pending)
+        for student_id, status in pending.items():
+            if self.pending.get(student_id) == status:
+                del self.pending[student_id]
+
+        logger.info(f"Сохранено {len(pending)} отметок для занятия {self.lesson_id}")
+        return len(pending)
+
+async def flush_marking_session(user_data):
+    """Сохранить и закрыть сессию отметки из user_data (если она есть)"""
+    session = user_data.get('attendance_session')
+    if session is None:
+        return 0
+
+    saved = await session.flush()
+    user_data.pop('attendance_session', None)
+    return saved
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Бенчмарк задержки обработки callback'ов под конкурентной нагрузкой.
+
+Сравнивает синхронный доступ к БД прямо в event loop (как было раньше)
+с асинхронным слоем database.async_db_connection/run_db.
+
+Запуск:
+    python -m benchmarks.callback_latency [--clients 50] [--heavy 2] [--duration 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import db_connection, async_db_connection, run_db, init_database
+
+HEAVY_SQL = """
+    SELECT s.id, COUNT(*)
+    FROM students s
+    JOIN group_subjects gs ON gs.group_id = s.group_id
+    JOIN lessons l ON l.group_subject_id = gs.id
+    LEFT JOIN attendance a ON a.lesson_id = l.id AND a.student_id = s.id
+    GROUP BY s.id
+"""
+
+def fill_database(groups=20, students=30, subjects=6, lessons=60):
+    """Заполнить БД синтетическими данными"""
+    rnd = random.Random(42)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        for g in range(groups):
+            group_id = cur.execute("INSERT INTO groups (name) VALUES (?)", (f'G-{g}',)).lastrowid
+            student_ids = [
+                cur.execute("INSERT INTO students (full_name, group_id, telegram_id) VALUES (?, ?, ?)",
+                            (f'Student {g}-{s}', group_id, g * 1000 + s)).lastrowid
+                for s in range(students)
+            ]
+            for sub in range(subjects):
+                subject_id = cur.execute("INSERT INTO subjects (name) VALUES (?)", (f'Subject {g}-{sub}',)).lastrowid
+                gs_id = cur.execute("INSERT INTO group_subjects (group_id, subject_id) VALUES (?, ?)",
+                                    (group_id, subject_id)).lastrowid
+                for day in range(lessons):
+                    lesson_id = cur.execute("INSERT INTO lessons (group_subject_id, date) VALUES (?, ?)",
+                                            (gs_id, f'2024-{1 + day // 28:02d}-{1 + day % 28:02d}')).lastrowid
+                    cur.executemany(
+                        "INSERT INTO attendance (student_id, lesson_id, status) VALUES (?, ?, ?)",
+                        [(sid, lesson_id, rnd.choice(('present', 'present', 'absent', 'late'))) for sid in student_ids]
+                    )
+        conn.commit()
+
+# --- Синхронный вариант (до): запросы выполняются прямо в event loop
+
+async def sync_light_callback(user_id):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT role FROM admins WHERE telegram_id = ?", (user_id,))
+        if cur.fetchone() is None:
+            cur.execute("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
+            cur.fetchone()
+
+async def sync_heavy_job(student_id):
+    with db_connection() as conn:
+        conn.execute(HEAVY_SQL).fetchall()
+        conn.execute("INSERT OR REPLACE INTO attendance (student_id, lesson_id, status) VALUES (?, 1, 'late')", (student_id,))
+        conn.commit()
+
+# --- Асинхронный вариант (после): запросы выполняются в потоках БД
+
+async def async_light_callback(user_id):
+    async with async_db_connection() as conn:
+        if await conn.fetchone("SELECT role FROM admins WHERE telegram_id = ?", (user_id,)) is None:
+            await conn.fetchone("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
+
+def _heavy(conn, student_id):
+    conn.execute(HEAVY_SQL).fetchall()
+    conn.execute("INSERT OR REPLACE INTO attendance (student_id, lesson_id, status) VALUES (?, 1, 'late')", (student_id,))
+    conn.commit()
+
+async def async_heavy_job(student_id):
+    await run_db(_heavy, student_id)
+
+async def run_load(light, heavy, clients, heavy_workers, duration):
+    """Запустить нагрузку и вернуть список задержек легких callback'ов (мс)"""
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client(n):
+        # Открытая модель нагрузки: задержка считается от запланированного момента
+        # прихода callback'а, поэтому время ожидания заблокированного event loop тоже учитывается
+        rnd = random.Random(n)
+        arrival = time.perf_counter()
+        while arrival < deadline:
+            arrival += rnd.uniform(0.05, 0.15)
+            await asyncio.sleep(max(0, arrival - time.perf_counter()))
+            await light(rnd.randrange(20000))
+            latencies.append((time.perf_counter() - arrival) * 1000)
+
+    async def heavy_client(n):
+        while time.perf_counter() < deadline:
+            await heavy(n + 1)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(
+        *(client(n) for n in range(clients)),
+        *(heavy_client(n) for n in range(heavy_workers))
+    )
+    return latencies
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def report(name, latencies):
+    print(f"{name:>6}: n={len(latencies):6d}  "
+          f"p50={percentile(latencies, 50):8.2f} ms  "
+          f"p99={percentile(latencies, 99):8.2f} ms  "
+          f"max={max(latencies):8.2f} ms  "
+          f"mean={statistics.mean(latencies):8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--heavy', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        init_database()
+        fill_database()
+
+        before = asyncio.run(run_load(sync_light_callback, sync_heavy_job, args.clients, args.heavy, args.duration))
+        after = asyncio.run(run_load(async_light_callback, async_heavy_job, args.clients, args.heavy, args.duration))
+
+        print(f"clients={args.clients} heavy={args.heavy} duration={args.duration}s db_workers={database.DB_WORKERS}")
+        report('before', before)
+        report('after', after)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
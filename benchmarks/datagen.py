@@ -0,0 +1,185 @@
+"""Генератор синтетической БД бота с реалистичными данными.
+
+Данные полностью определяются параметрами и seed: группы вида "ИВТ-23-1"
+со студентами (ФИО, часть зарегистрирована в боте), общий каталог
+предметов, расписание на несколько семестров (предмет группы идет 1-2 раза
+в неделю в постоянные дни) и отметки посещаемости. У каждого студента своя
+склонность к пропускам и опозданиям, поэтому в группе есть и отличники, и
+постоянно отсутствующие; часть занятий не отмечена вовсе.
+
+Запуск:
+    python -m benchmarks.datagen [--output university_bot.db] [--groups 4] [--students 25]
+        [--subjects 6] [--semesters 1] [--scale 1] [--seed 42]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import _connect
+from migrations import migrate
+
+PROGRAMS = ['ИВТ', 'ПИ', 'ПМИ', 'БИ', 'ИБ', 'ЭК', 'МЕН', 'ЮР', 'ФИЛ', 'ХИМ', 'ФИЗ', 'БИО']
+
+SUBJECTS = [
+    'Математический анализ', 'Линейная алгебра', 'Дискретная математика', 'Программирование',
+    'Базы данных', 'Операционные системы', 'Компьютерные сети', 'Физика', 'История России',
+    'Философия', 'Иностранный язык', 'Физическая культура', 'Экономика', 'Теория вероятностей',
+    'Алгоритмы и структуры данных', 'Правоведение', 'Безопасность жизнедеятельности',
+    'Архитектура ЭВМ', 'Численные методы', 'Web-разработка',
+]
+
+SURNAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+    'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров',
+    'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин',
+    'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев', 'Романов', 'Воробьев',
+]
+MALE_NAMES = [
+    'Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Артем', 'Илья',
+    'Кирилл', 'Михаил', 'Никита', 'Матвей', 'Роман', 'Егор', 'Иван', 'Денис',
+]
+FEMALE_NAMES = [
+    'Анастасия', 'Мария', 'Анна', 'Виктория', 'Екатерина', 'Наталья', 'Дарья', 'Алина',
+    'Полина', 'Елизавета', 'Софья', 'Ксения', 'Валерия', 'Юлия', 'Ольга', 'Татьяна',
+]
+PATRONYMICS = [
+    'Александров', 'Дмитриев', 'Сергеев', 'Андреев', 'Алексеев', 'Михайлов', 'Иванов',
+    'Николаев', 'Викторов', 'Владимиров', 'Евгеньев', 'Олегов', 'Петров', 'Юрьев',
+]
+
+SEMESTER_WEEKS = 17
+
+# Доля отметок "отсутствовал" и "опоздал" у студента: Beta(a, b), в среднем
+# около 12% и 5%, с длинным хвостом постоянно отсутствующих
+ABSENT_BETA = (2, 14)
+LATE_BETA = (1, 19)
+UNMARKED_LESSON_RATE = 0.02  # занятие не отмечено вовсе
+UNMARKED_STUDENT_RATE = 0.01  # студент пропущен при отметке
+
+# Первый telegram_id зарегистрированных студентов
+STUDENT_TELEGRAM_ID_BASE = 100_000_000
+
+def full_name(rnd):
+    """Случайное ФИО студента"""
+    surname = rnd.choice(SURNAMES)
+    patronymic = rnd.choice(PATRONYMICS)
+    if rnd.random() < 0.5:
+        return f"{surname} {rnd.choice(MALE_NAMES)} {patronymic}ич"
+    return f"{surname}а {rnd.choice(FEMALE_NAMES)} {patronymic}на"
+
+def semester_weeks(semester, start_year):
+    """Понедельники учебных недель семестра (0 - осенний семестр start_year, 1 - весенний и т.д.)"""
+    year = start_year + (semester + 1) // 2
+    first_day = date(year, 9, 1) if semester % 2 == 0 else date(year, 2, 9)
+    monday = first_day + timedelta(days=-first_day.weekday() % 7)  # первый понедельник семестра
+    return [monday + timedelta(weeks=week) for week in range(SEMESTER_WEEKS)]
+
+def lesson_dates(rnd, semesters, start_year, lessons_per_week):
+    """Даты занятий предмета группы: постоянные дни недели (пн-сб) каждого семестра"""
+    dates = []
+    for semester in range(semesters):
+        weekdays = sorted(rnd.sample(range(6), rnd.randint(1, lessons_per_week)))
+        for monday in semester_weeks(semester, start_year):
+            dates.extend(monday + timedelta(days=weekday) for weekday in weekdays)
+    return [day.isoformat() for day in dates]
+
+def generate(path, groups=4, students_per_group=25, subjects_per_group=6, semesters=1,
+             lessons_per_week=2, registered=0.7, notify=0.3, start_year=2024, admins=(), seed=42):
+    """Создать БД path (схема последней версии) и заполнить ее; вернуть число записей по таблицам"""
+    rnd = random.Random(seed)
+    conn = _connect(path)
+    try:
+        migrate(conn)
+        # БД одноразовая: надежность записи не нужна
+        conn.execute("PRAGMA synchronous = OFF")
+
+        catalogue = list(SUBJECTS)
+        catalogue += [f"Спецкурс {n}" for n in range(1, subjects_per_group - len(catalogue) + 1)]
+        conn.executemany("INSERT INTO subjects (id, name) VALUES (?, ?)", list(enumerate(catalogue, 1)))
+        conn.executemany("INSERT INTO admins (telegram_id, role) VALUES (?, 'admin')", [(a,) for a in admins])
+
+        counts = {'groups': groups, 'subjects': len(catalogue), 'students': 0, 'lessons': 0, 'attendance': 0}
+        student_id = lesson_id = group_subject_id = 0
+        for group_id in range(1, groups + 1):
+            program = PROGRAMS[(group_id - 1) % len(PROGRAMS)]
+            year = start_year - (group_id - 1) // len(PROGRAMS) % 4
+            number = (group_id - 1) // (len(PROGRAMS) * 4) + 1
+            conn.execute("INSERT INTO groups (id, name) VALUES (?, ?)", (group_id, f"{program}-{year % 100}-{number}"))
+
+            students = []
+            for _ in range(students_per_group):
+                student_id += 1
+                telegram_id = STUDENT_TELEGRAM_ID_BASE + student_id if rnd.random() < registered else None
+                students.append((
+                    student_id, full_name(rnd), group_id, telegram_id,
+                    int(telegram_id is not None and rnd.random() < notify),
+                    rnd.betavariate(*ABSENT_BETA), rnd.betavariate(*LATE_BETA)
+                ))
+            conn.executemany(
+                "INSERT INTO students (id, full_name, group_id, telegram_id, notify_absence) VALUES (?, ?, ?, ?, ?)",
+                [row[:5] for row in students]
+            )
+
+            for subject_id in rnd.sample(range(1, len(catalogue) + 1), subjects_per_group):
+                group_subject_id += 1
+                conn.execute("INSERT INTO group_subjects (id, group_id, subject_id) VALUES (?, ?, ?)",
+                             (group_subject_id, group_id, subject_id))
+
+                lessons, marks = [], []
+                for lesson_date in lesson_dates(rnd, semesters, start_year, lessons_per_week):
+                    lesson_id += 1
+                    lessons.append((lesson_id, group_subject_id, lesson_date))
+                    if rnd.random() < UNMARKED_LESSON_RATE:
+                        continue
+                    for sid, _, _, _, _, absent_rate, late_rate in students:
+                        roll = rnd.random()
+                        if roll < UNMARKED_STUDENT_RATE:
+                            continue
+                        roll = rnd.random()
+                        status = 'absent' if roll < absent_rate else 'late' if roll < absent_rate + late_rate else 'present'
+                        marks.append((sid, lesson_id, status))
+
+                conn.executemany("INSERT INTO lessons (id, group_subject_id, date) VALUES (?, ?, ?)", lessons)
+                conn.executemany("INSERT INTO attendance (student_id, lesson_id, status) VALUES (?, ?, ?)", marks)
+                counts['lessons'] += len(lessons)
+                counts['attendance'] += len(marks)
+            counts['students'] += len(students)
+
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='university_bot.db')
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--students', type=int, default=25, help='студентов в группе')
+    parser.add_argument('--subjects', type=int, default=6, help='предметов у группы')
+    parser.add_argument('--semesters', type=int, default=1)
+    parser.add_argument('--lessons-per-week', type=int, default=2, help='занятий предмета в неделю (не больше)')
+    parser.add_argument('--registered', type=float, default=0.7, help='доля студентов, зарегистрированных в боте')
+    parser.add_argument('--scale', type=int, default=1, help='множитель числа групп')
+    parser.add_argument('--admin', type=int, action='append', default=[], help='telegram_id администратора')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        parser.error(f"{args.output} уже существует")
+
+    started = time.perf_counter()
+    counts = generate(
+        args.output, groups=args.groups * args.scale, students_per_group=args.students,
+        subjects_per_group=args.subjects, semesters=args.semesters, lessons_per_week=args.lessons_per_week,
+        registered=args.registered, admins=args.admin, seed=args.seed
+    )
+    print(f"{args.output}: " + ', '.join(f"{table}={count}" for table, count in counts.items())
+          + f" ({time.perf_counter() - started:.1f} s)")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
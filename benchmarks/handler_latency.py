@@ -0,0 +1,379 @@
+"""Бенчмарк обработчиков бота на синтетических данных разного объема.
+
+Для каждого масштаба (1x, 10x, 100x - множитель числа групп) создается БД
+генератором benchmarks.datagen, и методы обработчиков вызываются так же, как
+их вызывает Application: с апдейтами Update/CallbackQuery, собранными из
+JSON, и контекстом с user_data. Бот настоящий (telegram.Bot), но запросы к
+Bot API не уходят в сеть: их принимает заглушка, отвечающая как Telegram.
+Замер включает фоновые задачи, запущенные обработчиком (отложенные правки
+сообщений, построение и отправка отчета, уведомления о пропусках), - до
+того момента, когда пользователь получил результат.
+
+Для каждого обработчика выводятся перцентили задержки, число SQL-выражений и
+вызовов Bot API на один вызов и пиковая память (tracemalloc, отдельным
+прогоном). Кэши справочников, ролей и отчетов перед каждым вызовом
+сбрасываются (--warm - не сбрасываются). Отчеты по умолчанию строятся в
+потоке, а не в пуле процессов, чтобы их запросы и память попадали в замер;
+--processes - как в боте, в пуле процессов (тогда запросы и память
+процессов пула не учитываются).
+
+Запуск:
+    python -m benchmarks.handler_latency [--scales 1 10 100] [--iterations 50] [--budget 10]
+        [--only show_students_for_attendance xlsx_report] [--warm] [--processes]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot, Update
+from telegram.request import BaseRequest
+
+import database
+import reports
+from config import DB_NAME
+from handlers import AdminHandlers, AttendanceHandlers, SubjectHandlers
+from message_editor import message_editor
+from notifications import absence_notifier
+from reference_cache import reference_cache
+from reports import report_service, available_report_formats
+from utils import role_cache
+from benchmarks.callback_latency import percentile
+from benchmarks.datagen import generate
+
+ADMIN_ID = 1
+REPORT_START = '2020-01-01'
+
+class StubRequest(BaseRequest):
+    """Заглушка Bot API: отвечает на запросы бота, как Telegram, без сети"""
+
+    def __init__(self):
+        self.calls = Counter()  # метод Bot API -> число вызовов
+        self.errors = 0  # сообщений об ошибке ("❌ ...") пользователю
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+
+        text = params.get('text') or params.get('caption') or ''
+        if text.startswith('❌'):
+            self.errors += 1
+
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif api_method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            self._message_id += 1
+            result = {
+                'message_id': int(params.get('message_id', self._message_id)),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': text,
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+class QueryCounter:
+    """Счетчик SQL-выражений всех соединений с БД.
+
+    executemany считается по выражению на строку, выражения триггеров не считаются.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, sql):
+        if not sql.lstrip().startswith('--'):
+            with self._lock:
+                self.count += 1
+
+    def wrap(self, connect):
+        def traced_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            conn.set_trace_callback(self._trace)
+            return conn
+        return traced_connect
+
+class FakeContext:
+    """Контекст обработчика: user_data и запуск фоновых задач, как у Application"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.user_data = {}
+        self.application = self
+
+    def create_task(self, coroutine, update=None, name=None):
+        return asyncio.create_task(coroutine, name=name)
+
+class UpdateFactory:
+    """Апдейты от пользователей; каждый callback - на новое сообщение бота"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._ids = 0
+
+    def _next_id(self):
+        self._ids += 1
+        return self._ids
+
+    def callback(self, data, user_id=ADMIN_ID):
+        user = {'id': user_id, 'is_bot': False, 'first_name': 'User'}
+        chat = {'id': user_id, 'type': 'private'}
+        return Update.de_json({
+            'update_id': self._next_id(),
+            'callback_query': {
+                'id': str(self._ids),
+                'from': user,
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {'message_id': self._ids, 'date': int(time.time()), 'chat': chat, 'text': '...'},
+            },
+        }, self.bot)
+
+async def settle():
+    """Дождаться всех фоновых задач, запущенных обработчиком (и задач, запущенных ими)"""
+    current = asyncio.current_task()
+    while True:
+        tasks = [task for task in asyncio.all_tasks() if task is not current and not task.done()]
+        if not tasks:
+            return
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def load_fixture():
+    """Группа, предмет, занятие с отметками и зарегистрированный студент для сценариев"""
+    with database.db_connection() as conn:
+        group_id = 1
+        group_subject_id = conn.execute(
+            "SELECT MIN(id) FROM group_subjects WHERE group_id = ?", (group_id,)
+        ).fetchone()[0]
+        lesson_date = conn.execute(
+            "SELECT MAX(date) FROM lessons WHERE group_subject_id = ?", (group_subject_id,)
+        ).fetchone()[0]
+        student_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM students WHERE group_id = ? ORDER BY full_name", (group_id,)
+        )]
+        student_tg = conn.execute(
+            "SELECT telegram_id FROM students WHERE group_id = ? AND telegram_id IS NOT NULL LIMIT 1", (group_id,)
+        ).fetchone()[0]
+    return group_id, group_subject_id, lesson_date, student_ids, student_tg
+
+def build_scenarios(updates):
+    """[(название, setup(ctx) -> апдейт, call(ctx, апдейт))] для всех измеряемых обработчиков"""
+    attendance = AttendanceHandlers()
+    admin = AdminHandlers()
+    subject = SubjectHandlers()
+    group_id, group_subject_id, lesson_date, student_ids, student_tg = load_fixture()
+    report_end = date.today().isoformat()
+    saves = itertools.count()
+
+    def callback(data, user_id=ADMIN_ID):
+        async def setup(ctx):
+            return updates.callback(data, user_id)
+        return setup
+
+    async def open_lesson(ctx):
+        ctx.user_data.update(
+            attendance_group_id=group_id,
+            attendance_group_subject_id=group_subject_id,
+            attendance_date=lesson_date,
+        )
+        return updates.callback(f'attendance_date_{lesson_date}')
+
+    async def open_session(ctx):
+        # Сессия отметки уже загружена: нажатия работают с ней
+        await attendance.select_date_attendance(await open_lesson(ctx), ctx)
+        await settle()
+
+    async def mark_one(ctx):
+        await open_session(ctx)
+        return updates.callback(f'mark_absent_{student_ids[0]}')
+
+    async def mark_page(ctx):
+        await open_session(ctx)
+        # Каждое сохранение меняет отметки всех студентов
+        session = ctx.user_data['attendance_session']
+        shift = next(saves)
+        for n, student_id in enumerate(student_ids):
+            session.mark(student_id, ('present', 'absent', 'late')[(n + shift) % 3])
+        return updates.callback('save_attendance')
+
+    def report(report_format):
+        async def call(ctx, update):
+            await attendance.generate_report_in_format(
+                update, ctx, group_id, REPORT_START, report_end, report_format
+            )
+        return (f'{report_format}_report', callback(f'report_{report_format}'), call)
+
+    scenarios = [
+        ('start_attendance', callback('attendance'),
+         lambda ctx, update: attendance.start_attendance(update, ctx)),
+        ('select_group_attendance', callback(f'attendance_group_{group_id}'),
+         lambda ctx, update: attendance.select_group_attendance(update, ctx)),
+        ('show_students_for_attendance', open_lesson,
+         lambda ctx, update: attendance.select_date_attendance(update, ctx)),
+        ('mark_student_attendance', mark_one,
+         lambda ctx, update: attendance.mark_student_attendance(update, ctx)),
+        ('save_attendance', mark_page,
+         lambda ctx, update: attendance.mark_student_attendance(update, ctx)),
+        ('show_my_attendance', callback('my_attendance', student_tg),
+         lambda ctx, update: attendance.show_my_attendance(update.callback_query)),
+        ('show_subjects_for_group', callback(f'subjects_group_{group_id}'),
+         lambda ctx, update: subject.show_subjects_for_group(update.callback_query, group_id)),
+        ('list_students', callback('list_students'),
+         lambda ctx, update: admin.list_students(update.callback_query)),
+        ('generate_quick_report', callback('quick_report'),
+         lambda ctx, update: attendance.generate_quick_report(update.callback_query)),
+    ]
+    scenarios += [report(report_format) for report_format in ('text', 'csv', 'xlsx', 'xlsx_detail')
+                  if report_format in available_report_formats()]
+    scenarios.append(('campus_bundle', callback('report_period_all_all'),
+                      lambda ctx, update: attendance.select_report_date_range(update, ctx)))
+    return scenarios
+
+def reset_caches():
+    reference_cache.invalidate()
+    role_cache.invalidate()
+    report_service.cache.invalidate()
+
+async def measure(bot, request, counter, setup, call, iterations, budget, warm):
+    """Задержки (мс), запросов и вызовов Bot API на вызов, пиковая память (байт)"""
+    latencies, queries, api_calls = [], [], []
+    deadline = time.perf_counter() + budget
+
+    async def run_once():
+        ctx = FakeContext(bot)
+        update = await setup(ctx)
+        if not warm:
+            reset_caches()
+        queries_before, calls_before = counter.count, sum(request.calls.values())
+        started = time.perf_counter()
+        await call(ctx, update)
+        await settle()
+        elapsed = time.perf_counter() - started
+        return elapsed, counter.count - queries_before, sum(request.calls.values()) - calls_before
+
+    # Первый вызов прогревает импорт и пул соединений и в статистику не входит
+    await run_once()
+    while len(latencies) < iterations and (len(latencies) < 3 or time.perf_counter() < deadline):
+        elapsed, query_count, call_count = await run_once()
+        latencies.append(elapsed * 1000)
+        queries.append(query_count)
+        api_calls.append(call_count)
+
+    # Память - отдельным прогоном: tracemalloc заметно замедляет выполнение
+    ctx = FakeContext(bot)
+    update = await setup(ctx)
+    if not warm:
+        reset_caches()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        await call(ctx, update)
+        await settle()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return latencies, statistics.mean(queries), statistics.mean(api_calls), peak
+
+def report(name, latencies, queries, api_calls, peak):
+    print(f"{name:>30}: n={len(latencies):4d}  "
+          f"p50={percentile(latencies, 50):9.2f} ms  "
+          f"p95={percentile(latencies, 95):9.2f} ms  "
+          f"p99={percentile(latencies, 99):9.2f} ms  "
+          f"queries={queries:7.1f}  api={api_calls:4.1f}  "
+          f"peak={peak / 1024 / 1024:8.2f} MiB")
+
+async def run_scale(args, scale, counter):
+    request = StubRequest()
+    bot = Bot('1:bench', request=request, get_updates_request=StubRequest())
+    await bot.initialize()
+
+    started = time.perf_counter()
+    counts = generate(
+        DB_NAME, groups=args.groups * scale, students_per_group=args.students,
+        subjects_per_group=args.subjects, semesters=args.semesters, admins=(ADMIN_ID,), seed=args.seed
+    )
+    print(f"\nscale={scale}x  " + '  '.join(f"{table}={count}" for table, count in counts.items())
+          + f"  (generated in {time.perf_counter() - started:.1f} s)")
+
+    if not args.processes:
+        report_service._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report')
+    reports._worker_conn = database._connect()
+
+    try:
+        for name, setup, call in build_scenarios(UpdateFactory(bot)):
+            if args.only and name not in args.only:
+                continue
+            errors_before = request.errors
+            report(name, *await measure(bot, request, counter, setup, call, args.iterations, args.budget, args.warm))
+            if request.errors > errors_before:
+                print(f"{'':>30}  ❌ сообщений об ошибке: {request.errors - errors_before}")
+    finally:
+        await bot.shutdown()
+        # Соединения и пул отчетов открыты на БД этого масштаба
+        report_service.shutdown()
+        reports._worker_conn.close()
+        reports._worker_conn = None
+        database._pool.close()
+        reset_caches()
+
+async def run(args):
+    counter = QueryCounter()
+    database._connect = counter.wrap(database._connect)
+    # Уведомления о пропусках ставятся в очередь сразу, а правки не ждут окна слияния
+    absence_notifier.delay = 0
+    message_editor.window = 0
+
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            await run_scale(args, scale, counter)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--groups', type=int, default=4, help='групп при масштабе 1x')
+    parser.add_argument('--students', type=int, default=25, help='студентов в группе')
+    parser.add_argument('--subjects', type=int, default=6, help='предметов у группы')
+    parser.add_argument('--semesters', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50, help='вызовов каждого обработчика')
+    parser.add_argument('--budget', type=float, default=10.0, help='секунд на обработчик (не меньше 3 вызовов)')
+    parser.add_argument('--only', nargs='+', help='измерить только эти обработчики')
+    parser.add_argument('--warm', action='store_true', help='не сбрасывать кэши перед вызовом')
+    parser.add_argument('--processes', action='store_true', help='строить отчеты в пуле процессов, как в боте')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(name)s - %(levelname)s - %(message)s')
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,166 @@
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Типы полей в шаблонах callback_data: {group_id:int}, {date} (строка)
+FIELD_TYPES = {'int': int, 'str': str}
+
+def _split_template(template):
+    """Части шаблона через "_"; "_" внутри {...} не разделяет"""
+    tokens = []
+    token = ''
+    depth = 0
+    for char in template:
+        if char == '_' and not depth:
+            tokens.append(token)
+            token = ''
+            continue
+        depth += (char == '{') - (char == '}')
+        token += char
+    tokens.append(token)
+    return tokens
+
+class CallbackRoute:
+    """Маршрут кнопки: шаблон callback_data и обработчик.
+
+    Шаблон - части через "_": сначала литералы, затем поля, например
+    'list_subjects_group_{group_id:int}'. Последнее поле забирает остаток
+    строки, поэтому может содержать "_". Обработчики диалогов разбирают
+    callback_data тем же шаблоном через match() (без handler).
+    """
+
+    def __init__(self, template, handler=None, name=None):
+        self.template = template
+        self.handler = handler
+        self.name = name or template.split('_{')[0]
+
+        tokens = _split_template(template)
+        literals = []
+        for token in tokens:
+            if token.startswith('{'):
+                break
+            literals.append(token)
+        self.prefix = tuple(literals)
+
+        self.fields = []  # [(имя, тип)]
+        for token in tokens[len(literals):]:
+            if not (token.startswith('{') and token.endswith('}')):
+                raise ValueError(f"Литерал после поля в шаблоне callback_data: {template}")
+            field_name, _, type_name = token[1:-1].partition(':')
+            self.fields.append((field_name, FIELD_TYPES[type_name or 'str']))
+
+    def parse(self, tokens):
+        """Поля из частей callback_data после префикса; None, если не подходят"""
+        if len(tokens) < len(self.fields):
+            return None
+        last = len(self.fields) - 1
+        values = tokens[:last] + ['_'.join(tokens[last:])]
+        if '' in values:
+            return None
+        try:
+            return {name: convert(value) for (name, convert), value in zip(self.fields, values)}
+        except ValueError:
+            return None
+
+    def match(self, data):
+        """Поля из callback_data целиком; None, если она не подходит под шаблон"""
+        tokens = data.split('_')
+        size = len(self.prefix)
+        if tuple(tokens[:size]) != self.prefix:
+            return None
+        if not self.fields:
+            return {} if len(tokens) == size else None
+        return self.parse(tokens[size:])
+
+class _TrieNode:
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = {}  # часть callback_data -> узел
+        self.routes = []  # маршруты с полями, префикс которых заканчивается здесь
+
+class CallbackRouter:
+    """Маршрутизатор кнопок вне диалогов.
+
+    Маршруты добавляются при настройке обработчиков, compile() один раз
+    строит таблицу: callback_data без полей ищется в словаре, с полями - по
+    дереву префиксов из частей через "_" (побеждает самый длинный префикс).
+    Для каждого маршрута считается число нажатий.
+    """
+
+    def __init__(self):
+        self._routes = []
+        self._exact = {}
+        self._root = None
+        self.hits = Counter()
+        self.unmatched = 0
+
+    def add(self, template, handler, name=None):
+        """Добавить маршрут; handler(update, context, **поля)"""
+        if self._root is not None:
+            raise RuntimeError("Маршруты добавляются до compile()")
+        self._routes.append(CallbackRoute(template, handler, name))
+
+    def compile(self):
+        """Построить таблицу маршрутов (один раз при запуске)"""
+        exact = {}
+        root = _TrieNode()
+        for route in self._routes:
+            if not route.fields:
+                if route.template in exact:
+                    raise ValueError(f"Повторный маршрут callback_data: {route.template}")
+                exact[route.template] = route
+                continue
+
+            node = root
+            for token in route.prefix:
+                node = node.children.setdefault(token, _TrieNode())
+            node.routes.append(route)
+
+        self._exact = exact
+        self._root = root
+        logger.info(f"Маршрутов кнопок: {len(self._routes)}")
+
+    def match(self, data):
+        """(маршрут, поля) для callback_data или (None, None)"""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, {}
+
+        tokens = data.split('_')
+        node = self._root
+        candidates = []
+        for depth, token in enumerate(tokens, 1):
+            node = node.children.get(token)
+            if node is None:
+                break
+            if node.routes:
+                candidates.append((depth, node.routes))
+
+        for depth, routes in reversed(candidates):
+            for route in routes:
+                fields = route.parse(tokens[depth:])
+                if fields is not None:
+                    return route, fields
+        return None, None
+
+    async def dispatch(self, update, context):
+        """Вызвать обработчик маршрута; вернуть False, если маршрут не найден"""
+        route, fields = self.match(update.callback_query.data or '')
+        if route is None:
+            self.unmatched += 1
+            return False
+
+        self.hits[route.name] += 1
+        await route.handler(update, context, **fields)
+        return True
+
+    def stats(self):
+        return {
+            'routes': len(self._routes),
+            'hits': self.hits.most_common(),
+            'unmatched': self.unmatched,
+        }
+
+callback_router = CallbackRouter()
\ No newline at end of file
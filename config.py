@@ -6,6 +6,73 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 DB_NAME = 'university_bot.db'
 
+# Адрес Bot API (например, локальный сервер Bot API или тестовая подмена Telegram)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # публичный адрес webhook; если задан, регистрируется при запуске
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024
+
+# Кэш ролей пользователей
+ROLE_CACHE_TTL = 300  # секунд
+ROLE_CACHE_SIZE = 10000
+
+# Кэш справочников (группы, предметы): сбрасывается при изменениях, а время жизни
+# ограничивает устаревание при нескольких экземплярах бота
+REFERENCE_CACHE_TTL = 60  # секунд
+
+# Сохранение user_data и состояний диалогов в БД: изменения копятся в памяти
+# и записываются одной транзакцией раз в PERSISTENCE_UPDATE_INTERVAL секунд
+PERSISTENCE_UPDATE_INTERVAL = 10
+PERSISTENCE_COMPRESS_MIN_BYTES = 256  # записи длиннее сжимаются zlib
+
+# Очередь исходящих сообщений (рассылки): лимиты Telegram - около 30 сообщений
+# в секунду всего и не чаще одного сообщения в секунду в один чат
+OUTBOX_GLOBAL_RATE = 30  # сообщений в секунду
+OUTBOX_CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+OUTBOX_TICK = 0.5  # как часто JobQueue отправляет следующую порцию, секунд
+OUTBOX_MAX_ATTEMPTS = 5  # попыток при сетевых ошибках
+OUTBOX_MAX_BACKOFF = 300  # секунд
+
+# Уведомления студентам об отсутствии и опоздании: собираются после сохранения
+# отметок и ставятся в очередь порцией через столько секунд (повторные
+# переотметки за это время схлопываются)
+ABSENCE_NOTIFY_DELAY = 60
+
+# Правки сообщений (экран отметки): частые нажатия на одно сообщение сливаются
+# в одну правку не чаще раза в EDIT_COALESCE_WINDOW секунд
+EDIT_COALESCE_WINDOW = 0.5
+EDIT_STATE_SIZE = 10000  # сообщений, для которых помнится последняя правка
+EDIT_MAX_RETRIES = 3  # повторов итоговой правки после RetryAfter
+
+# Через сколько секунд бездействия сессия отметки посещаемости сохраняется и закрывается
+ATTENDANCE_SESSION_TIMEOUT = 15 * 60
+
+# Сколько студентов показывать на одной странице экрана отметки
+ATTENDANCE_PAGE_SIZE = 8
+
+# Построение отчетов в отдельных процессах
+REPORT_WORKERS = max(1, min(4, os.cpu_count() or 1))  # процессов в пуле
+REPORT_QUEUE_SIZE = 8  # отчетов в работе и в очереди одновременно
+REPORT_CHUNK_SIZE = 1000  # строк, читаемых из БД за один раз
+REPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024  # больше - файл отчета собирается на диске
+
+# Кэш готовых отчетов
+REPORT_CACHE_SIZE = 64  # отчетов в памяти
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR')  # каталог для вытесненных из памяти отчетов (не задан - без диска)
+REPORT_CACHE_DISK_BYTES = 512 * 1024 * 1024
+
+# Импорт из файлов: строк на одну транзакцию
+IMPORT_CHUNK_SIZE = 500
+# Загрузка архива посещаемости: отметок на одну транзакцию
+INGEST_BATCH_SIZE = 5000
+
 # Состояния для ConversationHandler
 (
     # Основные состояния
@@ -14,6 +81,7 @@ DB_NAME = 'university_bot.db'
     # Управление студентами
     MANAGE_STUDENTS, ADD_STUDENT_NAME, ADD_STUDENT_GROUP, EDIT_STUDENT_SELECT,
     EDIT_STUDENT_NAME, EDIT_STUDENT_GROUP, DELETE_STUDENT,
+    IMPORT_STUDENTS_FILE, IMPORT_STUDENTS_CONFIRM,
     
     # Регистрация студента
     REGISTER_NAME, REGISTER_GROUP,
@@ -29,5 +97,8 @@ DB_NAME = 'university_bot.db'
     MANAGE_SUBJECTS, ADD_SUBJECT_NAME, SELECT_GROUP_FOR_SUBJECT, DELETE_SUBJECT,
 
     # Составление отчета
-    SELECT_REPORT_GROUP, SELECT_REPORT_DATE_RANGE, GENERATE_REPORT
-) = range(29)
\ No newline at end of file
+    SELECT_REPORT_GROUP, SELECT_REPORT_DATE_RANGE, GENERATE_REPORT,
+
+    # Рассылка
+    BROADCAST_SELECT_TARGET, BROADCAST_TEXT, BROADCAST_CONFIRM
+) = range(34)
\ No newline at end of file
@@ -1,14 +1,82 @@
+import asyncio
+import contextvars
 import sqlite3
 import logging
-from contextlib import contextmanager
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from functools import partial
+from config import DB_NAME
+from migrations import migrate, rebuild_attendance_summary
 
 logger = logging.getLogger(__name__)
 
+# Потоки, в которых выполняются все запросы к SQLite, чтобы не блокировать event loop бота
+DB_WORKERS = 4
+_db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+
+# Сколько простаивающих соединений держать в пуле
+DB_POOL_SIZE = 8
+
+# Настройки, применяемые один раз к каждому новому соединению
+DB_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('foreign_keys', 'ON'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16000),
+    ('busy_timeout', 5000),
+    # INSERT OR REPLACE должен вызывать триггеры удаления (сводная посещаемость)
+    ('recursive_triggers', 'ON'),
+)
+
+def _connect(database=DB_NAME):
+    """Открыть новое соединение с БД и применить PRAGMA"""
+    conn = sqlite3.connect(database, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for name, value in DB_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+class ConnectionPool:
+    """Пул постоянных соединений с БД"""
+
+    def __init__(self, database, size=DB_POOL_SIZE):
+        self.database = database
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Взять соединение из пула (или открыть новое, если свободных нет)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _connect(self.database)
+
+    def release(self, conn):
+        """Вернуть соединение в пул; незавершенная транзакция откатывается"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Закрыть все простаивающие соединения"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+_pool = ConnectionPool(DB_NAME)
+
 @contextmanager
 def db_connection():
     """Контекстный менеджер для соединения с БД"""
-    conn = sqlite3.connect('university_bot.db')
-    conn.row_factory = sqlite3.Row
+    conn = _pool.acquire()
     try:
         yield conn
     except Exception as e:
@@ -16,95 +84,156 @@ def db_connection():
         logger.error(f"Database error: {e}")
         raise e
     finally:
-        conn.close()
+        _pool.release(conn)
+
+async def _in_db_thread(func, *args):
+    """Выполнить синхронную функцию в потоке БД"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(func, *args))
+
+def _execute(conn, sql, params):
+    cur = conn.execute(sql, params)
+    return cur.lastrowid
+
+def _executemany(conn, sql, seq_of_params):
+    cur = conn.executemany(sql, seq_of_params)
+    return cur.rowcount
+
+def _fetchone(conn, sql, params):
+    return conn.execute(sql, params).fetchone()
+
+def _fetchall(conn, sql, params):
+    return conn.execute(sql, params).fetchall()
+
+class AsyncConnection:
+    """Асинхронная обертка над соединением: каждый вызов выполняется в потоке БД"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def run(self, func, *args):
+        """Выполнить func(conn, *args) в потоке БД (несколько запросов за один переход)"""
+        return await _in_db_thread(func, self._conn, *args)
+
+    async def execute(self, sql, params=()):
+        """Выполнить запрос и вернуть lastrowid"""
+        return await self.run(_execute, sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        """Выполнить запрос для набора параметров и вернуть rowcount"""
+        return await self.run(_executemany, sql, list(seq_of_params))
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(_fetchone, sql, params)
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(_fetchall, sql, params)
+
+    async def commit(self):
+        await _in_db_thread(self._conn.commit)
+
+    async def rollback(self):
+        await _in_db_thread(self._conn.rollback)
+
+class _UnitOfWork:
+    """Соединение, общее для обработки одного апдейта.
+
+    Принадлежит задаче, обрабатывающей апдейт: задачи, запущенные из
+    обработчика, наследуют контекст, но работают со своими соединениями.
+    """
+
+    def __init__(self):
+        self.task = asyncio.current_task()
+        self.connection = None  # AsyncConnection, пока открыт блок или транзакция
+        self.depth = 0  # вложенность блоков async_db_connection()
+        self.closed = False
+
+_current_unit_of_work = contextvars.ContextVar('unit_of_work', default=None)
+
+def _active_unit_of_work():
+    """Unit of work текущей задачи (None в фоновых задачах и после обработки апдейта)"""
+    uow = _current_unit_of_work.get()
+    if uow is None or uow.closed or uow.task is not asyncio.current_task():
+        return None
+    return uow
+
+@asynccontextmanager
+async def unit_of_work():
+    """Все async_db_connection() внутри блока используют одно соединение.
+
+    Соединение берется из пула при первом обращении и возвращается, как
+    только закрыт внешний блок async_db_connection() без открытой
+    транзакции, - обработчик не держит его, пока ждет Telegram. Границы
+    транзакций по-прежнему задаются явными commit(); при выходе
+    незавершенная транзакция откатывается.
+    """
+    if _active_unit_of_work() is not None:
+        yield
+        return
+
+    uow = _UnitOfWork()
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield
+    finally:
+        # Задачи, запущенные из обработчика, унаследовали uow - он больше не действует
+        uow.closed = True
+        _current_unit_of_work.reset(token)
+        if uow.connection is not None:
+            await _in_db_thread(_pool.release, uow.connection._conn)
+            uow.connection = None
+
+@asynccontextmanager
+async def async_db_connection():
+    """Асинхронный контекстный менеджер для соединения с БД"""
+    uow = _active_unit_of_work()
+    if uow is None:
+        conn = await _in_db_thread(_pool.acquire)
+        try:
+            yield AsyncConnection(conn)
+        except Exception as e:
+            await _in_db_thread(conn.rollback)
+            logger.error(f"Database error: {e}")
+            raise e
+        finally:
+            await _in_db_thread(_pool.release, conn)
+        return
+
+    if uow.connection is None:
+        uow.connection = AsyncConnection(await _in_db_thread(_pool.acquire))
+    aconn = uow.connection
+    uow.depth += 1
+    try:
+        yield aconn
+    except Exception as e:
+        if uow.depth == 1:
+            await aconn.rollback()
+            logger.error(f"Database error: {e}")
+        raise e
+    finally:
+        uow.depth -= 1
+        # Соединение без открытой транзакции сразу возвращается в пул
+        if uow.depth == 0 and not aconn._conn.in_transaction:
+            uow.connection = None
+            await _in_db_thread(_pool.release, aconn._conn)
+
+async def run_db(func, *args):
+    """Выполнить func(conn, *args) с соединением из пула в потоке БД"""
+    def _run():
+        with db_connection() as conn:
+            return func(conn, *args)
+    return await _in_db_thread(_run)
 
 def init_database():
-    """Инициализация базы данных"""
+    """Инициализация базы данных: применение недостающих миграций схемы"""
     try:
         with db_connection() as conn:
-            cur = conn.cursor()
-            
-            # Таблица администраторов
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS admins (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE,
-                    role TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица групп
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS groups (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица студентов
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS students (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    full_name TEXT NOT NULL,
-                    group_id INTEGER,
-                    telegram_id INTEGER UNIQUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (group_id) REFERENCES groups (id)
-                )
-            ''')
-            
-            # Таблица предметов
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS subjects (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица связи групп и предметов
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS group_subjects (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER,
-                    subject_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (group_id) REFERENCES groups (id),
-                    FOREIGN KEY (subject_id) REFERENCES subjects (id),
-                    UNIQUE(group_id, subject_id)
-                )
-            ''')
-            
-            # Таблица занятий
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS lessons (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_subject_id INTEGER,
-                    date DATE NOT NULL,
-                    topic TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (group_subject_id) REFERENCES group_subjects (id)
-                )
-            ''')
-            
-            # Таблица посещаемости
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS attendance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    student_id INTEGER,
-                    lesson_id INTEGER,
-                    status TEXT NOT NULL CHECK(status IN ('present', 'absent', 'late')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (student_id) REFERENCES students (id),
-                    FOREIGN KEY (lesson_id) REFERENCES lessons (id),
-                    UNIQUE(student_id, lesson_id)
-                )
-            ''')
+            applied = migrate(conn)
             
-            conn.commit()
-            logger.info("База данных успешно инициализирована")
+            if applied:
+                logger.info(f"База данных обновлена до версии {applied[-1]}")
+            else:
+                logger.info("Схема базы данных актуальна")
             
     except Exception as e:
         logger.error(f"Ошибка инициализации БД: {e}")
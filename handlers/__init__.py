@@ -4,6 +4,7 @@ from .student import StudentHandlers
 from .group import GroupHandlers
 from .subject import SubjectHandlers
 from .attendance import AttendanceHandlers
+from .broadcast import BroadcastHandlers
 
 __all__ = [
     'BaseHandlers',
@@ -11,5 +12,6 @@ __all__ = [
     'StudentHandlers',
     'GroupHandlers',
     'SubjectHandlers',
-    'AttendanceHandlers'
+    'AttendanceHandlers',
+    'BroadcastHandlers'
 ]
\ No newline at end of file
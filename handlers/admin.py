@@ -1,13 +1,28 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
+import asyncio
 import logging
-from database import db_connection
-from config import MANAGE_STUDENTS, ADD_STUDENT_NAME, ADD_STUDENT_GROUP, EDIT_STUDENT_SELECT, DELETE_STUDENT
-from utils import check_admin_rights
+from io import BytesIO
+from database import async_db_connection, run_db
+from config import (
+    MANAGE_STUDENTS, ADD_STUDENT_NAME, ADD_STUDENT_GROUP, EDIT_STUDENT_SELECT, DELETE_STUDENT,
+    IMPORT_STUDENTS_FILE, IMPORT_STUDENTS_CONFIRM
+)
+from importers import read_roster, diff_roster, apply_roster_import, ImportFileError
+from utils import check_admin_rights, invalidate_user_role
 from keyboards import get_groups_keyboard, get_back_button, get_main_menu_button
+from reference_cache import get_reference_data, invalidate_reference_data
+from callback_router import CallbackRoute
+from .base import show_main_menu
 
 logger = logging.getLogger(__name__)
 
+# Кнопки диалогов добавления, редактирования и удаления студентов
+STUDENT_GROUP_ROUTE = CallbackRoute('group_{group_id:int}')
+EDIT_STUDENT_ROUTE = CallbackRoute('edit_{student_id:int}')
+DELETE_STUDENT_ROUTE = CallbackRoute('delete_{student_id:int}')
+CONFIRM_DELETE_STUDENT_ROUTE = CallbackRoute('confirm_delete_{student_id:int}')
+
 class AdminHandlers:
     """Обработчики для администраторов"""
     
@@ -24,9 +39,10 @@ class AdminHandlers:
         keyboard = [
             [InlineKeyboardButton("👥 Список студентов", callback_data='list_students')],
             [InlineKeyboardButton("➕ Добавить студента", callback_data='add_student')],
+            [InlineKeyboardButton("📥 Импорт из файла", callback_data='import_students')],
             [InlineKeyboardButton("✏️ Редактировать студента", callback_data='edit_student')],
             [InlineKeyboardButton("🗑️ Удалить студента", callback_data='delete_student')],
-            get_back_button('main')[0]
+            get_back_button('main')
         ]
         
         await query.edit_message_text(
@@ -50,6 +66,14 @@ class AdminHandlers:
             await query.edit_message_text("Введите ФИО нового студента:")
             return ADD_STUDENT_NAME
             
+        elif data == 'import_students':
+            await query.edit_message_text(
+                "📥 Импорт списка студентов\n\n"
+                "Отправьте файл .csv или .xlsx с двумя колонками: ФИО и группа.\n"
+                "Недостающие группы будут созданы. /cancel - отмена."
+            )
+            return IMPORT_STUDENTS_FILE
+            
         elif data == 'edit_student':
             await self.show_students_for_edit(query)
             return EDIT_STUDENT_SELECT
@@ -59,9 +83,7 @@ class AdminHandlers:
             return DELETE_STUDENT
             
         elif data == 'back_to_main':
-            from .base import BaseHandlers
-            base_handlers = BaseHandlers()
-            await base_handlers.back_to_main_menu(query)
+            await show_main_menu(query)
             return ConversationHandler.END
             
         return MANAGE_STUDENTS
@@ -71,7 +93,7 @@ class AdminHandlers:
         context.user_data['new_student'] = {'name': update.message.text}
         
         try:
-            keyboard = get_groups_keyboard()
+            keyboard = await get_groups_keyboard()
             keyboard.append([InlineKeyboardButton("🔙 Отмена", callback_data='cancel_add')])
             
             await update.message.reply_text(
@@ -94,21 +116,20 @@ class AdminHandlers:
             await self.start_student_management(update, context, query)
             return MANAGE_STUDENTS
         
-        if query.data.startswith('group_'):
-            group_id = int(query.data.split('_')[1])
+        fields = STUDENT_GROUP_ROUTE.match(query.data)
+        if fields is not None:
+            group_id = fields['group_id']
             student_name = context.user_data['new_student']['name']
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute(
+                async with async_db_connection() as conn:
+                    await conn.execute(
                         "INSERT INTO students (full_name, group_id) VALUES (?, ?)",
                         (student_name, group_id)
                     )
-                    conn.commit()
-                    
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
+                    await conn.commit()
+                
+                group_name = (await get_reference_data()).group_name(group_id)
                 
                 keyboard = [
                     [InlineKeyboardButton("🔙 К управлению студентами", callback_data='back_to_management')],
@@ -126,33 +147,126 @@ class AdminHandlers:
         
         return ConversationHandler.END
 
+    async def import_students_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Получение файла со списком студентов и предпросмотр изменений"""
+        document = update.message.document
+        if document is None:
+            await update.message.reply_text("❌ Отправьте файл .csv или .xlsx")
+            return IMPORT_STUDENTS_FILE
+        
+        try:
+            file = await document.get_file()
+            content = BytesIO()
+            await file.download_to_memory(content)
+            content.seek(0)
+            
+            # Файл разбирается вне потоков БД: большой XLSX не занимает соединение с БД
+            entries, skipped = await asyncio.to_thread(read_roster, content, document.file_name or '')
+            diff = await run_db(diff_roster, entries) if entries else None
+        except ImportFileError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return IMPORT_STUDENTS_FILE
+        except Exception as e:
+            logger.error(f"Ошибка при чтении файла импорта: {e}")
+            await update.message.reply_text("❌ Ошибка при чтении файла")
+            return ConversationHandler.END
+        
+        if not entries:
+            await update.message.reply_text("❌ В файле не найдено ни одной строки с ФИО и группой")
+            return IMPORT_STUDENTS_FILE
+        
+        context.user_data['import_students'] = entries
+        
+        text = (
+            f"📋 Файл {document.file_name}: {len(entries)} студентов\n\n"
+            f"• Будет добавлено: {len(diff['inserts'])}\n"
+            f"• Будет переведено в другую группу: {len(diff['moves'])}\n"
+            f"• Нет в файле: {len(diff['removals'])}\n"
+            f"• Новых групп: {len(diff['new_groups'])}\n"
+            f"• Без изменений: {diff['unchanged']}\n"
+        )
+        if skipped:
+            text += f"• Пропущено строк без ФИО или группы: {skipped}\n"
+        
+        if diff['removals']:
+            text += "\nСтуденты, которых нет в файле, удаляются вместе с историей посещаемости только по отдельной кнопке.\n"
+        
+        keyboard = [[InlineKeyboardButton("✅ Применить", callback_data='confirm_import')]]
+        if diff['removals']:
+            keyboard.append([InlineKeyboardButton(
+                f"🗑 Применить и удалить отсутствующих ({len(diff['removals'])})", callback_data='confirm_import_remove'
+            )])
+        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data='cancel_import')])
+        
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return IMPORT_STUDENTS_CONFIRM
+    
+    async def import_students_confirm(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Применение импорта списка студентов"""
+        query = update.callback_query
+        await query.answer()
+        
+        entries = context.user_data.pop('import_students', None)
+        if query.data == 'cancel_import' or not entries:
+            await self.start_student_management(update, context, query)
+            return MANAGE_STUDENTS
+        
+        try:
+            await query.edit_message_text("⏳ Импорт выполняется...")
+            summary, removed_telegram_ids = await run_db(
+                apply_roster_import, entries, query.data == 'confirm_import_remove'
+            )
+            for telegram_id in removed_telegram_ids:
+                invalidate_user_role(telegram_id)
+            if summary['groups_created']:
+                invalidate_reference_data()
+            
+            keyboard = [
+                [InlineKeyboardButton("🔙 К управлению студентами", callback_data='back_to_management')],
+                get_main_menu_button()
+            ]
+            
+            await query.edit_message_text(
+                f"✅ Импорт завершен за {summary['seconds']:.2f} с\n\n"
+                f"• Добавлено: {summary['inserted']}\n"
+                f"• Переведено: {summary['moved']}\n"
+                f"• Удалено: {summary['removed']}\n"
+                f"• Создано групп: {summary['groups_created']}\n"
+                f"• Без изменений: {summary['unchanged']}",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            
+        except Exception as e:
+            logger.error(f"Ошибка при импорте студентов: {e}")
+            await query.edit_message_text("❌ Ошибка при импорте студентов")
+        
+        return ConversationHandler.END
+
     async def show_students_for_edit(self, query):
         """Показать список студентов для редактирования"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
+            async with async_db_connection() as conn:
+                students = await conn.fetchall("""
                     SELECT s.id, s.full_name, g.name 
                     FROM students s 
                     JOIN groups g ON s.group_id = g.id 
                     ORDER BY g.name, s.full_name
                 """)
-                students = cur.fetchall()
+            
+            if students:
+                keyboard = []
+                for student in students:
+                    btn_text = f"{student['full_name']} ({student['name']})"
+                    keyboard.append([InlineKeyboardButton(btn_text, callback_data=f'edit_{student["id"]}')])
                 
-                if students:
-                    keyboard = []
-                    for student in students:
-                        btn_text = f"{student['full_name']} ({student['name']})"
-                        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f'edit_{student["id"]}')])
-                    
-                    keyboard.append(get_back_button('management'))
-                    
-                    await query.edit_message_text(
-                        "✏️ Выберите студента для редактирования:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                else:
-                    await query.edit_message_text("📝 Студенты не найдены")
+                keyboard.append(get_back_button('management'))
+                
+                await query.edit_message_text(
+                    "✏️ Выберите студента для редактирования:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            else:
+                await query.edit_message_text("📝 Студенты не найдены")
                     
         except Exception as e:
             logger.error(f"Ошибка при получении студентов: {e}")
@@ -167,8 +281,9 @@ class AdminHandlers:
             await self.start_student_management(update, context, query)
             return MANAGE_STUDENTS
         
-        if query.data.startswith('edit_'):
-            student_id = int(query.data.split('_')[1])
+        fields = EDIT_STUDENT_ROUTE.match(query.data)
+        if fields is not None:
+            student_id = fields['student_id']
             keyboard = [get_back_button('management')]
             await query.edit_message_text(
                 f"✏️ Редактирование студента ID: {student_id}\n\nФункция в разработке",
@@ -181,30 +296,28 @@ class AdminHandlers:
     async def show_students_for_delete(self, query):
         """Показать список студентов для удаления"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
+            async with async_db_connection() as conn:
+                students = await conn.fetchall("""
                     SELECT s.id, s.full_name, g.name 
                     FROM students s 
                     JOIN groups g ON s.group_id = g.id 
                     ORDER BY g.name, s.full_name
                 """)
-                students = cur.fetchall()
+            
+            if students:
+                keyboard = []
+                for student in students:
+                    btn_text = f"{student['full_name']} ({student['name']})"
+                    keyboard.append([InlineKeyboardButton(btn_text, callback_data=f'delete_{student["id"]}')])
                 
-                if students:
-                    keyboard = []
-                    for student in students:
-                        btn_text = f"{student['full_name']} ({student['name']})"
-                        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f'delete_{student["id"]}')])
-                    
-                    keyboard.append(get_back_button('management'))
-                    
-                    await query.edit_message_text(
-                        "🗑️ Выберите студента для удаления:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                else:
-                    await query.edit_message_text("📝 Студенты не найдены")
+                keyboard.append(get_back_button('management'))
+                
+                await query.edit_message_text(
+                    "🗑️ Выберите студента для удаления:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            else:
+                await query.edit_message_text("📝 Студенты не найдены")
                     
         except Exception as e:
             logger.error(f"Ошибка при получении студентов: {e}")
@@ -219,40 +332,45 @@ class AdminHandlers:
             await self.start_student_management(update, context, query)
             return MANAGE_STUDENTS
         
-        if query.data.startswith('delete_'):
-            student_id = int(query.data.split('_')[1])
+        select = DELETE_STUDENT_ROUTE.match(query.data)
+        confirm = CONFIRM_DELETE_STUDENT_ROUTE.match(query.data)
+        
+        if select is not None:
+            student_id = select['student_id']
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT full_name FROM students WHERE id = ?", (student_id,))
-                    student_name = cur.fetchone()['name']
-                    
-                    keyboard = [
-                        [InlineKeyboardButton("✅ Да, удалить", callback_data=f'confirm_delete_{student_id}')],
-                        [InlineKeyboardButton("❌ Нет, отмена", callback_data='cancel_delete')]
-                    ]
-                    
-                    await query.edit_message_text(
-                        f"⚠️ Вы уверены, что хотите удалить студента {student_name}?",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                    return DELETE_STUDENT
+                async with async_db_connection() as conn:
+                    student_name = (await conn.fetchone("SELECT full_name FROM students WHERE id = ?", (student_id,)))['full_name']
+                
+                keyboard = [
+                    [InlineKeyboardButton("✅ Да, удалить", callback_data=f'confirm_delete_{student_id}')],
+                    [InlineKeyboardButton("❌ Нет, отмена", callback_data='cancel_delete')]
+                ]
+                
+                await query.edit_message_text(
+                    f"⚠️ Вы уверены, что хотите удалить студента {student_name}?",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                return DELETE_STUDENT
                     
             except Exception as e:
                 logger.error(f"Ошибка при получении данных студента: {e}")
                 await query.edit_message_text("❌ Ошибка при загрузке данных")
         
-        elif query.data.startswith('confirm_delete_'):
-            student_id = int(query.data.split('_')[2])
+        elif confirm is not None:
+            student_id = confirm['student_id']
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT full_name FROM students WHERE id = ?", (student_id,))
-                    student_name = cur.fetchone()['name']
-                    cur.execute("DELETE FROM students WHERE id = ?", (student_id,))
-                    conn.commit()
+                async with async_db_connection() as conn:
+                    student = await conn.fetchone("SELECT full_name, telegram_id FROM students WHERE id = ?", (student_id,))
+                    student_name = student['full_name']
+                    # Сначала удаляем зависимые записи (foreign_keys = ON)
+                    await conn.execute("DELETE FROM attendance WHERE student_id = ?", (student_id,))
+                    await conn.execute("DELETE FROM students WHERE id = ?", (student_id,))
+                    await conn.commit()
+                
+                if student['telegram_id']:
+                    invalidate_user_role(student['telegram_id'])
                 
                 keyboard = [
                     [InlineKeyboardButton("🔙 К управлению студентами", callback_data='back_to_management')],
@@ -277,37 +395,35 @@ class AdminHandlers:
     async def list_students(self, query):
         """Показать список всех студентов"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
+            async with async_db_connection() as conn:
+                students = await conn.fetchall("""
                     SELECT s.id, s.full_name, g.name, s.telegram_id 
                     FROM students s 
                     JOIN groups g ON s.group_id = g.id 
                     ORDER BY g.name, s.full_name
                 """)
-                students = cur.fetchall()
+            
+            if students:
+                text = "👥 Список всех студентов:\n\n"
+                current_group = None
                 
-                if students:
-                    text = "👥 Список всех студентов:\n\n"
-                    current_group = None
-                    
-                    for student in students:
-                        if student['name'] != current_group:
-                            text += f"\n📚 Группа: {student['name']}\n"
-                            current_group = student['name']
-                        
-                        status = "✅ В боте" if student['telegram_id'] else "❌ Не в боте"
-                        text += f"• {student['full_name']} ({status})\n"
+                for student in students:
+                    if student['name'] != current_group:
+                        text += f"\n📚 Группа: {student['name']}\n"
+                        current_group = student['name']
                     
-                    text += f"\nВсего студентов: {len(students)}"
-                else:
-                    text = "📝 Студенты не найдены"
+                    status = "✅ В боте" if student['telegram_id'] else "❌ Не в боте"
+                    text += f"• {student['full_name']} ({status})\n"
                 
-                keyboard = [
-                    get_back_button('management')[0],
-                    get_main_menu_button()
-                ]
-                await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+                text += f"\nВсего студентов: {len(students)}"
+            else:
+                text = "📝 Студенты не найдены"
+            
+            keyboard = [
+                get_back_button('management'),
+                get_main_menu_button()
+            ]
+            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
                 
         except Exception as e:
             logger.error(f"Ошибка при получении списка студентов: {e}")
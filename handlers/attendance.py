@@ -1,17 +1,49 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
+from telegram.ext import ContextTypes, ConversationHandler
 import logging
 from datetime import datetime, timedelta
-from database import db_connection
+from database import async_db_connection, run_db
 from config import SELECT_GROUP_ATTENDANCE, SELECT_SUBJECT_ATTENDANCE, SELECT_DATE_ATTENDANCE, MARK_STUDENTS_ATTENDANCE, SELECT_REPORT_GROUP, SELECT_REPORT_DATE_RANGE, GENERATE_REPORT
-from utils import check_admin_rights, get_user_role
-from keyboards import get_back_button, get_main_menu_button, get_groups_keyboard
+from utils import check_admin_rights
+from keyboards import get_back_button, get_main_menu_button, get_report_format_keyboard
+from attendance_session import MarkingSession, flush_marking_session
+from reference_cache import get_reference_data
+from message_editor import message_editor
+from reports import report_service, ReportQueueFull, available_report_formats, REPORT_FILE_SUFFIXES
+from callback_router import CallbackRoute
 import pandas as pd
 from io import BytesIO
-import numpy as np
+from .base import show_main_menu
 
 logger = logging.getLogger(__name__)
 
+# Кнопки диалогов отметки посещаемости и отчетов
+ATTENDANCE_GROUP_ROUTE = CallbackRoute('attendance_group_{group_id:int}')
+ATTENDANCE_SUBJECT_ROUTE = CallbackRoute('attendance_subject_{subject_id:int}')
+ATTENDANCE_DATE_ROUTE = CallbackRoute('attendance_date_{date}')
+ATTENDANCE_PAGE_ROUTE = CallbackRoute('attendance_page_{page:int}')
+STUDENT_TOGGLE_ROUTE = CallbackRoute('student_{student_id:int}')
+STUDENT_MARK_ROUTE = CallbackRoute('mark_{action}_{student_id:int}')
+REPORT_GROUP_ROUTE = CallbackRoute('report_group_{group_id}')
+REPORT_PERIOD_ROUTE = CallbackRoute('report_period_{period_type}_{group_id}')
+
+def _load_quick_summary(conn):
+    """Сводка посещаемости по всем группам из сводных таблиц (выполняется в потоке БД)"""
+    return pd.read_sql("""
+        SELECT 
+            g.name as group_name,
+            (SELECT COALESCE(SUM(gss.lesson_count), 0)
+             FROM group_subjects gs
+             JOIN group_subject_stats gss ON gss.group_subject_id = gs.id
+             WHERE gs.group_id = g.id) as total_lessons,
+            (SELECT COUNT(*) FROM students s WHERE s.group_id = g.id) as total_students,
+            (SELECT ROUND(SUM(v.present + v.late * 0.5) * 100.0 / NULLIF(SUM(v.present + v.absent + v.late), 0), 1)
+             FROM student_attendance_summary v
+             WHERE v.group_id = g.id) as attendance_percent
+        FROM groups g
+        ORDER BY g.name
+    """, conn)
+
 class AttendanceHandlers:
     """Обработчики для посещаемости"""
     
@@ -26,19 +58,12 @@ class AttendanceHandlers:
         
         # Получаем список групп
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
-                
-                if not groups:
-                    await query.edit_message_text("❌ В системе нет групп")
-                    return ConversationHandler.END
-            
-            keyboard = []
-            for group in groups:
-                keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'attendance_group_{group["id"]}')])
+            reference = await get_reference_data()
+            if not reference.groups:
+                await query.edit_message_text("❌ В системе нет групп")
+                return ConversationHandler.END
             
+            keyboard = reference.groups_keyboard('attendance_group')
             keyboard.append(get_back_button('main'))
             
             await query.edit_message_text(
@@ -58,54 +83,35 @@ class AttendanceHandlers:
         await query.answer()
         
         if query.data == 'back_to_main':
-            from .base import BaseHandlers
-            base_handlers = BaseHandlers()
-            await base_handlers.back_to_main_menu(query)
+            await show_main_menu(query)
             return ConversationHandler.END
         
-        if query.data.startswith('attendance_group_'):
-            group_id = int(query.data.split('_')[2])
+        fields = ATTENDANCE_GROUP_ROUTE.match(query.data)
+        if fields is not None:
+            group_id = fields['group_id']
             context.user_data['attendance_group_id'] = group_id
             
             # Получаем предметы для выбранной группы
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Получаем название группы
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
-                    # Получаем предметы этой группы
-                    cur.execute("""
-                        SELECT s.id, s.name 
-                        FROM subjects s
-                        JOIN group_subjects gs ON s.id = gs.subject_id
-                        WHERE gs.group_id = ?
-                        ORDER BY s.name
-                    """, (group_id,))
-                    
-                    subjects = cur.fetchall()
-                    
-                    if not subjects:
-                        keyboard = [get_back_button('main')]
-                        await query.edit_message_text(
-                            f"❌ В группе {group_name} нет предметов\n\nДобавьте предметы через меню управления предметами",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
-                        return ConversationHandler.END
-                    
-                    keyboard = []
-                    for subject in subjects:
-                        keyboard.append([InlineKeyboardButton(subject['name'], callback_data=f'attendance_subject_{subject["id"]}')])
-                    
-                    keyboard.append(get_back_button('main'))
-                    
+                reference = await get_reference_data()
+                group_name = reference.group_name(group_id)
+                
+                if not reference.subjects_of(group_id):
+                    keyboard = [get_back_button('main')]
                     await query.edit_message_text(
-                        f"📚 Выберите предмет для группы {group_name}:",
+                        f"❌ В группе {group_name} нет предметов\n\nДобавьте предметы через меню управления предметами",
                         reply_markup=InlineKeyboardMarkup(keyboard)
                     )
-                    return SELECT_SUBJECT_ATTENDANCE
+                    return ConversationHandler.END
+                
+                keyboard = reference.subjects_keyboard(group_id, 'attendance_subject')
+                keyboard.append(get_back_button('main'))
+                
+                await query.edit_message_text(
+                    f"📚 Выберите предмет для группы {group_name}:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                return SELECT_SUBJECT_ATTENDANCE
                         
             except Exception as e:
                 logger.error(f"Ошибка при получении предметов: {e}")
@@ -118,41 +124,31 @@ class AttendanceHandlers:
         query = update.callback_query
         await query.answer()
         
-        if query.data.startswith('attendance_subject_'):
-            subject_id = int(query.data.split('_')[2])
+        fields = ATTENDANCE_SUBJECT_ROUTE.match(query.data)
+        if fields is not None:
+            subject_id = fields['subject_id']
             group_id = context.user_data['attendance_group_id']
             
             # Получаем group_subject_id
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    cur.execute("""
-                        SELECT id FROM group_subjects 
-                        WHERE group_id = ? AND subject_id = ?
-                    """, (group_id, subject_id))
-                    
-                    group_subject = cur.fetchone()
-                    if not group_subject:
-                        await query.edit_message_text("❌ Ошибка: связь предмета с группой не найдена")
-                        return ConversationHandler.END
-                    
-                    group_subject_id = group_subject['id']
-                    context.user_data['attendance_group_subject_id'] = group_subject_id
-                    
-                    # Получаем названия для сообщения
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
-                    cur.execute("SELECT name FROM subjects WHERE id = ?", (subject_id,))
-                    subject_name = cur.fetchone()['name']
+                reference = await get_reference_data()
+                group_subject_id = reference.group_subject_id(group_id, subject_id)
+                if group_subject_id is None:
+                    await query.edit_message_text("❌ Ошибка: связь предмета с группой не найдена")
+                    return ConversationHandler.END
+                
+                context.user_data['attendance_group_subject_id'] = group_subject_id
+                
+                # Получаем названия для сообщения
+                group_name = reference.group_name(group_id)
+                subject_name = reference.subject_name(subject_id)
                 
                 # Предлагаем выбрать дату
                 today = datetime.now().strftime('%Y-%m-%d')
                 keyboard = [
                     [InlineKeyboardButton("📅 Сегодня", callback_data=f'attendance_date_{today}')],
                     [InlineKeyboardButton("📅 Ввести дату вручную", callback_data='enter_date_manually')],
-                    get_back_button('main')[0]
+                    get_back_button('main')
                 ]
                 
                 await query.edit_message_text(
@@ -172,8 +168,9 @@ class AttendanceHandlers:
         query = update.callback_query
         await query.answer()
         
-        if query.data.startswith('attendance_date_'):
-            date_str = query.data.split('_')[2]
+        fields = ATTENDANCE_DATE_ROUTE.match(query.data)
+        if fields is not None:
+            date_str = fields['date']
             context.user_data['attendance_date'] = date_str
             await self.show_students_for_attendance(query, context)
             return MARK_STUDENTS_ATTENDANCE
@@ -203,222 +200,191 @@ class AttendanceHandlers:
         date_str = context.user_data['attendance_date']
         
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                
-                # Получаем студентов группы
-                cur.execute("""
-                    SELECT s.id, s.full_name 
-                    FROM students s 
-                    WHERE s.group_id = ? 
-                    ORDER BY s.full_name
-                """, (group_id,))
-                students = cur.fetchall()
-                
-                # Создаем или получаем lesson_id
-                cur.execute("""
-                    SELECT id FROM lessons 
-                    WHERE group_subject_id = ? AND date = ?
-                """, (group_subject_id, date_str))
-                
-                lesson = cur.fetchone()
-                if lesson:
-                    lesson_id = lesson['id']
-                else:
-                    cur.execute("""
-                        INSERT INTO lessons (group_subject_id, date) 
-                        VALUES (?, ?)
-                    """, (group_subject_id, date_str))
-                    lesson_id = cur.lastrowid
-                    conn.commit()
-                
-                context.user_data['attendance_lesson_id'] = lesson_id
-                
-                # Получаем текущую посещаемость
-                attendance_status = {}
-                cur.execute("""
-                    SELECT student_id, status FROM attendance 
-                    WHERE lesson_id = ?
-                """, (lesson_id,))
-                
-                for row in cur.fetchall():
-                    attendance_status[row['student_id']] = row['status']
-                
-                # Получаем названия для заголовка
-                cur.execute("""
-                    SELECT g.name, s.name 
-                    FROM group_subjects gs
-                    JOIN groups g ON gs.group_id = g.id
-                    JOIN subjects s ON gs.subject_id = s.id
-                    WHERE gs.id = ?
-                """, (group_subject_id,))
-                
-                group_name, subject_name = cur.fetchone()
-                
-                # Создаем клавиатуру для отметки - ИСПРАВЛЕНО!
-                keyboard = []
-                for student in students:
-                    current_status = attendance_status.get(student['id'], 'not_set')
-                    status_icon = '✅' if current_status == 'present' else '❌' if current_status == 'absent' else '⏰' if current_status == 'late' else '⚪'
-                    
-                    # Каждый студент в отдельном ряду с кнопками
-                    student_row = [
-                        InlineKeyboardButton(f"{status_icon} {student['full_name']}", callback_data=f'student_{student["id"]}')
-                    ]
-                    
-                    # Кнопки статусов в отдельных рядах под именем студента
-                    status_row = [
-                        InlineKeyboardButton("✅ Присутствовал", callback_data=f'mark_present_{student["id"]}'),
-                        InlineKeyboardButton("❌ Отсутствовал", callback_data=f'mark_absent_{student["id"]}'),
-                        InlineKeyboardButton("⏰ Опоздал", callback_data=f'mark_late_{student["id"]}')
-                    ]
-                    
-                    keyboard.append(student_row)
-                    keyboard.append(status_row)
-                
-                # Кнопки сохранения и возврата
-                keyboard.append([InlineKeyboardButton("💾 Сохранить посещаемость", callback_data='save_attendance')])
-                keyboard.append(get_back_button('main')[0])
-                
-                message_text = f"📊 Отметка посещаемости\n\nГруппа: {group_name}\nПредмет: {subject_name}\nДата: {date_str}\n\nВыберите статус для каждого студента:"
+            # Снимок занятия загружается один раз за сессию, дальше экран строится из памяти
+            session = context.user_data.get('attendance_session')
+            if session is None or not session.matches(group_subject_id, date_str):
+                await flush_marking_session(context.user_data)
+                session = await MarkingSession.load(group_id, group_subject_id, date_str)
+                context.user_data['attendance_session'] = session
+                context.user_data['attendance_lesson_id'] = session.lesson_id
+            
+            message_text, reply_markup = session.render()
+            
+            if query:
+                # Частые нажатия сливаются в одну правку, обработчик не ждет Telegram
+                message_editor.edit(query.message, message_text, reply_markup)
+            else:
+                await update.message.reply_text(message_text, reply_markup=reply_markup)
                 
-                if query:
-                    await query.edit_message_text(message_text, reply_markup=InlineKeyboardMarkup(keyboard))
-                else:
-                    await update.message.reply_text(message_text, reply_markup=InlineKeyboardMarkup(keyboard))
-                    
         except Exception as e:
             logger.error(f"Ошибка при получении студентов: {e}")
             if query:
-                await query.edit_message_text("❌ Ошибка при загрузке данных")
+                await message_editor.edit_now(query.message, "❌ Ошибка при загрузке данных")
             else:
                 await update.message.reply_text("❌ Ошибка при загрузке данных")
     
     async def mark_student_attendance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отметка посещаемости студента"""
         query = update.callback_query
-        await query.answer()
+        # На callback отвечаем один раз, когда известен результат (ошибка - всплывающим окном)
+        toggle = STUDENT_TOGGLE_ROUTE.match(query.data)
+        mark = STUDENT_MARK_ROUTE.match(query.data)
+        page = ATTENDANCE_PAGE_ROUTE.match(query.data)
         
-        if query.data.startswith('mark_'):
-            action, student_id = query.data.split('_')[1], int(query.data.split('_')[2])
-            lesson_id = context.user_data['attendance_lesson_id']
-            
+        if query.data == 'mark_all_present':
+            # Все неотмеченные - присутствовали, дальше отмечаются только исключения
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Обновляем или добавляем запись посещаемости
-                    cur.execute("""
-                        INSERT OR REPLACE INTO attendance (student_id, lesson_id, status)
-                        VALUES (?, ?, ?)
-                    """, (student_id, lesson_id, action))
-                    
-                    conn.commit()
-                
-                # Обновляем список студентов
-                await self.show_students_for_attendance(query, context)
-                
+                await context.user_data['attendance_session'].mark_rest_present()
             except Exception as e:
-                logger.error(f"Ошибка при отметке посещаемости: {e}")
-                await query.answer("❌ Ошибка при сохранении")
+                logger.error(f"Ошибка при массовой отметке посещаемости: {e}")
+                await query.answer("❌ Ошибка при сохранении", show_alert=True)
+                return MARK_STUDENTS_ATTENDANCE
+            
+            await query.answer()
+            await self.show_students_for_attendance(query, context)
+        
+        elif toggle is not None:
+            # Нажатие на имя студента переключает его статус
+            context.user_data['attendance_session'].toggle(toggle['student_id'])
+            await query.answer()
+            await self.show_students_for_attendance(query, context)
+        
+        elif mark is not None:
+            # Отметка копится в сессии и попадет в БД при сохранении
+            context.user_data['attendance_session'].mark(mark['student_id'], mark['action'])
+            await query.answer()
+            
+            # Обновляем список студентов
+            await self.show_students_for_attendance(query, context)
+        
+        elif page is not None:
+            # Листаем страницы: отрисовывается только текущая страница
+            await query.answer()
+            if context.user_data['attendance_session'].set_page(page['page']):
+                await self.show_students_for_attendance(query, context)
         
         elif query.data == 'save_attendance':
-            # Сохраняем и выходим
+            # Сохраняем все накопленные отметки одной транзакцией и выходим
             group_id = context.user_data['attendance_group_id']
             
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                group_name = cur.fetchone()['name']
+            try:
+                await flush_marking_session(context.user_data)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении посещаемости: {e}")
+                await query.answer("❌ Ошибка при сохранении, попробуйте еще раз", show_alert=True)
+                return MARK_STUDENTS_ATTENDANCE
+            
+            await query.answer()
+            group_name = (await get_reference_data()).group_name(group_id)
             
             keyboard = [
                 [InlineKeyboardButton("🔙 К управлению", callback_data='back_to_management')],
                 get_main_menu_button()
             ]
             
-            await query.edit_message_text(
+            # Отложенная правка экрана отметки не должна затереть это сообщение
+            await message_editor.edit_now(
+                query.message,
                 f"✅ Посещаемость для группы {group_name} сохранена!",
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
             return ConversationHandler.END
         
+        elif query.data == 'back_to_main':
+            # Выход из отметки без явного сохранения тоже сохраняет изменения
+            await flush_marking_session(context.user_data)
+            await query.answer()
+            await message_editor.drop(query.message)
+            await show_main_menu(query)
+            return ConversationHandler.END
+        
+        else:
+            await query.answer()
+        
         return MARK_STUDENTS_ATTENDANCE
     
+    async def attendance_timeout(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Таймаут сессии отметки: сохраняем накопленные изменения"""
+        try:
+            saved = await flush_marking_session(context.user_data)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении посещаемости по таймауту: {e}")
+            return
+        
+        if saved and update.callback_query:
+            await message_editor.edit_now(
+                update.callback_query.message,
+                f"⌛ Время отметки истекло. Сохранено отметок: {saved}",
+                reply_markup=InlineKeyboardMarkup([get_main_menu_button()])
+            )
+    
     async def show_my_attendance(self, query):
         """Показать посещаемость студента"""
         user_id = query.from_user.id
         
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                
+            async with async_db_connection() as conn:
                 # Получаем информацию о студенте
-                cur.execute("""
+                student = await conn.fetchone("""
                     SELECT s.id, s.full_name, g.name, s.group_id
                     FROM students s 
                     JOIN groups g ON s.group_id = g.id 
                     WHERE s.telegram_id = ?
                 """, (user_id,))
                 
-                student = cur.fetchone()
-                if not student:
-                    await query.edit_message_text("❌ Вы не зарегистрированы как студент")
-                    return
-                
-                # Получаем статистику посещаемости
-                cur.execute("""
-                    SELECT 
-                        COUNT(*) as total_lessons,
-                        SUM(CASE WHEN a.status = 'present' THEN 1 ELSE 0 END) as present,
-                        SUM(CASE WHEN a.status = 'absent' THEN 1 ELSE 0 END) as absent,
-                        SUM(CASE WHEN a.status = 'late' THEN 1 ELSE 0 END) as late
-                    FROM lessons l
-                    JOIN group_subjects gs ON l.group_subject_id = gs.id
-                    LEFT JOIN attendance a ON l.id = a.lesson_id AND a.student_id = ?
-                    WHERE gs.group_id = ?
-                """, (student['id'], student['group_id']))
-                
-                stats = cur.fetchone()
-                total, present, absent, late = stats if stats else (0, 0, 0, 0)
-                
-                # Получаем последние занятия
-                cur.execute("""
-                    SELECT s.name, l.date, a.status
-                    FROM lessons l
-                    JOIN group_subjects gs ON l.group_subject_id = gs.id
-                    JOIN subjects s ON gs.subject_id = s.id
-                    LEFT JOIN attendance a ON l.id = a.lesson_id AND a.student_id = ?
-                    WHERE gs.group_id = ?
-                    ORDER BY l.date DESC
-                    LIMIT 10
-                """, (student['id'], student['group_id']))
-                
-                recent_lessons = cur.fetchall()
-                
-                # Формируем сообщение
-                text = f"📊 Ваша посещаемость\n\n👤 {student['full_name']}\n📚 Группа: {student['name']}\n\n"
-                text += f"📈 Статистика:\n"
-                text += f"• Всего занятий: {total}\n"
-                if total > 0:
-                    attendance_percent = (present / total) * 100
-                    text += f"• Присутствовал: {present} ({attendance_percent:.1f}%)\n"
-                else:
-                    text += f"• Присутствовал: 0\n"
-                text += f"• Отсутствовал: {absent}\n"
-                text += f"• Опоздал: {late}\n\n"
-                
-                text += "📅 Последние занятия:\n"
-                for lesson in recent_lessons:
-                    status_icon = '✅' if lesson['status'] == 'present' else '❌' if lesson['status'] == 'absent' else '⏰' if lesson['status'] == 'late' else '❓'
-                    text += f"• {lesson['date']} - {lesson['name']} {status_icon}\n"
-                
-                keyboard = [
-                    [InlineKeyboardButton("🔄 Обновить", callback_data='my_attendance')],
-                    get_main_menu_button()
-                ]
-                
-                await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+                if student:
+                    # Статистика из сводной таблицы, которую поддерживают триггеры
+                    stats = await conn.fetchone("""
+                        SELECT 
+                            COALESCE(SUM(lesson_count), 0) as total_lessons,
+                            COALESCE(SUM(present), 0) as present,
+                            COALESCE(SUM(absent), 0) as absent,
+                            COALESCE(SUM(late), 0) as late
+                        FROM student_attendance_summary
+                        WHERE student_id = ?
+                    """, (student['id'],))
+                    total, present, absent, late = stats if stats else (0, 0, 0, 0)
+                
+                    # Получаем последние занятия
+                    recent_lessons = await conn.fetchall("""
+                        SELECT s.name, l.date, a.status
+                        FROM lessons l
+                        JOIN group_subjects gs ON l.group_subject_id = gs.id
+                        JOIN subjects s ON gs.subject_id = s.id
+                        LEFT JOIN attendance a ON l.id = a.lesson_id AND a.student_id = ?
+                        WHERE gs.group_id = ?
+                        ORDER BY l.date DESC
+                        LIMIT 10
+                    """, (student['id'], student['group_id']))
                 
+            if not student:
+                await query.edit_message_text("❌ Вы не зарегистрированы как студент")
+                return
+            
+            # Формируем сообщение
+            text = f"📊 Ваша посещаемость\n\n👤 {student['full_name']}\n📚 Группа: {student['name']}\n\n"
+            text += f"📈 Статистика:\n"
+            text += f"• Всего занятий: {total}\n"
+            if total > 0:
+                attendance_percent = (present / total) * 100
+                text += f"• Присутствовал: {present} ({attendance_percent:.1f}%)\n"
+            else:
+                text += f"• Присутствовал: 0\n"
+            text += f"• Отсутствовал: {absent}\n"
+            text += f"• Опоздал: {late}\n\n"
+            
+            text += "📅 Последние занятия:\n"
+            for lesson in recent_lessons:
+                status_icon = '✅' if lesson['status'] == 'present' else '❌' if lesson['status'] == 'absent' else '⏰' if lesson['status'] == 'late' else '❓'
+                text += f"• {lesson['date']} - {lesson['name']} {status_icon}\n"
+            
+            keyboard = [
+                [InlineKeyboardButton("🔄 Обновить", callback_data='my_attendance')],
+                get_main_menu_button()
+            ]
+            
+            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+            
         except Exception as e:
             logger.error(f"Ошибка при получении посещаемости: {e}")
             await query.edit_message_text("❌ Ошибка при загрузке данных посещаемости")
@@ -434,19 +400,13 @@ class AttendanceHandlers:
             
             # Получаем список групп
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT id, name FROM groups ORDER BY name")
-                    groups = cur.fetchall()
-                    
-                    if not groups:
-                        await query.edit_message_text("❌ В системе нет групп")
-                        return ConversationHandler.END
-                
-                keyboard = []
-                for group in groups:
-                    keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'report_group_{group["id"]}')])
+                reference = await get_reference_data()
+                if not reference.groups:
+                    await query.edit_message_text("❌ В системе нет групп")
+                    return ConversationHandler.END
                 
+                keyboard = reference.groups_keyboard('report_group')
+                keyboard.append([InlineKeyboardButton("🏫 Все группы (ZIP)", callback_data='report_group_all')])
                 keyboard.append(get_back_button('main'))
                 
                 await query.edit_message_text(
@@ -466,13 +426,13 @@ class AttendanceHandlers:
         await query.answer()
         
         if query.data == 'back_to_main':
-            from .base import BaseHandlers
-            base_handlers = BaseHandlers()
-            await base_handlers.back_to_main_menu(query)
+            await show_main_menu(query)
             return ConversationHandler.END
         
-        if query.data.startswith('report_group_'):
-            group_id = int(query.data.split('_')[2])
+        fields = REPORT_GROUP_ROUTE.match(query.data)
+        if fields is not None:
+            group_id = fields['group_id']
+            group_id = group_id if group_id == 'all' else int(group_id)
             context.user_data['report_group_id'] = group_id
             
             # Предлагаем выбрать период
@@ -485,7 +445,7 @@ class AttendanceHandlers:
                 [InlineKeyboardButton("📅 За последний месяц", callback_data=f'report_period_month_{group_id}')],
                 [InlineKeyboardButton("📅 За все время", callback_data=f'report_period_all_{group_id}')],
                 [InlineKeyboardButton("📅 Выбрать даты", callback_data=f'report_period_custom_{group_id}')],
-                get_back_button('main')[0]
+                get_back_button('main')
             ]
             
             await query.edit_message_text(
@@ -501,10 +461,14 @@ class AttendanceHandlers:
         query = update.callback_query
         await query.answer()
         
-        if query.data.startswith('report_period_'):
-            parts = query.data.split('_')
-            period_type = parts[2]
-            group_id = int(parts[3])
+        if query.data == 'back_to_main':
+            await show_main_menu(query)
+            return ConversationHandler.END
+        
+        fields = REPORT_PERIOD_ROUTE.match(query.data)
+        if fields is not None:
+            period_type = fields['period_type']
+            group_id = fields['group_id'] if fields['group_id'] == 'all' else int(fields['group_id'])
             
             today = datetime.now()
             start_date = None
@@ -523,8 +487,8 @@ class AttendanceHandlers:
             context.user_data['report_start_date'] = start_date
             context.user_data['report_end_date'] = end_date
             
-            # Генерируем отчет
-            await self.generate_excel_report(query, context, group_id, start_date, end_date)
+            # Предлагаем формат отчета
+            await self.offer_report(query, context, group_id, start_date, end_date)
             return ConversationHandler.END
         
         return ConversationHandler.END
@@ -551,171 +515,153 @@ class AttendanceHandlers:
             start_date = context.user_data['report_start_date']
             group_id = context.user_data['report_group_id']
             
-            await self.generate_excel_report(None, context, group_id, start_date, end_date, update)
+            await self.offer_report(None, context, group_id, start_date, end_date, update)
             return ConversationHandler.END
             
         except ValueError:
             await update.message.reply_text("❌ Неверный формат даты. Используйте ГГГГ-ММ-ДД:")
             return GENERATE_REPORT
 
-    async def generate_excel_report(self, query, context, group_id, start_date, end_date, update=None):
-        """Генерация Excel отчета"""
+    async def offer_report(self, query, context, group_id, start_date, end_date, update=None):
+        """Выбор формата отчета по группе (архив всех групп строится сразу)"""
+        # Форматируем даты для SQL запроса
+        start_date_str = start_date.strftime('%Y-%m-%d') if start_date else '2000-01-01'
+        end_date_str = end_date.strftime('%Y-%m-%d') if end_date else '2100-01-01'
+        
+        if group_id == 'all':
+            text = "⏳ Отчеты готовятся, это может занять некоторое время..."
+            reply_markup = None
+        else:
+            text = f"📄 Выберите формат отчета\nПериод: {start_date_str} - {end_date_str}"
+            reply_markup = get_report_format_keyboard(
+                group_id, start_date_str, end_date_str, available_report_formats()
+            )
+        
         try:
-            with db_connection() as conn:
-                # Получаем название группы
-                cur = conn.cursor()
-                cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                group_name = cur.fetchone()['name']
-                
-                # Форматируем даты для SQL запроса
-                start_date_str = start_date.strftime('%Y-%m-%d') if start_date else '2000-01-01'
-                end_date_str = end_date.strftime('%Y-%m-%d') if end_date else '2100-01-01'
-                
-                # Основные данные посещаемости
-                attendance_df = pd.read_sql(f"""
-                    SELECT 
-                        g.name as group_name,
-                        s.full_name as student_name,
-                        sub.name as subject_name,
-                        l.date as lesson_date,
-                        CASE 
-                            WHEN a.status = 'present' THEN 'Присутствовал'
-                            WHEN a.status = 'absent' THEN 'Отсутствовал'
-                            WHEN a.status = 'late' THEN 'Опоздал'
-                            ELSE 'Не отмечен'
-                        END as attendance_status,
-                        CASE 
-                            WHEN a.status = 'present' THEN 1
-                            WHEN a.status = 'absent' THEN 0
-                            WHEN a.status = 'late' THEN 0.5
-                            ELSE NULL
-                        END as attendance_score
-                    FROM lessons l
-                    JOIN group_subjects gs ON l.group_subject_id = gs.id
-                    JOIN groups g ON gs.group_id = g.id
-                    JOIN subjects sub ON gs.subject_id = sub.id
-                    JOIN students s ON s.group_id = g.id
-                    LEFT JOIN attendance a ON l.id = a.lesson_id AND a.student_id = s.id
-                    WHERE g.id = ? 
-                    AND l.date BETWEEN ? AND ?
-                    ORDER BY s.full_name, l.date
-                """, conn, params=(group_id, start_date_str, end_date_str))
-                
-                if attendance_df.empty:
-                    if query:
-                        await query.edit_message_text("📊 Нет данных за выбранный период")
-                    else:
-                        await update.message.reply_text("📊 Нет данных за выбранный период")
-                    return
-                
-                # Создаем Excel файл в памяти
-                output = BytesIO()
-                
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    # Лист с детальной посещаемостью
-                    attendance_df.to_excel(writer, sheet_name='Детальная посещаемость', index=False)
-                    
-                    # Лист со статистикой по студентам
-                    student_stats = attendance_df.groupby(['student_name', 'attendance_status']).size().unstack(fill_value=0)
-                    student_stats['Всего занятий'] = student_stats.sum(axis=1)
-                    student_stats['Процент посещаемости'] = (
-                        (student_stats.get('Присутствовал', 0) + student_stats.get('Опоздал', 0) * 0.5) / 
-                        student_stats['Всего занятий'] * 100
-                    ).round(1)
-                    student_stats.to_excel(writer, sheet_name='Статистика по студентам')
-                    
-                    # Лист со статистикой по предметам
-                    subject_stats = attendance_df.groupby(['subject_name', 'attendance_status']).size().unstack(fill_value=0)
-                    subject_stats['Всего занятий'] = subject_stats.sum(axis=1)
-                    subject_stats.to_excel(writer, sheet_name='Статистика по предметам')
-                    
-                    # Лист с общей сводкой
-                    summary_data = {
-                        'Параметр': ['Группа', 'Период отчета', 'Всего занятий', 'Всего студентов', 'Средняя посещаемость'],
-                        'Значение': [
-                            group_name,
-                            f'{start_date_str} - {end_date_str}',
-                            len(attendance_df['lesson_date'].unique()),
-                            attendance_df['student_name'].nunique(),
-                            f"{student_stats['Процент посещаемости'].mean():.1f}%"
-                        ]
-                    }
-                    summary_df = pd.DataFrame(summary_data)
-                    summary_df.to_excel(writer, sheet_name='Общая сводка', index=False)
-                
-                output.seek(0)
-                
-                # Формируем название файла
-                filename = f"отчет_{group_name}_{start_date_str}_{end_date_str}.xlsx"
-                
-                if query:
-                    await query.message.reply_document(
-                        document=output,
-                        filename=filename,
-                        caption=f'📊 Отчет по посещаемости\nГруппа: {group_name}\nПериод: {start_date_str} - {end_date_str}'
-                    )
-                else:
-                    await update.message.reply_document(
-                        document=output,
-                        filename=filename,
-                        caption=f'📊 Отчет по посещаемости\nГруппа: {group_name}\nПериод: {start_date_str} - {end_date_str}'
-                    )
-                
-        except Exception as e:
-            logger.error(f"Ошибка генерации отчета: {e}")
-            error_msg = "❌ Ошибка при генерации отчета"
             if query:
-                await query.edit_message_text(error_msg)
+                message = await query.edit_message_text(text, reply_markup=reply_markup)
             else:
-                await update.message.reply_text(error_msg)
+                message = await update.message.reply_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.error(f"Ошибка генерации отчета: {e}")
+            return
+        
+        if group_id == 'all':
+            # Архив строится в пуле процессов и отправляется из фоновой задачи,
+            # чтобы не задерживать обработку апдейтов других пользователей
+            context.application.create_task(self._deliver_campus_bundle(message, start_date_str, end_date_str))
+    
+    async def generate_report_in_format(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                        group_id, start_date_str, end_date_str, report_format):
+        """Построение отчета в выбранном формате (кнопки выбора формата и кнопки под готовым отчетом)"""
+        query = update.callback_query
+        await query.answer()
+        
+        if not await check_admin_rights(query.from_user.id):
+            await query.message.reply_text("❌ Доступно только администраторам")
+            return
+        
+        if report_format not in available_report_formats():
+            await query.message.reply_text("❌ Этот формат отчета недоступен")
+            return
+        
+        # Меню форматов и уже отправленные отчеты остаются, отчет приходит новым сообщением
+        try:
+            progress = await query.message.reply_text("⏳ Отчет готовится, это может занять некоторое время...")
+        except Exception as e:
+            logger.error(f"Ошибка генерации отчета: {e}")
+            return
+        
+        # Отчет строится в пуле процессов и отправляется из фоновой задачи,
+        # чтобы не задерживать обработку апдейтов других пользователей
+        context.application.create_task(
+            self._deliver_report(progress, group_id, start_date_str, end_date_str, report_format)
+        )
+    
+    async def _deliver_report(self, progress, group_id, start_date_str, end_date_str, report_format):
+        """Дождаться построения отчета и отправить его"""
+        try:
+            group_name, content = await report_service.build_report(
+                group_id, start_date_str, end_date_str, report_format
+            )
+            
+            if content is None:
+                await progress.edit_text("📊 Нет данных за выбранный период")
+                return
+            
+            # Остальные форматы того же отчета строятся из уже посчитанных данных
+            reply_markup = get_report_format_keyboard(
+                group_id, start_date_str, end_date_str, available_report_formats(), exclude=report_format
+            )
+            
+            if report_format == 'text':
+                await progress.edit_text(content, reply_markup=reply_markup)
+                return
+            
+            # Формируем название файла
+            filename = f"отчет_{group_name}_{start_date_str}_{end_date_str}{REPORT_FILE_SUFFIXES[report_format]}"
+            
+            await progress.edit_text(f"✅ Отчет готов\nГруппа: {group_name}\nПериод: {start_date_str} - {end_date_str}")
+            await progress.reply_document(
+                document=BytesIO(content),
+                filename=filename,
+                caption=f'📊 Отчет по посещаемости\nГруппа: {group_name}\nПериод: {start_date_str} - {end_date_str}',
+                reply_markup=reply_markup
+            )
+            
+        except ReportQueueFull:
+            await progress.edit_text("⏳ Сейчас формируется слишком много отчетов. Попробуйте через минуту.")
+        except Exception as e:
+            logger.error(f"Ошибка генерации отчета: {e}")
+            await progress.edit_text("❌ Ошибка при генерации отчета")
+
+    async def _deliver_campus_bundle(self, progress, start_date_str, end_date_str):
+        """Дождаться архива с отчетами всех групп и отправить его"""
+        try:
+            content, groups_count, failed = await report_service.build_campus_bundle(start_date_str, end_date_str)
+            
+            text = f"✅ Отчеты готовы\nГрупп с данными: {groups_count}\nПериод: {start_date_str} - {end_date_str}"
+            if failed:
+                text += f"\n\n❌ Не удалось построить: {', '.join(failed)}"
+            await progress.edit_text(text)
+            await progress.reply_document(
+                document=BytesIO(content),
+                filename=f"отчеты_все_группы_{start_date_str}_{end_date_str}.zip",
+                caption=f'📊 Отчеты по посещаемости всех групп\nПериод: {start_date_str} - {end_date_str}'
+            )
+            
+        except ReportQueueFull:
+            await progress.edit_text("⏳ Сейчас формируется слишком много отчетов. Попробуйте через минуту.")
+        except Exception as e:
+            logger.error(f"Ошибка генерации отчетов всех групп: {e}")
+            await progress.edit_text("❌ Ошибка при генерации отчетов")
 
     async def generate_quick_report(self, query):
         """Быстрая генерация отчета (без выбора параметров)"""
         try:
-            with db_connection() as conn:
-                # Получаем последние 30 дней данных
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=30)
-                
-                # Сводка по всем группам
-                summary_df = pd.read_sql("""
-                    SELECT 
-                        g.name as group_name,
-                        COUNT(DISTINCT l.id) as total_lessons,
-                        COUNT(DISTINCT s.id) as total_students,
-                        ROUND(SUM(CASE WHEN a.status = 'present' THEN 1 
-                                        WHEN a.status = 'late' THEN 0.5 
-                                        ELSE 0 END) * 100.0 / COUNT(a.id), 1) as attendance_percent
-                    FROM groups g
-                    LEFT JOIN students s ON g.id = s.group_id
-                    LEFT JOIN group_subjects gs ON g.id = gs.group_id
-                    LEFT JOIN lessons l ON gs.id = l.group_subject_id 
-                        AND l.date BETWEEN ? AND ?
-                    LEFT JOIN attendance a ON l.id = a.lesson_id AND a.student_id = s.id
-                    GROUP BY g.id, g.name
-                    ORDER BY g.name
-                """, conn, params=(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-                
-                if summary_df.empty:
-                    await query.edit_message_text("📊 Нет данных для отчета")
-                    return
-                
-                # Создаем простой текстовый отчет
-                report_text = "📊 Сводка по посещаемости (последние 30 дней):\n\n"
-                
-                for _, row in summary_df.iterrows():
-                    report_text += f"👥 {row['group_name']}:\n"
-                    report_text += f"   • Занятий: {row['total_lessons']}\n"
-                    report_text += f"   • Студентов: {row['total_students']}\n"
-                    report_text += f"   • Посещаемость: {row['attendance_percent']}%\n\n"
-                
-                keyboard = [
-                    [InlineKeyboardButton("📊 Подробный отчет", callback_data='generate_report')],
-                    get_main_menu_button()
-                ]
-                
-                await query.edit_message_text(report_text, reply_markup=InlineKeyboardMarkup(keyboard))
-                
+            # Сводка по всем группам за все время (по сводным таблицам, без обхода отметок)
+            summary_df = await run_db(_load_quick_summary)
+            
+            if summary_df.empty:
+                await query.edit_message_text("📊 Нет данных для отчета")
+                return
+            
+            # Создаем простой текстовый отчет
+            report_text = "📊 Сводка по посещаемости (за все время):\n\n"
+            
+            for _, row in summary_df.iterrows():
+                report_text += f"👥 {row['group_name']}:\n"
+                report_text += f"   • Занятий: {row['total_lessons']}\n"
+                report_text += f"   • Студентов: {row['total_students']}\n"
+                report_text += f"   • Посещаемость: {row['attendance_percent']}%\n\n"
+            
+            keyboard = [
+                [InlineKeyboardButton("📊 Подробный отчет", callback_data='generate_report')],
+                get_main_menu_button()
+            ]
+            
+            await query.edit_message_text(report_text, reply_markup=InlineKeyboardMarkup(keyboard))
+            
         except Exception as e:
             logger.error(f"Ошибка быстрой генерации отчета: {e}")
             await query.edit_message_text("❌ Ошибка при генерации отчета")
\ No newline at end of file
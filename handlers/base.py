@@ -1,12 +1,45 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 import logging
-from database import db_connection
+from database import async_db_connection, run_db, rebuild_attendance_summary
 from keyboards import get_student_keyboard, get_admin_keyboard
-from utils import get_user_role, create_fake_update
+from utils import get_user_role, check_admin_rights, role_cache
+from attendance_session import flush_marking_session
+from reports import report_service
+from callback_router import callback_router
+from reference_cache import reference_cache
+from outbox import outbox
+from notifications import absence_notifier
+from message_editor import message_editor
 
 logger = logging.getLogger(__name__)
 
+async def show_main_menu(query):
+    """Показать главное меню вместо текущего сообщения"""
+    user_id = query.from_user.id
+    
+    try:
+        role = await get_user_role(user_id)
+        
+        if role in ['admin', 'headman']:
+            keyboard = get_admin_keyboard(role)
+            await query.edit_message_text("👨‍💼 Главное меню\n\nВыберите действие:", reply_markup=keyboard)
+            
+        elif role == 'student':
+            keyboard = get_student_keyboard()
+            await query.edit_message_text("👋 Главное меню\n\nВыберите действие:", reply_markup=keyboard)
+            
+        else:
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("📝 Зарегистрироваться", callback_data='register_student')],
+                [InlineKeyboardButton("❓ Помощь", callback_data='help')]
+            ])
+            await query.edit_message_text("👋 Главное меню\n\nВы не зарегистрированы в системе:", reply_markup=keyboard)
+                    
+    except Exception as e:
+        logger.error(f"Ошибка при возврате в главное меню: {e}")
+        await query.edit_message_text("⚠️ Произошла ошибка. Попробуйте позже.")
+
 class BaseHandlers:
     """Базовые обработчики команд"""
     
@@ -23,10 +56,8 @@ class BaseHandlers:
                 keyboard = get_admin_keyboard(role)
                 
             elif role == 'student':
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT full_name FROM students WHERE telegram_id = ?", (user_id,))
-                    result = cur.fetchone()
+                async with async_db_connection() as conn:
+                    result = await conn.fetchone("SELECT full_name FROM students WHERE telegram_id = ?", (user_id,))
                 
                 if result:
                     full_name = result['full_name']
@@ -66,54 +97,112 @@ class BaseHandlers:
         """
         await update.message.reply_text(help_text)
     
-    async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /cancel"""
-        await update.message.reply_text("Операция отменена.")
-        return ConversationHandler.END
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /stats - счетчики кэшей (только для админов)"""
+        if not await check_admin_rights(update.effective_user.id):
+            await update.message.reply_text("❌ Доступно только администраторам")
+            return
+        
+        stats = role_cache.stats()
+        text = (
+            "📈 Статистика бота\n\n"
+            f"Кэш ролей:\n"
+            f"• Записей: {stats['size']}\n"
+            f"• Попаданий: {stats['hits']}\n"
+            f"• Промахов: {stats['misses']}\n"
+            f"• Доля попаданий: {stats['hit_rate']:.1f}%\n"
+        )
+        
+        reports = report_service.stats()
+        text += (
+            f"\nОтчеты:\n"
+            f"• В работе и в очереди: {reports['pending']}\n"
+            f"• Построено: {reports['completed']}\n"
+            f"• Общих с другими запросами: {reports['shared']}\n"
+            f"• Отклонено (очередь заполнена): {reports['rejected']}\n"
+        )
+        
+        cache = report_service.cache.stats()
+        text += (
+            f"\nКэш отчетов:\n"
+            f"• В памяти: {cache['size']} ({cache['bytes'] / 1024:.0f} КБ)\n"
+            f"• На диске: {cache['disk_size']} ({cache['disk_bytes'] / 1024:.0f} КБ)\n"
+            f"• Доля попаданий: {cache['hit_rate']:.1f}%\n"
+        )
+        
+        reference = reference_cache.stats()
+        text += (
+            f"\nСправочники (группы, предметы):\n"
+            f"• Загружены: {'да' if reference['loaded'] else 'нет'} (групп: {reference['groups']})\n"
+            f"• Доля попаданий: {reference['hit_rate']:.1f}%\n"
+        )
+        
+        persistence = context.application.persistence
+        if persistence is not None:
+            saved = persistence.stats()
+            text += (
+                f"\nДанные диалогов:\n"
+                f"• Ожидают записи: {saved['pending']}\n"
+                f"• Записано: {saved['written']} (транзакций: {saved['batches']})\n"
+                f"• Без изменений: {saved['unchanged']}\n"
+            )
+        
+        sent = outbox.stats()
+        text += (
+            f"\nИсходящие сообщения:\n"
+            f"• Отправлено: {sent['sent']}\n"
+            f"• Не доставлено: {sent['failed']}\n"
+            f"• Повторов: {sent['retried']} (пауз по лимиту Telegram: {sent['flood_waits']})\n"
+        )
+        
+        notices = absence_notifier.stats()
+        text += (
+            f"\nУведомления о пропусках:\n"
+            f"• Ожидают проверки: {notices['waiting']}\n"
+            f"• Поставлено в очередь: {notices['queued']} (повторов отброшено: {notices['duplicates']})\n"
+        )
+        
+        edits = message_editor.stats()
+        text += (
+            f"\nПравки экрана отметки:\n"
+            f"• Отправлено: {edits['sent']}\n"
+            f"• Слито с последующими: {edits['coalesced']}\n"
+            f"• Без изменений: {edits['unchanged'] + edits['not_modified']}\n"
+            f"• Пауз по лимиту Telegram: {edits['retry_after']}\n"
+        )
+        
+        routes = callback_router.stats()
+        text += f"\nКнопки (маршрутов: {routes['routes']}):\n"
+        for name, hits in routes['hits'][:10]:
+            text += f"• {name}: {hits}\n"
+        text += f"• Не распознано: {routes['unmatched']}\n"
+        await update.message.reply_text(text)
     
-    async def back_to_main_menu(self, query):
-        """Вернуться в главное меню"""
-        user_id = query.from_user.id
+    async def rebuild_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /rebuild_stats - пересчет сводной посещаемости (только для админов)"""
+        if not await check_admin_rights(update.effective_user.id):
+            await update.message.reply_text("❌ Доступно только администраторам")
+            return
         
         try:
-            role = await get_user_role(user_id)
-            
-            if role in ['admin', 'headman']:
-                keyboard = get_admin_keyboard(role)
-                await query.edit_message_text("👨‍💼 Главное меню\n\nВыберите действие:", reply_markup=keyboard)
-                
-            elif role == 'student':
-                keyboard = get_student_keyboard()
-                await query.edit_message_text("👋 Главное меню\n\nВыберите действие:", reply_markup=keyboard)
-                
-            else:
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("📝 Зарегистрироваться", callback_data='register_student')],
-                    [InlineKeyboardButton("❓ Помощь", callback_data='help')]
-                ])
-                await query.edit_message_text("👋 Главное меню\n\nВы не зарегистрированы в системе:", reply_markup=keyboard)
-                        
+            rows = await run_db(rebuild_attendance_summary)
+            await update.message.reply_text(f"✅ Сводная посещаемость пересчитана. Записей: {rows}")
         except Exception as e:
-            logger.error(f"Ошибка при возврате в главное меню: {e}")
-            await query.edit_message_text("⚠️ Произошла ошибка. Попробуйте позже.")
+            logger.error(f"Ошибка пересчета сводной посещаемости: {e}")
+            await update.message.reply_text("❌ Ошибка при пересчете сводной посещаемости")
     
-    async def back_to_management(self, query):
-        """Вернуться в меню управления студентами"""
-        from .admin import AdminHandlers
-        admin_handlers = AdminHandlers()
-        fake_update = create_fake_update(query)
-        await admin_handlers.start_student_management(fake_update, {})
-    
-    async def back_to_groups_management(self, query):
-        """Вернуться в меню управления группами"""
-        from .group import GroupHandlers
-        group_handlers = GroupHandlers()
-        fake_update = create_fake_update(query)
-        await group_handlers.start_group_management(fake_update, {})
-    
-    async def back_to_subjects_management(self, query):
-        """Вернуться в меню управления предметами"""
-        from .subject import SubjectHandlers
-        subject_handlers = SubjectHandlers()
-        fake_update = create_fake_update(query)
-        await subject_handlers.start_subject_management(fake_update, {})
\ No newline at end of file
+    async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /cancel"""
+        # Незавершенная отметка посещаемости сохраняется, а не теряется
+        try:
+            saved = await flush_marking_session(context.user_data)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении посещаемости: {e}")
+            saved = 0
+        
+        if saved:
+            await update.message.reply_text(f"Операция отменена. Сохранено отметок посещаемости: {saved}")
+            return ConversationHandler.END
+        
+        await update.message.reply_text("Операция отменена.")
+        return ConversationHandler.END
\ No newline at end of file
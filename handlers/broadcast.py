@@ -0,0 +1,120 @@
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, ConversationHandler
+import logging
+from config import BROADCAST_SELECT_TARGET, BROADCAST_TEXT, BROADCAST_CONFIRM
+from utils import check_admin_rights
+from keyboards import get_back_button
+from reference_cache import get_reference_data
+from outbox import outbox
+from callback_router import CallbackRoute
+from .base import show_main_menu
+
+logger = logging.getLogger(__name__)
+
+# Группа рассылки или 'all'
+BROADCAST_GROUP_ROUTE = CallbackRoute('broadcast_group_{target}')
+
+class BroadcastHandlers:
+    """Обработчики рассылки сообщений студентам"""
+
+    async def start_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Начало рассылки: выбор получателей"""
+        query = update.callback_query
+        await query.answer()
+
+        if not await check_admin_rights(query.from_user.id):
+            await query.edit_message_text("❌ Доступно только администраторам")
+            return ConversationHandler.END
+
+        try:
+            keyboard = (await get_reference_data()).groups_keyboard('broadcast_group')
+            keyboard.append([InlineKeyboardButton("🏫 Все группы", callback_data='broadcast_group_all')])
+            keyboard.append(get_back_button('main'))
+
+            await query.edit_message_text(
+                "📣 Рассылка\n\nКому отправить сообщение?",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return BROADCAST_SELECT_TARGET
+
+        except Exception as e:
+            logger.error(f"Ошибка при получении групп: {e}")
+            await query.edit_message_text("❌ Ошибка при загрузке групп")
+            return ConversationHandler.END
+
+    async def select_broadcast_target(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выбор группы (или всех групп) для рассылки"""
+        query = update.callback_query
+        await query.answer()
+
+        if query.data == 'back_to_main':
+            await show_main_menu(query)
+            return ConversationHandler.END
+
+        fields = BROADCAST_GROUP_ROUTE.match(query.data)
+        if fields is None:
+            return ConversationHandler.END
+
+        target = fields['target']
+        group_id = None if target == 'all' else int(target)
+        context.user_data['broadcast_group_id'] = group_id
+
+        if group_id is None:
+            target_name = "всем группам"
+        else:
+            target_name = f"группе {(await get_reference_data()).group_name(group_id)}"
+
+        await query.edit_message_text(f"📣 Рассылка {target_name}\n\nВведите текст сообщения (/cancel - отмена):")
+        return BROADCAST_TEXT
+
+    async def enter_broadcast_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Получение текста рассылки и подтверждение"""
+        text = update.message.text.strip()
+        group_id = context.user_data.get('broadcast_group_id')
+        context.user_data['broadcast_text'] = text
+
+        try:
+            recipients = await outbox.count_broadcast_recipients(group_id)
+        except Exception as e:
+            logger.error(f"Ошибка при подсчете получателей рассылки: {e}")
+            await update.message.reply_text("❌ Ошибка при загрузке данных")
+            return ConversationHandler.END
+
+        if not recipients:
+            await update.message.reply_text("📝 Нет студентов, зарегистрированных в боте")
+            return ConversationHandler.END
+
+        keyboard = [
+            [InlineKeyboardButton("✅ Отправить", callback_data='confirm_broadcast')],
+            [InlineKeyboardButton("❌ Отмена", callback_data='cancel_broadcast')]
+        ]
+        await update.message.reply_text(
+            f"📣 Получателей: {recipients}\n\n{text}",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return BROADCAST_CONFIRM
+
+    async def confirm_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Постановка рассылки в очередь отправки"""
+        query = update.callback_query
+        await query.answer()
+
+        text = context.user_data.pop('broadcast_text', None)
+        group_id = context.user_data.pop('broadcast_group_id', None)
+
+        if query.data == 'cancel_broadcast' or text is None:
+            await query.edit_message_text("❌ Рассылка отменена")
+            return ConversationHandler.END
+
+        try:
+            queued = await outbox.enqueue_broadcast(group_id, text)
+            logger.info(f"Рассылка от {query.from_user.id}: {queued} сообщений в очереди")
+            await query.edit_message_text(
+                f"✅ Рассылка поставлена в очередь: {queued} сообщений.\n"
+                f"Сообщения отправляются с допустимой Telegram скоростью."
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при постановке рассылки в очередь: {e}")
+            await query.edit_message_text("❌ Ошибка при отправке рассылки")
+
+        return ConversationHandler.END
\ No newline at end of file
@@ -1,13 +1,22 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
 import logging
-from database import db_connection
+from database import async_db_connection
 from config import MANAGE_GROUPS, ADD_GROUP_NAME, EDIT_GROUP_SELECT, EDIT_GROUP_NAME, DELETE_GROUP
-from utils import check_admin_rights
+from utils import check_admin_rights, invalidate_user_role
 from keyboards import get_back_button, get_main_menu_button
+from reference_cache import get_reference_data, invalidate_reference_data
+from callback_router import CallbackRoute
+from .base import show_main_menu
 
 logger = logging.getLogger(__name__)
 
+# Кнопки диалогов редактирования и удаления групп
+EDIT_GROUP_ROUTE = CallbackRoute('edit_group_{group_id:int}')
+DELETE_GROUP_ROUTE = CallbackRoute('delete_group_{group_id:int}')
+CONFIRM_DELETE_GROUP_ROUTE = CallbackRoute('confirm_delete_group_{group_id:int}')
+CONFIRM_DELETE_GROUP_WITH_STUDENTS_ROUTE = CallbackRoute('confirm_delete_group_with_students_{group_id:int}')
+
 class GroupHandlers:
     """Обработчики для управления группами"""
     
@@ -26,7 +35,7 @@ class GroupHandlers:
             [InlineKeyboardButton("➕ Добавить группу", callback_data='add_group')],
             [InlineKeyboardButton("✏️ Редактировать группу", callback_data='edit_group')],
             [InlineKeyboardButton("🗑️ Удалить группу", callback_data='delete_group')],
-            get_back_button('main')[0]
+            get_back_button('main')
         ]
         
         await query.edit_message_text(
@@ -59,9 +68,7 @@ class GroupHandlers:
             return DELETE_GROUP
             
         elif data == 'back_to_main':
-            from .base import BaseHandlers
-            base_handlers = BaseHandlers()
-            await base_handlers.back_to_main_menu(query)
+            await show_main_menu(query)
             return ConversationHandler.END
             
         return MANAGE_GROUPS
@@ -71,18 +78,18 @@ class GroupHandlers:
         group_name = update.message.text.strip()
         
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                
+            async with async_db_connection() as conn:
                 # Проверяем, нет ли уже группы с таким названием
-                cur.execute("SELECT id FROM groups WHERE name = ?", (group_name,))
-                if cur.fetchone():
-                    await update.message.reply_text("❌ Группа с таким названием уже существует!")
-                    return ConversationHandler.END
-                
-                # Добавляем группу
-                cur.execute("INSERT INTO groups (name) VALUES (?)", (group_name,))
-                conn.commit()
+                exists = await conn.fetchone("SELECT id FROM groups WHERE name = ?", (group_name,))
+                if not exists:
+                    # Добавляем группу
+                    await conn.execute("INSERT INTO groups (name) VALUES (?)", (group_name,))
+                    await conn.commit()
+            
+            if exists:
+                await update.message.reply_text("❌ Группа с таким названием уже существует!")
+                return ConversationHandler.END
+            invalidate_reference_data()
             
             keyboard = [
                 [InlineKeyboardButton("🔙 К управлению группами", callback_data='back_to_groups_management')],
@@ -103,25 +110,18 @@ class GroupHandlers:
     async def show_groups_for_edit(self, query):
         """Показать список групп для редактирования"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
+            reference = await get_reference_data()
+            if reference.groups:
+                keyboard = reference.groups_keyboard('edit_group')
+                keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_groups_management')])
+                
+                await query.edit_message_text(
+                    "✏️ Выберите группу для редактирования:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            else:
+                await query.edit_message_text("📝 Группы не найдены")
                 
-                if groups:
-                    keyboard = []
-                    for group in groups:
-                        keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'edit_group_{group["id"]}')])
-                    
-                    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_groups_management')])
-                    
-                    await query.edit_message_text(
-                        "✏️ Выберите группу для редактирования:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                else:
-                    await query.edit_message_text("📝 Группы не найдены")
-                    
         except Exception as e:
             logger.error(f"Ошибка при получении групп: {e}")
             await query.edit_message_text("❌ Ошибка при загрузке данных")
@@ -135,16 +135,14 @@ class GroupHandlers:
             await self.start_group_management(update, context, query)
             return MANAGE_GROUPS
         
-        if query.data.startswith('edit_group_'):
-            group_id = int(query.data.split('_')[2])
+        fields = EDIT_GROUP_ROUTE.match(query.data)
+        if fields is not None:
+            group_id = fields['group_id']
             context.user_data['edit_group_id'] = group_id
             
             # Получаем текущее название группы
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
+                group_name = (await get_reference_data()).group_name(group_id)
                 
                 keyboard = [get_back_button('groups_management')]
                 
@@ -168,18 +166,18 @@ class GroupHandlers:
         group_id = context.user_data['edit_group_id']
         
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                
+            async with async_db_connection() as conn:
                 # Проверяем, нет ли уже группы с таким названием
-                cur.execute("SELECT id FROM groups WHERE name = ? AND id != ?", (new_group_name, group_id))
-                if cur.fetchone():
-                    await update.message.reply_text("❌ Группа с таким названием уже существует!")
-                    return ConversationHandler.END
-                
-                # Обновляем название группы
-                cur.execute("UPDATE groups SET name = ? WHERE id = ?", (new_group_name, group_id))
-                conn.commit()
+                exists = await conn.fetchone("SELECT id FROM groups WHERE name = ? AND id != ?", (new_group_name, group_id))
+                if not exists:
+                    # Обновляем название группы
+                    await conn.execute("UPDATE groups SET name = ? WHERE id = ?", (new_group_name, group_id))
+                    await conn.commit()
+            
+            if exists:
+                await update.message.reply_text("❌ Группа с таким названием уже существует!")
+                return ConversationHandler.END
+            invalidate_reference_data()
             
             keyboard = [
                 [InlineKeyboardButton("🔙 К управлению группами", callback_data='back_to_groups_management')],
@@ -200,30 +198,28 @@ class GroupHandlers:
     async def show_groups_for_delete(self, query):
         """Показать список групп для удаления"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
+            reference = await get_reference_data()
+            if reference.groups:
+                # Количество студентов во всех группах одним запросом
+                async with async_db_connection() as conn:
+                    student_counts = dict(await conn.fetchall(
+                        "SELECT group_id, COUNT(*) FROM students GROUP BY group_id"
+                    ))
+                
+                keyboard = []
+                for group_id, group_name in reference.groups:
+                    btn_text = f"{group_name} ({student_counts.get(group_id, 0)} студентов)"
+                    keyboard.append([InlineKeyboardButton(btn_text, callback_data=f'delete_group_{group_id}')])
+                
+                keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_groups_management')])
+                
+                await query.edit_message_text(
+                    "🗑️ Выберите группу для удаления:\n(в скобках указано количество студентов)",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            else:
+                await query.edit_message_text("📝 Группы не найдены")
                 
-                if groups:
-                    keyboard = []
-                    for group in groups:
-                        # Проверяем, есть ли студенты в группе
-                        cur.execute("SELECT COUNT(*) FROM students WHERE group_id = ?", (group['id'],))
-                        student_count = cur.fetchone()[0]
-                        
-                        btn_text = f"{group['name']} ({student_count} студентов)"
-                        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f'delete_group_{group["id"]}')])
-                    
-                    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_groups_management')])
-                    
-                    await query.edit_message_text(
-                        "🗑️ Выберите группу для удаления:\n(в скобках указано количество студентов)",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                else:
-                    await query.edit_message_text("📝 Группы не найдены")
-                    
         except Exception as e:
             logger.error(f"Ошибка при получении групп: {e}")
             await query.edit_message_text("❌ Ошибка при загрузке данных")
@@ -237,61 +233,87 @@ class GroupHandlers:
             await self.start_group_management(update, context, query)
             return MANAGE_GROUPS
         
-        if query.data.startswith('delete_group_'):
-            group_id = int(query.data.split('_')[2])
+        select = DELETE_GROUP_ROUTE.match(query.data)
+        confirm = (CONFIRM_DELETE_GROUP_ROUTE.match(query.data)
+                   or CONFIRM_DELETE_GROUP_WITH_STUDENTS_ROUTE.match(query.data))
+        
+        if select is not None:
+            group_id = select['group_id']
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Получаем данные группы
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
+                # Получаем данные группы
+                group_name = (await get_reference_data()).group_name(group_id)
+                
+                async with async_db_connection() as conn:
                     # Проверяем, есть ли студенты в группе
-                    cur.execute("SELECT COUNT(*) FROM students WHERE group_id = ?", (group_id,))
-                    student_count = cur.fetchone()[0]
+                    student_count = (await conn.fetchone("SELECT COUNT(*) FROM students WHERE group_id = ?", (group_id,)))[0]
+                
+                if student_count > 0:
+                    keyboard = [
+                        [InlineKeyboardButton("✅ Удалить вместе со студентами", callback_data=f'confirm_delete_group_with_students_{group_id}')],
+                        [InlineKeyboardButton("🔁 Переместить студентов в другую группу", callback_data=f'move_students_{group_id}')],
+                        [InlineKeyboardButton("❌ Отмена", callback_data='cancel_delete_group')]
+                    ]
                     
-                    if student_count > 0:
-                        keyboard = [
-                            [InlineKeyboardButton("✅ Удалить вместе со студентами", callback_data=f'confirm_delete_group_with_students_{group_id}')],
-                            [InlineKeyboardButton("🔁 Переместить студентов в другую группу", callback_data=f'move_students_{group_id}')],
-                            [InlineKeyboardButton("❌ Отмена", callback_data='cancel_delete_group')]
-                        ]
-                        
-                        await query.edit_message_text(
-                            f"⚠️ В группе '{group_name}' есть {student_count} студент(ов)!\n\n"
-                            f"Что вы хотите сделать?",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
-                    else:
-                        keyboard = [
-                            [InlineKeyboardButton("✅ Да, удалить", callback_data=f'confirm_delete_group_{group_id}')],
-                            [InlineKeyboardButton("❌ Нет, отмена", callback_data='cancel_delete_group')]
-                        ]
-                        
-                        await query.edit_message_text(
-                            f"⚠️ Вы уверены, что хотите удалить группу '{group_name}'?",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
+                    await query.edit_message_text(
+                        f"⚠️ В группе '{group_name}' есть {student_count} студент(ов)!\n\n"
+                        f"Что вы хотите сделать?",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                else:
+                    keyboard = [
+                        [InlineKeyboardButton("✅ Да, удалить", callback_data=f'confirm_delete_group_{group_id}')],
+                        [InlineKeyboardButton("❌ Нет, отмена", callback_data='cancel_delete_group')]
+                    ]
                     
-                    return DELETE_GROUP
+                    await query.edit_message_text(
+                        f"⚠️ Вы уверены, что хотите удалить группу '{group_name}'?",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                
+                return DELETE_GROUP
                     
             except Exception as e:
                 logger.error(f"Ошибка при получении данных группы: {e}")
                 await query.edit_message_text("❌ Ошибка при загрузке данных")
         
-        elif query.data.startswith('confirm_delete_group_'):
-            group_id = int(query.data.split('_')[3])
+        elif confirm is not None:
+            group_id = confirm['group_id']
+            with_students = CONFIRM_DELETE_GROUP_WITH_STUDENTS_ROUTE.match(query.data) is not None
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
+                group_name = (await get_reference_data()).group_name(group_id)
+                
+                async with async_db_connection() as conn:
+                    # Сначала удаляем зависимые записи (foreign_keys = ON)
+                    await conn.execute("""
+                        DELETE FROM attendance WHERE lesson_id IN (
+                            SELECT l.id FROM lessons l
+                            JOIN group_subjects gs ON l.group_subject_id = gs.id
+                            WHERE gs.group_id = ?
+                        )
+                    """, (group_id,))
+                    await conn.execute("""
+                        DELETE FROM lessons WHERE group_subject_id IN (
+                            SELECT id FROM group_subjects WHERE group_id = ?
+                        )
+                    """, (group_id,))
+                    await conn.execute("DELETE FROM group_subjects WHERE group_id = ?", (group_id,))
+                    
+                    if with_students:
+                        await conn.execute("""
+                            DELETE FROM attendance WHERE student_id IN (
+                                SELECT id FROM students WHERE group_id = ?
+                            )
+                        """, (group_id,))
+                        await conn.execute("DELETE FROM students WHERE group_id = ?", (group_id,))
                     
-                    cur.execute("DELETE FROM groups WHERE id = ?", (group_id,))
-                    conn.commit()
+                    await conn.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+                    await conn.commit()
+                invalidate_reference_data()
+                
+                if with_students:
+                    invalidate_user_role()
                 
                 keyboard = [
                     [InlineKeyboardButton("🔙 К управлению группами", callback_data='back_to_groups_management')],
@@ -316,32 +338,29 @@ class GroupHandlers:
     async def list_groups(self, query):
         """Показать список всех групп"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
+            async with async_db_connection() as conn:
+                groups = await conn.fetchall("""
                     SELECT g.id, g.name, COUNT(s.id) as student_count
                     FROM groups g
                     LEFT JOIN students s ON g.id = s.group_id
                     GROUP BY g.id
                     ORDER BY g.name
                 """)
+            
+            if groups:
+                text = "📚 Список всех групп:\n\n"
+                for group in groups:
+                    text += f"• {group['name']} - {group['student_count']} студент(ов)\n"
                 
-                groups = cur.fetchall()
-                
-                if groups:
-                    text = "📚 Список всех групп:\n\n"
-                    for group in groups:
-                        text += f"• {group['name']} - {group['student_count']} студент(ов)\n"
-                    
-                    text += f"\nВсего групп: {len(groups)}"
-                else:
-                    text = "📝 Группы не найдены"
-                
-                keyboard = [
-                    get_back_button('groups_management')[0],
-                    get_main_menu_button()
-                ]
-                await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+                text += f"\nВсего групп: {len(groups)}"
+            else:
+                text = "📝 Группы не найдены"
+            
+            keyboard = [
+                get_back_button('groups_management'),
+                get_main_menu_button()
+            ]
+            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
                 
         except Exception as e:
             logger.error(f"Ошибка при получении списка групп: {e}")
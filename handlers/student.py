@@ -1,12 +1,17 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
 import logging
-from database import db_connection
+from database import async_db_connection
 from config import REGISTER_NAME, REGISTER_GROUP
-from keyboards import get_groups_keyboard, get_back_button, get_main_menu_button
+from keyboards import get_back_button, get_main_menu_button
+from reference_cache import get_reference_data
+from utils import invalidate_user_role
+from callback_router import CallbackRoute
 
 logger = logging.getLogger(__name__)
 
+REGISTER_GROUP_ROUTE = CallbackRoute('register_group_{group_id:int}')
+
 class StudentHandlers:
     """Обработчики для студентов"""
     
@@ -19,12 +24,11 @@ class StudentHandlers:
         
         # Проверяем, не зарегистрирован ли уже студент
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
-                if cur.fetchone():
-                    await query.edit_message_text("✅ Вы уже зарегистрированы в системе!")
-                    return ConversationHandler.END
+            async with async_db_connection() as conn:
+                registered = await conn.fetchone("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
+            if registered:
+                await query.edit_message_text("✅ Вы уже зарегистрированы в системе!")
+                return ConversationHandler.END
         except Exception as e:
             logger.error(f"Ошибка при проверке регистрации: {e}")
         
@@ -37,16 +41,12 @@ class StudentHandlers:
         
         # Получаем список групп для выбора
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
-                
-                if not groups:
-                    await update.message.reply_text("❌ В системе нет групп. Обратитесь к администратору.")
-                    return ConversationHandler.END
+            reference = await get_reference_data()
+            if not reference.groups:
+                await update.message.reply_text("❌ В системе нет групп. Обратитесь к администратору.")
+                return ConversationHandler.END
             
-            keyboard = get_groups_keyboard('register_group')
+            keyboard = reference.groups_keyboard('register_group')
             keyboard.append([InlineKeyboardButton("🔙 Отмена", callback_data='cancel_register')])
             keyboard.append(get_main_menu_button())
             
@@ -70,31 +70,31 @@ class StudentHandlers:
             await query.edit_message_text("❌ Регистрация отменена")
             return ConversationHandler.END
         
-        if query.data.startswith('register_group_'):
-            group_id = int(query.data.split('_')[2])
+        fields = REGISTER_GROUP_ROUTE.match(query.data)
+        if fields is not None:
+            group_id = fields['group_id']
             student_name = context.user_data['register_student']['name']
             user_id = query.from_user.id
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
+                async with async_db_connection() as conn:
                     # Проверяем, нет ли уже студента с таким Telegram ID
-                    cur.execute("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
-                    if cur.fetchone():
-                        await query.edit_message_text("❌ Вы уже зарегистрированы в системе!")
-                        return ConversationHandler.END
-                    
-                    # Добавляем студента
-                    cur.execute(
-                        "INSERT INTO students (full_name, group_id, telegram_id) VALUES (?, ?, ?)",
-                        (student_name, group_id, user_id)
-                    )
-                    conn.commit()
-                    
-                    # Получаем название группы для сообщения
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
+                    registered = await conn.fetchone("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
+                    if not registered:
+                        # Добавляем студента
+                        await conn.execute(
+                            "INSERT INTO students (full_name, group_id, telegram_id) VALUES (?, ?, ?)",
+                            (student_name, group_id, user_id)
+                        )
+                        await conn.commit()
+                
+                if registered:
+                    await query.edit_message_text("❌ Вы уже зарегистрированы в системе!")
+                    return ConversationHandler.END
+                invalidate_user_role(user_id)
+                
+                # Получаем название группы для сообщения
+                group_name = (await get_reference_data()).group_name(group_id)
                 
                 keyboard = [get_main_menu_button()]
                 
@@ -110,4 +110,32 @@ class StudentHandlers:
                 logger.error(f"Ошибка при регистрации студента: {e}")
                 await query.edit_message_text("❌ Ошибка при регистрации. Обратитесь к администратору.")
         
-        return ConversationHandler.END
\ No newline at end of file
+        return ConversationHandler.END
+
+    async def toggle_absence_notifications(self, query):
+        """Включить или выключить уведомления об отсутствиях и опозданиях"""
+        try:
+            async with async_db_connection() as conn:
+                await conn.execute(
+                    "UPDATE students SET notify_absence = 1 - notify_absence WHERE telegram_id = ?",
+                    (query.from_user.id,)
+                )
+                await conn.commit()
+                student = await conn.fetchone(
+                    "SELECT notify_absence FROM students WHERE telegram_id = ?", (query.from_user.id,)
+                )
+            
+            if not student:
+                await query.edit_message_text("❌ Вы не зарегистрированы как студент")
+                return
+            
+            if student['notify_absence']:
+                text = "🔔 Уведомления включены: бот сообщит, если вас отметят отсутствующим или опоздавшим."
+            else:
+                text = "🔕 Уведомления о пропусках выключены."
+            
+            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([get_main_menu_button()]))
+                
+        except Exception as e:
+            logger.error(f"Ошибка при изменении уведомлений: {e}")
+            await query.edit_message_text("❌ Ошибка при изменении настроек")
\ No newline at end of file
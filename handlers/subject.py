@@ -1,13 +1,23 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters
 import logging
-from database import db_connection
+from database import async_db_connection
 from config import MANAGE_SUBJECTS, ADD_SUBJECT_NAME, SELECT_GROUP_FOR_SUBJECT, DELETE_SUBJECT
 from utils import check_admin_rights
 from keyboards import get_groups_keyboard, get_back_button, get_main_menu_button
+from reference_cache import get_reference_data, invalidate_reference_data
+from callback_router import CallbackRoute
+from .base import show_main_menu
 
 logger = logging.getLogger(__name__)
 
+# Кнопки диалогов добавления и удаления предметов
+ADD_SUBJECT_GROUP_ROUTE = CallbackRoute('add_subject_group_{group_id:int}')
+DELETE_SUBJECT_GROUP_ROUTE = CallbackRoute('delete_subject_group_{group_id:int}')
+DELETE_THIS_SUBJECT_ROUTE = CallbackRoute('delete_this_subject_{subject_id:int}')
+CONFIRM_DELETE_SUBJECT_ROUTE = CallbackRoute('confirm_delete_subject_{subject_id:int}')
+CONFIRM_DELETE_SUBJECT_WITH_LESSONS_ROUTE = CallbackRoute('confirm_delete_subject_with_lessons_{subject_id:int}')
+
 class SubjectHandlers:
     """Обработчики для управления предметами"""
     
@@ -25,7 +35,7 @@ class SubjectHandlers:
             [InlineKeyboardButton("📚 Список предметов по группам", callback_data='list_subjects_by_group')],
             [InlineKeyboardButton("➕ Добавить предмет для группы", callback_data='add_subject')],
             [InlineKeyboardButton("🗑️ Удалить предмет из группы", callback_data='delete_subject')],
-            # get_back_button('main')[0]
+            get_back_button('main')
         ]
         
         await query.edit_message_text(
@@ -54,9 +64,7 @@ class SubjectHandlers:
             return DELETE_SUBJECT
             
         elif data == 'back_to_main':
-            from .base import BaseHandlers
-            base_handlers = BaseHandlers()
-            await base_handlers.back_to_main_menu(query)
+            await show_main_menu(query)
             return ConversationHandler.END
             
         return MANAGE_SUBJECTS
@@ -64,106 +72,73 @@ class SubjectHandlers:
     async def show_groups_for_subjects_list(self, query):
         """Показать группы для просмотра предметов"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
+            reference = await get_reference_data()
+            if reference.groups:
+                keyboard = reference.groups_keyboard('list_subjects_group')
+                keyboard.append(get_back_button('main'))
+                
+                await query.edit_message_text(
+                    "👥 Выберите группу для просмотра предметов:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            else:
+                await query.edit_message_text("📝 Группы не найдены")
                 
-                if groups:
-                    keyboard = []
-                    for group in groups:
-                        keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'list_subjects_group_{group["id"]}')])
-                    
-                    keyboard.append(get_back_button('main'))
-                    
-                    await query.edit_message_text(
-                        "👥 Выберите группу для просмотра предметов:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                else:
-                    await query.edit_message_text("📝 Группы не найдены")
-                    
         except Exception as e:
             logger.error(f"Ошибка при получении групп: {e}")
             await query.edit_message_text("❌ Ошибка при загрузке данных")
 
-    async def show_subjects_for_group(self, query):
+    async def show_subjects_for_group(self, query, group_id):
         """Показать предметы для выбранной группы"""
-        if query.data.startswith('list_subjects_group_'):
-            group_id = int(query.data.split('_')[3])
+        try:
+            reference = await get_reference_data()
+            group_name = reference.group_name(group_id)
+            subjects = reference.subjects_of(group_id)
             
-            try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Получаем название группы
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
-                    # Получаем предметы группы
-                    cur.execute("""
-                        SELECT s.id, s.name 
-                        FROM subjects s
-                        JOIN group_subjects gs ON s.id = gs.subject_id
+            if subjects:
+                # Количество занятий по каждому предмету - из сводной таблицы, одним запросом
+                async with async_db_connection() as conn:
+                    lesson_counts = dict(await conn.fetchall("""
+                        SELECT gss.group_subject_id, gss.lesson_count
+                        FROM group_subject_stats gss
+                        JOIN group_subjects gs ON gs.id = gss.group_subject_id
                         WHERE gs.group_id = ?
-                        ORDER BY s.name
-                    """, (group_id,))
-                    
-                    subjects = cur.fetchall()
-                    
-                    # Получаем количество занятий по каждому предмету
-                    subject_stats = {}
-                    for subject in subjects:
-                        cur.execute("""
-                            SELECT COUNT(*) FROM lessons l
-                            JOIN group_subjects gs ON l.group_subject_id = gs.id
-                            WHERE gs.group_id = ? AND gs.subject_id = ?
-                        """, (group_id, subject['id']))
-                        lesson_count = cur.fetchone()[0]
-                        subject_stats[subject['id']] = lesson_count
-                    
-                    if subjects:
-                        text = f"📚 Предметы группы {group_name}:\n\n"
-                        for subject in subjects:
-                            lesson_count = subject_stats.get(subject['id'], 0)
-                            text += f"• {subject['name']} - {lesson_count} занятий\n"
-                    else:
-                        text = f"📝 В групке {group_name} нет предметов"
-                    
-                    keyboard = [
-                        [InlineKeyboardButton("🔙 К выбору группы", callback_data='list_subjects_by_group')],
-                        get_main_menu_button()
-                    ]
-                    
-                    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-                        
-            except Exception as e:
-                logger.error(f"Ошибка при получении предметов: {e}")
-                await query.edit_message_text("❌ Ошибка при загрузке данных")
+                    """, (group_id,)))
+                
+                text = f"📚 Предметы группы {group_name}:\n\n"
+                for _, subject_name, group_subject_id in subjects:
+                    lesson_count = lesson_counts.get(group_subject_id, 0)
+                    text += f"• {subject_name} - {lesson_count} занятий\n"
+            else:
+                text = f"📝 В групке {group_name} нет предметов"
+            
+            keyboard = [
+                [InlineKeyboardButton("🔙 К выбору группы", callback_data='list_subjects_by_group')],
+                get_main_menu_button()
+            ]
+            
+            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+                
+        except Exception as e:
+            logger.error(f"Ошибка при получении предметов: {e}")
+            await query.edit_message_text("❌ Ошибка при загрузке данных")
 
     async def show_groups_for_subject_addition(self, query):
         """Показать группы для добавления предмета"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
+            reference = await get_reference_data()
+            if reference.groups:
+                keyboard = reference.groups_keyboard('add_subject_group')
+                keyboard.append(get_back_button('main'))
+                
+                await query.edit_message_text(
+                    "👥 Выберите группу для добавления предмета:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                return SELECT_GROUP_FOR_SUBJECT
+            else:
+                await query.edit_message_text("📝 Группы не найдены")
                 
-                if groups:
-                    keyboard = []
-                    for group in groups:
-                        keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'add_subject_group_{group["id"]}')])
-                    
-                    keyboard.append(get_back_button('main'))
-                    
-                    await query.edit_message_text(
-                        "👥 Выберите группу для добавления предмета:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                    return SELECT_GROUP_FOR_SUBJECT
-                else:
-                    await query.edit_message_text("📝 Группы не найдены")
-                    
         except Exception as e:
             logger.error(f"Ошибка при получении групп: {e}")
             await query.edit_message_text("❌ Ошибка при загрузке данных")
@@ -173,16 +148,14 @@ class SubjectHandlers:
         query = update.callback_query
         await query.answer()
         
-        if query.data.startswith('add_subject_group_'):
-            group_id = int(query.data.split('_')[3])
+        fields = ADD_SUBJECT_GROUP_ROUTE.match(query.data)
+        if fields is not None:
+            group_id = fields['group_id']
             context.user_data['subject_group_id'] = group_id
             
             # Получаем название группы
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
+                group_name = (await get_reference_data()).group_name(group_id)
                 
                 await query.edit_message_text(
                     f"📚 Добавление предмета для группы {group_name}\n\n"
@@ -202,32 +175,31 @@ class SubjectHandlers:
         group_id = context.user_data['subject_group_id']
         
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                
-                # Получаем название группы
-                cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                group_name = cur.fetchone()['name']
-                
+            # Получаем название группы
+            group_name = (await get_reference_data()).group_name(group_id)
+            
+            async with async_db_connection() as conn:
                 # Сначала находим или создаем предмет
-                cur.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,))
-                subject = cur.fetchone()
+                subject = await conn.fetchone("SELECT id FROM subjects WHERE name = ?", (subject_name,))
                 
                 if subject:
                     subject_id = subject['id']
                 else:
-                    cur.execute("INSERT INTO subjects (name) VALUES (?)", (subject_name,))
-                    subject_id = cur.lastrowid
+                    subject_id = await conn.execute("INSERT INTO subjects (name) VALUES (?)", (subject_name,))
                 
                 # Проверяем, не привязан ли уже этот предмет к группе
-                cur.execute("SELECT id FROM group_subjects WHERE group_id = ? AND subject_id = ?", (group_id, subject_id))
-                if cur.fetchone():
-                    await update.message.reply_text("❌ Этот предмет уже добавлен для данной группы!")
-                    return ConversationHandler.END
+                exists = await conn.fetchone("SELECT id FROM group_subjects WHERE group_id = ? AND subject_id = ?", (group_id, subject_id))
                 
-                # Связываем предмет с группой
-                cur.execute("INSERT INTO group_subjects (group_id, subject_id) VALUES (?, ?)", (group_id, subject_id))
-                conn.commit()
+                if not exists:
+                    # Связываем предмет с группой
+                    await conn.execute("INSERT INTO group_subjects (group_id, subject_id) VALUES (?, ?)", (group_id, subject_id))
+                    await conn.commit()
+            
+            if exists:
+                await update.message.reply_text("❌ Этот предмет уже добавлен для данной группы!")
+                return ConversationHandler.END
+            
+            invalidate_reference_data()
             
             keyboard = [
                 [InlineKeyboardButton("🔙 К управлению предметами", callback_data='back_to_subjects_management')],
@@ -248,26 +220,19 @@ class SubjectHandlers:
     async def show_groups_for_subject_deletion(self, query):
         """Показать группы для удаления предмета"""
         try:
-            with db_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT id, name FROM groups ORDER BY name")
-                groups = cur.fetchall()
+            reference = await get_reference_data()
+            if reference.groups:
+                keyboard = reference.groups_keyboard('delete_subject_group')
+                keyboard.append(get_back_button('main'))
+                
+                await query.edit_message_text(
+                    "👥 Выберите группу для удаления предмета:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                return DELETE_SUBJECT
+            else:
+                await query.edit_message_text("📝 Группы не найдены")
                 
-                if groups:
-                    keyboard = []
-                    for group in groups:
-                        keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'delete_subject_group_{group["id"]}')])
-                    
-                    keyboard.append(get_back_button('main'))
-                    
-                    await query.edit_message_text(
-                        "👥 Выберите группу для удаления предмета:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                    return DELETE_SUBJECT
-                else:
-                    await query.edit_message_text("📝 Группы не найдены")
-                    
         except Exception as e:
             logger.error(f"Ошибка при получении групп: {e}")
             await query.edit_message_text("❌ Ошибка при загрузке данных")
@@ -277,125 +242,117 @@ class SubjectHandlers:
         query = update.callback_query
         await query.answer()
         
-        if query.data.startswith('delete_subject_group_'):
-            group_id = int(query.data.split('_')[3])
+        select_group = DELETE_SUBJECT_GROUP_ROUTE.match(query.data)
+        select_subject = DELETE_THIS_SUBJECT_ROUTE.match(query.data)
+        confirm = (CONFIRM_DELETE_SUBJECT_ROUTE.match(query.data)
+                   or CONFIRM_DELETE_SUBJECT_WITH_LESSONS_ROUTE.match(query.data))
+        
+        if select_group is not None:
+            group_id = select_group['group_id']
             context.user_data['delete_subject_group_id'] = group_id
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Получаем название группы
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
-                    # Получаем предметы группы
-                    cur.execute("""
-                        SELECT s.id, s.name 
-                        FROM subjects s
-                        JOIN group_subjects gs ON s.id = gs.subject_id
-                        WHERE gs.group_id = ?
-                        ORDER BY s.name
-                    """, (group_id,))
+                reference = await get_reference_data()
+                group_name = reference.group_name(group_id)
+                
+                if reference.subjects_of(group_id):
+                    keyboard = reference.subjects_keyboard(group_id, 'delete_this_subject')
+                    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_subjects_management')])
                     
-                    subjects = cur.fetchall()
+                    await query.edit_message_text(
+                        f"🗑️ Выберите предмет для удаления из группы {group_name}:",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                else:
+                    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data='back_to_subjects_management')]]
+                    await query.edit_message_text(
+                        f"📝 В группе {group_name} нет предметов для удаления",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
                     
-                    if subjects:
-                        keyboard = []
-                        for subject in subjects:
-                            keyboard.append([InlineKeyboardButton(subject['name'], callback_data=f'delete_this_subject_{subject["id"]}')])
-                        
-                        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_subjects_management')])
-                        
-                        await query.edit_message_text(
-                            f"🗑️ Выберите предмет для удаления из группы {group_name}:",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
-                    else:
-                        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data='back_to_subjects_management')]]
-                        await query.edit_message_text(
-                            f"📝 В группе {group_name} нет предметов для удаления",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
-                        
             except Exception as e:
                 logger.error(f"Ошибка при получении предметов: {e}")
                 await query.edit_message_text("❌ Ошибка при загрузке данных")
         
-        elif query.data.startswith('delete_this_subject_'):
-            subject_id = int(query.data.split('_')[2])
+        elif select_subject is not None:
+            subject_id = select_subject['subject_id']
             group_id = context.user_data['delete_subject_group_id']
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Получаем названия
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
-                    cur.execute("SELECT name FROM subjects WHERE id = ?", (subject_id,))
-                    subject_name = cur.fetchone()['name']
-                    
+                # Получаем названия
+                reference = await get_reference_data()
+                group_name = reference.group_name(group_id)
+                subject_name = reference.subject_name(subject_id)
+                
+                async with async_db_connection() as conn:
                     # Проверяем, есть ли занятия по этому предмету в группе
-                    cur.execute("""
+                    lesson_count = (await conn.fetchone("""
                         SELECT COUNT(*) FROM lessons l
                         JOIN group_subjects gs ON l.group_subject_id = gs.id
                         WHERE gs.group_id = ? AND gs.subject_id = ?
-                    """, (group_id, subject_id))
-                    
-                    lesson_count = cur.fetchone()[0]
+                    """, (group_id, subject_id)))[0]
+                
+                if lesson_count > 0:
+                    keyboard = [
+                        [InlineKeyboardButton("✅ Удалить с занятиями", callback_data=f'confirm_delete_subject_with_lessons_{subject_id}')],
+                        [InlineKeyboardButton("❌ Отмена", callback_data='cancel_delete_subject')]
+                    ]
                     
-                    if lesson_count > 0:
-                        keyboard = [
-                            [InlineKeyboardButton("✅ Удалить с занятиями", callback_data=f'confirm_delete_subject_with_lessons_{subject_id}')],
-                            [InlineKeyboardButton("❌ Отмена", callback_data='cancel_delete_subject')]
-                        ]
-                        
-                        await query.edit_message_text(
-                            f"⚠️ По предмету '{subject_name}' в группе {group_name} есть {lesson_count} занятий!\n\n"
-                            f"Вы уверены, что хотите удалить предмет вместе с занятиями?",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
-                    else:
-                        keyboard = [
-                            [InlineKeyboardButton("✅ Да, удалить", callback_data=f'confirm_delete_subject_{subject_id}')],
-                            [InlineKeyboardButton("❌ Нет, отмена", callback_data='cancel_delete_subject')]
-                        ]
-                        
-                        await query.edit_message_text(
-                            f"⚠️ Вы уверены, что хотите удалить предмет '{subject_name}' из группы {group_name}?",
-                            reply_markup=InlineKeyboardMarkup(keyboard)
-                        )
+                    await query.edit_message_text(
+                        f"⚠️ По предмету '{subject_name}' в группе {group_name} есть {lesson_count} занятий!\n\n"
+                        f"Вы уверены, что хотите удалить предмет вместе с занятиями?",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                else:
+                    keyboard = [
+                        [InlineKeyboardButton("✅ Да, удалить", callback_data=f'confirm_delete_subject_{subject_id}')],
+                        [InlineKeyboardButton("❌ Нет, отмена", callback_data='cancel_delete_subject')]
+                    ]
                     
-                    return DELETE_SUBJECT
+                    await query.edit_message_text(
+                        f"⚠️ Вы уверены, что хотите удалить предмет '{subject_name}' из группы {group_name}?",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                
+                return DELETE_SUBJECT
                     
             except Exception as e:
                 logger.error(f"Ошибка при получении данных: {e}")
                 await query.edit_message_text("❌ Ошибка при загрузке данных")
         
-        elif query.data.startswith('confirm_delete_subject_'):
-            subject_id = int(query.data.split('_')[3])
+        elif confirm is not None:
+            subject_id = confirm['subject_id']
             group_id = context.user_data['delete_subject_group_id']
             
             try:
-                with db_connection() as conn:
-                    cur = conn.cursor()
-                    
-                    # Получаем названия
-                    cur.execute("SELECT name FROM groups WHERE id = ?", (group_id,))
-                    group_name = cur.fetchone()['name']
-                    
-                    cur.execute("SELECT name FROM subjects WHERE id = ?", (subject_id,))
-                    subject_name = cur.fetchone()['name']
+                # Получаем названия
+                reference = await get_reference_data()
+                group_name = reference.group_name(group_id)
+                subject_name = reference.subject_name(subject_id)
+                
+                async with async_db_connection() as conn:
+                    # Удаляем занятия и отметки по предмету (foreign_keys = ON)
+                    await conn.execute("""
+                        DELETE FROM attendance WHERE lesson_id IN (
+                            SELECT l.id FROM lessons l
+                            JOIN group_subjects gs ON l.group_subject_id = gs.id
+                            WHERE gs.group_id = ? AND gs.subject_id = ?
+                        )
+                    """, (group_id, subject_id))
+                    await conn.execute("""
+                        DELETE FROM lessons WHERE group_subject_id IN (
+                            SELECT id FROM group_subjects WHERE group_id = ? AND subject_id = ?
+                        )
+                    """, (group_id, subject_id))
                     
                     # Удаляем связь предмета с группой
-                    cur.execute("""
+                    await conn.execute("""
                         DELETE FROM group_subjects 
                         WHERE group_id = ? AND subject_id = ?
                     """, (group_id, subject_id))
                     
-                    conn.commit()
+                    await conn.commit()
+                invalidate_reference_data()
                 
                 keyboard = [
                     [InlineKeyboardButton("🔙 К управлению предметами", callback_data='back_to_subjects_management')],
@@ -0,0 +1,411 @@
+import argparse
+import csv
+import hashlib
+import io
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+from openpyxl import load_workbook
+from config import IMPORT_CHUNK_SIZE, INGEST_BATCH_SIZE
+from database import _connect, init_database
+from attendance_session import UPSERT_ATTENDANCE_SQL
+
+logger = logging.getLogger(__name__)
+
+# Заголовки колонок, которые распознаются в первой строке файла
+NAME_HEADERS = {'фио', 'full_name', 'name', 'студент', 'имя'}
+GROUP_HEADERS = {'группа', 'group', 'group_name'}
+
+class ImportFileError(Exception):
+    """Файл импорта не удалось прочитать"""
+
+def _normalize(value):
+    """Привести ФИО или название группы к виду для сравнения"""
+    return ' '.join(str(value).split()) if value is not None else ''
+
+def _iter_csv_rows(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from csv.reader(text, dialect)
+    finally:
+        text.detach()
+
+def _iter_xlsx_rows(file):
+    # read_only: строки читаются из архива по мере обхода, без загрузки всего листа
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def iter_table_rows(file, filename):
+    """Строки таблицы из CSV или XLSX файла (потоково)"""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return _iter_csv_rows(file)
+    if name.endswith('.xlsx'):
+        return _iter_xlsx_rows(file)
+    raise ImportFileError("Поддерживаются только файлы .csv и .xlsx")
+
+def read_roster(file, filename):
+    """Прочитать список (ФИО, группа); вернуть (записи без повторов, число пропущенных строк).
+
+    Тезки в разных группах - разные студенты; повтор той же пары (ФИО, группа)
+    считается одной записью.
+    """
+    entries = {}
+    skipped = 0
+    try:
+        for number, row in enumerate(iter_table_rows(file, filename)):
+            cells = [_normalize(cell) for cell in (row or ())][:2]
+            if number == 0 and len(cells) == 2 and cells[0].lower() in NAME_HEADERS and cells[1].lower() in GROUP_HEADERS:
+                continue
+            if len(cells) < 2 or not cells[0] or not cells[1]:
+                skipped += 1
+                continue
+            entries[(cells[0], cells[1])] = None
+    except ImportFileError:
+        raise
+    except Exception as e:
+        raise ImportFileError(f"Не удалось прочитать файл: {e}")
+
+    return list(entries), skipped
+
+def _chunks(items, size=IMPORT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def diff_roster(conn, entries):
+    """Сравнить файл со списком студентов в БД.
+
+    Студент определяется по ФИО и группе: сначала записи файла сопоставляются
+    со студентами той же группы. Если ФИО остается без пары ровно у одной
+    записи файла и одного студента БД, студент переводится в группу из
+    файла; иначе (тезки) записи файла добавляются как новые студенты.
+    Удаляются только студенты групп, упомянутых в файле, оставшиеся без пары.
+    """
+    groups = {_normalize(row['name']): row['id'] for row in conn.execute("SELECT id, name FROM groups")}
+    students = {}
+    for row in conn.execute("SELECT id, full_name, group_id, telegram_id FROM students"):
+        students.setdefault((_normalize(row['full_name']), row['group_id']), []).append(row)
+
+    new_groups = sorted({group for _, group in entries if group not in groups})
+    file_groups = {groups.get(group) for _, group in entries} - {None}
+
+    # Студенты, уже найденные в своей группе
+    unchanged, unmatched = 0, {}
+    for full_name, group in entries:
+        rows = students.get((full_name, groups[group])) if group in groups else None
+        if rows:
+            rows.pop(0)
+            unchanged += 1
+        else:
+            unmatched.setdefault(full_name, []).append(group)
+
+    # Оставшиеся без пары студенты БД по ФИО
+    candidates = {}
+    for (full_name, _), rows in students.items():
+        candidates.setdefault(full_name, []).extend(rows)
+
+    inserts, moves = [], []
+    for full_name, name_groups in unmatched.items():
+        rows = candidates.get(full_name, [])
+        if len(name_groups) == 1 and len(rows) == 1:
+            moves.append((full_name, name_groups[0], rows.pop()['id']))
+        else:
+            inserts.extend((full_name, group) for group in name_groups)
+
+    removals = [row for rows in candidates.values() for row in rows if row['group_id'] in file_groups]
+
+    return {
+        'new_groups': new_groups,
+        'inserts': inserts,
+        'moves': moves,
+        'removals': removals,
+        'unchanged': unchanged,
+    }
+
+def apply_roster_import(conn, entries, remove_missing=False):
+    """Применить список к БД пачками по IMPORT_CHUNK_SIZE в отдельных транзакциях.
+
+    Различия считаются заново, чтобы учесть изменения после предпросмотра.
+    Студенты, которых нет в файле, удаляются (вместе с историей посещаемости)
+    только при remove_missing=True.
+    Возвращает сводку и telegram_id удаленных студентов (для сброса кэша ролей).
+    """
+    started = time.perf_counter()
+    diff = diff_roster(conn, entries)
+
+    if diff['new_groups']:
+        conn.executemany("INSERT OR IGNORE INTO groups (name) VALUES (?)", [(name,) for name in diff['new_groups']])
+        conn.commit()
+    groups = {_normalize(row['name']): row['id'] for row in conn.execute("SELECT id, name FROM groups")}
+
+    for chunk in _chunks(diff['inserts']):
+        conn.executemany(
+            "INSERT INTO students (full_name, group_id) VALUES (?, ?)",
+            [(full_name, groups[group]) for full_name, group in chunk]
+        )
+        conn.commit()
+
+    for chunk in _chunks(diff['moves']):
+        conn.executemany(
+            "UPDATE students SET group_id = ? WHERE id = ?",
+            [(groups[group], student_id) for _, group, student_id in chunk]
+        )
+        conn.commit()
+
+    removed_telegram_ids = []
+    removals = diff['removals'] if remove_missing else []
+    for chunk in _chunks(removals):
+        ids = [(row['id'],) for row in chunk]
+        # Сначала удаляем зависимые записи (foreign_keys = ON)
+        conn.executemany("DELETE FROM attendance WHERE student_id = ?", ids)
+        conn.executemany("DELETE FROM students WHERE id = ?", ids)
+        conn.commit()
+        removed_telegram_ids.extend(row['telegram_id'] for row in chunk if row['telegram_id'])
+
+    summary = {
+        'groups_created': len(diff['new_groups']),
+        'inserted': len(diff['inserts']),
+        'moved': len(diff['moves']),
+        'removed': len(removals),
+        'unchanged': diff['unchanged'],
+        'seconds': time.perf_counter() - started,
+    }
+    logger.info(f"Импорт списка студентов: {summary}")
+    return summary, removed_telegram_ids
+
+# --- Загрузка архива посещаемости
+
+# Строка файла: ФИО, группа, предмет, дата, статус
+STATUS_ALIASES = {
+    'present': 'present', 'присутствовал': 'present', 'был': 'present', '+': 'present', '1': 'present', 'п': 'present',
+    'absent': 'absent', 'отсутствовал': 'absent', 'не был': 'absent', '-': 'absent', '0': 'absent', 'н': 'absent',
+    'late': 'late', 'опоздал': 'late', 'о': 'late', 'оп': 'late',
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y')
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.isoformat()
+    text = _normalize(value)
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _load_lookups(conn):
+    """Справочники для сопоставления строк файла с БД"""
+    groups = {_normalize(row['name']): row['id'] for row in conn.execute("SELECT id, name FROM groups")}
+    students = {
+        (row['group_id'], _normalize(row['full_name'])): row['id']
+        for row in conn.execute("SELECT id, full_name, group_id FROM students")
+    }
+    subjects = {
+        (row['group_id'], _normalize(row['name']).lower()): row['id']
+        for row in conn.execute("""
+            SELECT gs.id, gs.group_id, s.name
+            FROM group_subjects gs
+            JOIN subjects s ON gs.subject_id = s.id
+        """)
+    }
+    return groups, students, subjects
+
+def _write_attendance_batches(conn, job_id, batches, result):
+    """Единственный писатель: создает занятия и записывает отметки пачками.
+
+    Каждая пачка вместе с отметкой о прогрессе задания - одна транзакция.
+    """
+    lessons = {}  # (group_subject_id, дата) -> id занятия
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        if result.get('error'):
+            continue  # дочитываем очередь, чтобы читатель не заблокировался
+
+        rows, rows_done, skipped = batch
+        try:
+            missing = list({(gs_id, lesson_date) for _, gs_id, lesson_date, _ in rows} - lessons.keys())
+            if missing:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO lessons (group_subject_id, date) VALUES (?, ?)", missing
+                )
+                for key in missing:
+                    lessons[key] = conn.execute(
+                        "SELECT id FROM lessons WHERE group_subject_id = ? AND date = ?", key
+                    ).fetchone()[0]
+
+            conn.executemany(
+                UPSERT_ATTENDANCE_SQL,
+                [(student_id, lessons[(gs_id, lesson_date)], status) for student_id, gs_id, lesson_date, status in rows]
+            )
+            conn.execute("""
+                UPDATE import_jobs
+                SET rows_done = ?, rows_written = rows_written + ?, rows_skipped = rows_skipped + ?
+                WHERE id = ?
+            """, (rows_done, len(rows), skipped, job_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            result['error'] = e
+            continue
+
+        result['written'] += len(rows)
+        result['rows_done'] = rows_done
+        elapsed = time.perf_counter() - result['started']
+        logger.info(f"Записано {result['written']} отметок, {result['written'] / elapsed:.0f} строк/с")
+
+def ingest_attendance(path, batch_size=INGEST_BATCH_SIZE):
+    """Загрузить архив посещаемости из CSV/XLSX файла; вернуть сводку.
+
+    Файл читается потоково, строки сопоставляются со студентами и предметами
+    групп, недостающие занятия создаются, отметки записываются пачками одним
+    потоком-писателем. Повторный запуск с тем же файлом продолжает прерванное
+    задание с последней записанной пачки.
+    """
+    file_hash = _file_hash(path)
+    conn = _connect()
+    try:
+        job = conn.execute(
+            "SELECT id, status, rows_done FROM import_jobs WHERE kind = 'attendance' AND file_hash = ?", (file_hash,)
+        ).fetchone()
+        if job is not None and job['status'] == 'done':
+            logger.info(f"Файл {path} уже загружен (задание {job['id']})")
+            return {'job_id': job['id'], 'status': 'done', 'written': 0, 'skipped': Counter(), 'rows_per_second': 0.0}
+
+        if job is None:
+            job_id = conn.execute(
+                "INSERT INTO import_jobs (kind, file_name, file_hash, status) VALUES ('attendance', ?, ?, 'running')",
+                (str(path), file_hash)
+            ).lastrowid
+            resume_from = 0
+        else:
+            job_id, resume_from = job['id'], job['rows_done']
+            conn.execute("UPDATE import_jobs SET status = 'running', error = NULL WHERE id = ?", (job_id,))
+            logger.info(f"Продолжение задания {job_id} со строки {resume_from}")
+        conn.commit()
+
+        groups, students, subjects = _load_lookups(conn)
+
+        result = {'written': 0, 'rows_done': resume_from, 'error': None, 'started': time.perf_counter()}
+        # Ограниченная очередь: читатель не уходит далеко вперед писателя
+        batches = queue.Queue(maxsize=4)
+        writer = threading.Thread(
+            target=_write_attendance_batches, args=(conn, job_id, batches, result), name='ingest-writer'
+        )
+        writer.start()
+
+        skipped = Counter()
+        rows, batch_skipped, number = [], 0, 0
+        try:
+            with open(path, 'rb') as f:
+                for number, row in enumerate(iter_table_rows(f, str(path)), start=1):
+                    if number <= resume_from:
+                        continue
+                    if result['error']:
+                        break
+
+                    cells = [_normalize(cell) if i != 3 else cell for i, cell in enumerate((row or ())[:5])]
+                    if len(cells) < 5 or not cells[0]:
+                        reason = 'пустая строка'
+                    elif number == 1 and _parse_date(cells[3]) is None:
+                        reason = 'заголовок'
+                    else:
+                        full_name, group, subject, lesson_date, status = cells
+                        group_id = groups.get(group)
+                        student_id = students.get((group_id, full_name))
+                        gs_id = subjects.get((group_id, subject.lower()))
+                        lesson_date = _parse_date(lesson_date)
+                        status = STATUS_ALIASES.get(status.lower())
+                        if student_id is None:
+                            reason = 'студент не найден'
+                        elif gs_id is None:
+                            reason = 'предмет группы не найден'
+                        elif lesson_date is None:
+                            reason = 'неверная дата'
+                        elif status is None:
+                            reason = 'неверный статус'
+                        else:
+                            reason = None
+                            rows.append((student_id, gs_id, lesson_date, status))
+
+                    if reason:
+                        skipped[reason] += 1
+                        batch_skipped += 1
+
+                    if len(rows) >= batch_size:
+                        batches.put((rows, number, batch_skipped))
+                        rows, batch_skipped = [], 0
+
+            if (rows or batch_skipped) and not result['error']:
+                batches.put((rows, number, batch_skipped))
+        finally:
+            batches.put(None)
+            writer.join()
+
+        elapsed = time.perf_counter() - result['started']
+        if result['error']:
+            conn.execute(
+                "UPDATE import_jobs SET status = 'failed', error = ? WHERE id = ?", (str(result['error']), job_id)
+            )
+            conn.commit()
+            raise result['error']
+
+        conn.execute(
+            "UPDATE import_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,)
+        )
+        conn.commit()
+
+        summary = {
+            'job_id': job_id,
+            'status': 'done',
+            'written': result['written'],
+            'skipped': skipped,
+            'rows_per_second': result['written'] / elapsed if elapsed > 0 else 0.0,
+        }
+        logger.info(f"Загрузка посещаемости завершена: {summary}")
+        return summary
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт данных из файлов')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    attendance_parser = subparsers.add_parser(
+        'attendance', help='архив посещаемости: ФИО, группа, предмет, дата, статус'
+    )
+    attendance_parser.add_argument('path')
+    attendance_parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    init_database()
+    summary = ingest_attendance(args.path, args.batch_size)
+    print(f"Записано отметок: {summary['written']} ({summary['rows_per_second']:.0f} строк/с)")
+    for reason, count in summary['skipped'].most_common():
+        print(f"Пропущено ({reason}): {count}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
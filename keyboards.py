@@ -1,5 +1,5 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from database import db_connection
+from reference_cache import get_reference_data
 
 def get_student_keyboard():
     """Клавиатура для студента"""
@@ -7,6 +7,7 @@ def get_student_keyboard():
         [InlineKeyboardButton("📊 Моя посещаемость", callback_data='my_attendance')],
         [InlineKeyboardButton("📚 Полезные материалы", callback_data='materials')],
         [InlineKeyboardButton("📅 Мое расписание", callback_data='schedule')],
+        [InlineKeyboardButton("🔔 Уведомления о пропусках", callback_data='absence_notifications')],
         [InlineKeyboardButton("❓ Помощь", callback_data='help')],
         [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
     ]
@@ -26,25 +27,17 @@ def get_admin_keyboard(role):
     
     if role == 'admin':
         keyboard.insert(4, [InlineKeyboardButton("💬 Управление чатами", callback_data='manage_chats')])
+        keyboard.insert(5, [InlineKeyboardButton("📣 Рассылка", callback_data='broadcast')])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_groups_keyboard(prefix='group'):
-    """Клавиатура со списком групп"""
-    keyboard = []
+async def get_groups_keyboard(prefix='group'):
+    """Клавиатура со списком групп (из кэша справочников)"""
     try:
-        with db_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id, name FROM groups ORDER BY name")
-            groups = cur.fetchall()
-            
-            for group in groups:
-                keyboard.append([InlineKeyboardButton(group['name'], callback_data=f'{prefix}_{group["id"]}')])
-                
+        return (await get_reference_data()).groups_keyboard(prefix)
     except Exception as e:
         print(f"Ошибка получения групп: {e}")
-    
-    return keyboard
+        return []
 
 def get_back_button(target='main'):
     """Кнопка назад"""
@@ -53,4 +46,53 @@ def get_back_button(target='main'):
 
 def get_main_menu_button():
     """Кнопка главного меню"""
-    return [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
\ No newline at end of file
+    return [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_main')]
+
+def get_page_navigation_row(page, pages, prefix):
+    """Ряд навигации по страницам: назад, индикатор, вперед"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️", callback_data=f'{prefix}_{page - 1}'))
+    row.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f'{prefix}_{page}'))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶️", callback_data=f'{prefix}_{page + 1}'))
+    return row
+
+REPORT_FORMAT_LABELS = {
+    'xlsx': "📊 Excel",
+    'xlsx_detail': "📋 Excel с детальной посещаемостью",
+    'csv': "🗜 CSV (gzip)",
+    'parquet': "📦 Parquet",
+    'text': "📝 Текстом в чате",
+}
+
+def get_report_format_keyboard(group_id, start_date_str, end_date_str, formats, exclude=None):
+    """Выбор формата отчета по группе за период"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            REPORT_FORMAT_LABELS[report_format],
+            callback_data=f'report_format_{group_id}_{start_date_str}_{end_date_str}_{report_format}'
+        )]
+        for report_format in formats if report_format != exclude
+    ])
+
+STATUS_ICONS = {'present': '✅', 'absent': '❌', 'late': '⏰'}
+
+def get_attendance_exception_rows(student_id, full_name, status):
+    """Компактный ряд для режима исключений: нажатие на имя переключает статус"""
+    status_icon = STATUS_ICONS.get(status, '⚪')
+    return [
+        [InlineKeyboardButton(f"{status_icon} {full_name}", callback_data=f'student_{student_id}')]
+    ]
+
+def get_attendance_student_rows(student_id, full_name, status):
+    """Ряды клавиатуры отметки для одного студента: имя со статусом и кнопки статусов"""
+    status_icon = STATUS_ICONS.get(status, '⚪')
+    return [
+        [InlineKeyboardButton(f"{status_icon} {full_name}", callback_data=f'student_{student_id}')],
+        [
+            InlineKeyboardButton("✅ Присутствовал", callback_data=f'mark_present_{student_id}'),
+            InlineKeyboardButton("❌ Отсутствовал", callback_data=f'mark_absent_{student_id}'),
+            InlineKeyboardButton("⏰ Опоздал", callback_data=f'mark_late_{student_id}')
+        ]
+    ]
\ No newline at end of file
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import signal
 from telegram import Update
 from telegram.ext import (
     Application, 
@@ -7,22 +9,34 @@ from telegram.ext import (
     ContextTypes, 
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters
 )
-from database import init_database
-from config import BOT_TOKEN, GENERATE_REPORT, SELECT_REPORT_DATE_RANGE, SELECT_REPORT_GROUP
-from handlers.base import BaseHandlers
+from database import init_database, unit_of_work
+from reports import report_service
+from webhook import WebhookServer
+from callback_router import callback_router
+from persistence import SQLitePersistence
+from outbox import outbox
+from notifications import absence_notifier
+from config import BOT_TOKEN, GENERATE_REPORT, SELECT_REPORT_DATE_RANGE, SELECT_REPORT_GROUP, ATTENDANCE_SESSION_TIMEOUT
+from config import (
+    TELEGRAM_API_URL, BOT_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL
+)
+from handlers.base import BaseHandlers, show_main_menu
 from handlers.admin import AdminHandlers
 from handlers.student import StudentHandlers
 from handlers.group import GroupHandlers
 from handlers.subject import SubjectHandlers
 from handlers.attendance import AttendanceHandlers
+from handlers.broadcast import BroadcastHandlers
 from config import (
     MANAGE_STUDENTS, ADD_STUDENT_NAME, ADD_STUDENT_GROUP, EDIT_STUDENT_SELECT, DELETE_STUDENT,
     REGISTER_NAME, REGISTER_GROUP, MANAGE_GROUPS, ADD_GROUP_NAME, EDIT_GROUP_SELECT,
     EDIT_GROUP_NAME, DELETE_GROUP, SELECT_GROUP_ATTENDANCE, SELECT_SUBJECT_ATTENDANCE,
     SELECT_DATE_ATTENDANCE, MARK_STUDENTS_ATTENDANCE, MANAGE_SUBJECTS,
-    ADD_SUBJECT_NAME, SELECT_GROUP_FOR_SUBJECT, DELETE_SUBJECT
+    ADD_SUBJECT_NAME, SELECT_GROUP_FOR_SUBJECT, DELETE_SUBJECT, IMPORT_STUDENTS_FILE, IMPORT_STUDENTS_CONFIRM,
+    BROADCAST_SELECT_TARGET, BROADCAST_TEXT, BROADCAST_CONFIRM
 )
 
 # Настройка логирования
@@ -32,16 +46,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class UniHelperApplication(Application):
+    """Application, в котором запросы к БД одного апдейта идут через одно соединение.
+
+    Фоновые задачи бота запускаются и останавливаются вместе с приложением,
+    поэтому в режимах polling и webhook жизненный цикл одинаковый.
+    """
+
+    async def initialize(self):
+        await super().initialize()
+        outbox.start(self.job_queue)
+
+    async def shutdown(self):
+        await super().shutdown()
+        await absence_notifier.shutdown()
+        report_service.shutdown()
+
+    async def process_update(self, update):
+        async with unit_of_work():
+            await super().process_update(update)
+
 class UniHelperBot:
     def __init__(self, token):
         self.token = token
-        self.application = Application.builder().token(token).build()
+        builder = (
+            Application.builder()
+            .token(token)
+            .application_class(UniHelperApplication)
+            .persistence(SQLitePersistence())
+        )
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        self.application = builder.build()
+        self.webhook_server = None  # WebhookServer в режиме webhook
         self.base_handlers = BaseHandlers()
         self.admin_handlers = AdminHandlers()
         self.student_handlers = StudentHandlers()
         self.group_handlers = GroupHandlers()
         self.subject_handlers = SubjectHandlers()
         self.attendance_handlers = AttendanceHandlers()
+        self.broadcast_handlers = BroadcastHandlers()
 
     def setup_handlers(self):
         """Настройка обработчиков команд"""
@@ -50,6 +94,8 @@ class UniHelperBot:
             self.application.add_handler(CommandHandler("start", self.base_handlers.start))
             self.application.add_handler(CommandHandler("help", self.base_handlers.help_command))
             self.application.add_handler(CommandHandler("cancel", self.base_handlers.cancel))
+            self.application.add_handler(CommandHandler("stats", self.base_handlers.stats_command))
+            self.application.add_handler(CommandHandler("rebuild_stats", self.base_handlers.rebuild_stats_command))
             
             # 2. ConversationHandler для регистрации студентов
             student_registration_handler = ConversationHandler(
@@ -59,6 +105,8 @@ class UniHelperBot:
                     REGISTER_GROUP: [CallbackQueryHandler(self.student_handlers.register_student_group, pattern='^register_group_|^cancel_register$')]
                 },
                 fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                name='student_registration',
+                persistent=True,
                 per_message=False
             )
             self.application.add_handler(student_registration_handler)
@@ -71,9 +119,13 @@ class UniHelperBot:
                     ADD_STUDENT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.admin_handlers.add_student_name)],
                     ADD_STUDENT_GROUP: [CallbackQueryHandler(self.admin_handlers.add_student_group, pattern='^group_|^cancel_add$')],
                     EDIT_STUDENT_SELECT: [CallbackQueryHandler(self.admin_handlers.edit_student_select, pattern='^edit_|^back_to_management$')],
-                    DELETE_STUDENT: [CallbackQueryHandler(self.admin_handlers.delete_student_confirm, pattern='^delete_|^confirm_delete_|^cancel_delete$')]
+                    DELETE_STUDENT: [CallbackQueryHandler(self.admin_handlers.delete_student_confirm, pattern='^delete_|^confirm_delete_|^cancel_delete$')],
+                    IMPORT_STUDENTS_FILE: [MessageHandler(filters.Document.ALL, self.admin_handlers.import_students_file)],
+                    IMPORT_STUDENTS_CONFIRM: [CallbackQueryHandler(self.admin_handlers.import_students_confirm, pattern='^confirm_import|^cancel_import$')]
                 },
                 fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                name='student_management',
+                persistent=True,
                 per_message=False
             )
             self.application.add_handler(student_management_handler)
@@ -89,6 +141,8 @@ class UniHelperBot:
                     DELETE_GROUP: [CallbackQueryHandler(self.group_handlers.delete_group_confirm, pattern='^delete_group_|^confirm_delete_group_|^cancel_delete_group$')]
                 },
                 fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                name='group_management',
+                persistent=True,
                 per_message=False
             )
             self.application.add_handler(group_management_handler)
@@ -103,6 +157,8 @@ class UniHelperBot:
                     DELETE_SUBJECT: [CallbackQueryHandler(self.subject_handlers.delete_subject_confirm, pattern='^delete_subject_group_|^delete_this_subject_|^confirm_delete_subject_|^cancel_delete_subject$')]
                 },
                 fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                name='subject_management',
+                persistent=True,
                 per_message=False
             )
             self.application.add_handler(subject_management_handler)
@@ -117,9 +173,13 @@ class UniHelperBot:
                         CallbackQueryHandler(self.attendance_handlers.select_date_attendance, pattern='^attendance_date_|^enter_date_manually$'),
                         MessageHandler(filters.TEXT & ~filters.COMMAND, self.attendance_handlers.enter_date_manually)
                     ],
-                    MARK_STUDENTS_ATTENDANCE: [CallbackQueryHandler(self.attendance_handlers.mark_student_attendance, pattern='^mark_|^save_attendance$')]
+                    MARK_STUDENTS_ATTENDANCE: [CallbackQueryHandler(self.attendance_handlers.mark_student_attendance, pattern='^mark_|^student_|^attendance_page_|^save_attendance$|^back_to_main$')],
+                    ConversationHandler.TIMEOUT: [TypeHandler(Update, self.attendance_handlers.attendance_timeout)]
                 },
                 fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                conversation_timeout=ATTENDANCE_SESSION_TIMEOUT,
+                name='attendance_marking',
+                persistent=True,
                 per_message=False
             )
             self.application.add_handler(attendance_marking_handler)
@@ -128,21 +188,39 @@ class UniHelperBot:
             report_generation_handler = ConversationHandler(
                 entry_points=[CallbackQueryHandler(self.attendance_handlers.generate_report, pattern='^generate_report$')],
                 states={ 
-                    SELECT_REPORT_GROUP: [CallbackQueryHandler(self.attendance_handlers.select_report_group, pattern='^report_group_')],
+                    SELECT_REPORT_GROUP: [CallbackQueryHandler(self.attendance_handlers.select_report_group, pattern='^report_group_|^back_to_main$')],
                     SELECT_REPORT_DATE_RANGE: [
-                        CallbackQueryHandler(self.attendance_handlers.select_report_date_range, pattern='^report_period_'),
+                        CallbackQueryHandler(self.attendance_handlers.select_report_date_range, pattern='^report_period_|^back_to_main$'),
                         MessageHandler(filters.TEXT & ~filters.COMMAND, self.attendance_handlers.enter_custom_date_range)
                     ],
                     GENERATE_REPORT: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.attendance_handlers.generate_final_report)]
                 },
                 fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                name='report_generation',
+                persistent=True,
                 per_message=False
             )
 
             self.application.add_handler(report_generation_handler)
             
-            # 8. Общий обработчик кнопок (должен быть последним)
-            self.application.add_handler(CallbackQueryHandler(self.simple_button_handler))
+            # 8. ConversationHandler для рассылки
+            broadcast_handler = ConversationHandler(
+                entry_points=[CallbackQueryHandler(self.broadcast_handlers.start_broadcast, pattern='^broadcast$')],
+                states={
+                    BROADCAST_SELECT_TARGET: [CallbackQueryHandler(self.broadcast_handlers.select_broadcast_target, pattern='^broadcast_group_|^back_to_main$')],
+                    BROADCAST_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.broadcast_handlers.enter_broadcast_text)],
+                    BROADCAST_CONFIRM: [CallbackQueryHandler(self.broadcast_handlers.confirm_broadcast, pattern='^confirm_broadcast$|^cancel_broadcast$')]
+                },
+                fallbacks=[CommandHandler('cancel', self.base_handlers.cancel)],
+                name='broadcast',
+                persistent=True,
+                per_message=False
+            )
+            self.application.add_handler(broadcast_handler)
+            
+            # 9. Кнопки вне диалогов - через таблицу маршрутов (должен быть последним)
+            self.setup_callback_routes()
+            self.application.add_handler(CallbackQueryHandler(self.route_callback))
             
             logger.info("Все обработчики успешно настроены")
             
@@ -150,59 +228,116 @@ class UniHelperBot:
             logger.error(f"Ошибка при настройке обработчиков: {e}")
             raise
 
-    async def simple_button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик простых кнопок"""
-        query = update.callback_query
-        await query.answer()
-        
-        data = query.data
+    def setup_callback_routes(self):
+        """Таблица маршрутов кнопок вне диалогов (строится один раз при запуске)"""
+        routes = callback_router
         
         # Основные кнопки меню
-        if data == 'my_attendance':
-            await self.attendance_handlers.show_my_attendance(query)
-        elif data == 'materials':
-            await query.edit_message_text("📚 Полезные материалы будут добавлены позже")
-        elif data == 'schedule':
-            await query.edit_message_text("📅 Расписание будет доступно soon")
-        elif data == 'help':
-            await query.edit_message_text("❓ Помощь по боту будет доступна soon")
+        routes.add('my_attendance', self.query_route(self.attendance_handlers.show_my_attendance))
+        routes.add('materials', self.text_route("📚 Полезные материалы будут добавлены позже"))
+        routes.add('schedule', self.text_route("📅 Расписание будет доступно soon"))
+        routes.add('absence_notifications', self.query_route(self.student_handlers.toggle_absence_notifications))
+        routes.add('help', self.text_route("❓ Помощь по боту будет доступна soon"))
         
         # Кнопки админ-меню
-        elif data == 'generate_report':
-            await self.attendance_handlers.generate_report(update, context)
-        elif data == 'chat_management':
-            await query.edit_message_text("👥 Управление чатом - функция в разработке")
-        elif data == 'manage_chats':
-            await query.edit_message_text("💬 Управление чатами - доступно только админам")
+        routes.add('chat_management', self.text_route("👥 Управление чатом - функция в разработке"))
+        routes.add('manage_chats', self.text_route("💬 Управление чатами - доступно только админам"))
         
-        # Кнопки навигации
-        elif data == 'back_to_main':  
-            await self.base_handlers.back_to_main_menu(query)
-        elif data == 'back_to_management':
-            await self.base_handlers.back_to_management(query)
-        elif data == 'back_to_groups_management':
-            await self.base_handlers.back_to_groups_management(query)
-        elif data == 'back_to_subjects_management':
-            await self.base_handlers.back_to_subjects_management(query)
+        # Кнопки навигации: меню открываются уже созданными обработчиками
+        routes.add('back_to_main', self.query_route(show_main_menu))
+        routes.add('back_to_management', self.admin_handlers.start_student_management)
+        routes.add('back_to_groups_management', self.group_handlers.start_group_management)
+        routes.add('back_to_subjects_management', self.subject_handlers.start_subject_management)
         
-        # Кнопки управления предметами
-        elif data.startswith('list_subjects_group_'):
-            await self.subject_handlers.show_subjects_for_group(query)
+        # Кнопки с параметрами
+        routes.add('list_subjects_group_{group_id:int}', self.query_route(self.subject_handlers.show_subjects_for_group))
+        routes.add(
+            'report_format_{group_id:int}_{start_date_str}_{end_date_str}_{report_format}',
+            self.attendance_handlers.generate_report_in_format
+        )
         
         # Кнопки, которые обрабатываются ConversationHandler
-        elif data in ['start_attendance', 'manage_students', 'manage_groups', 'manage_subjects', 'register_student']:
-            await query.answer("Обработка запроса...")
-        elif data == 'generate_report':
-            await query.answer("Начинаем генерацию отчета...")
+        for data in ['start_attendance', 'manage_students', 'manage_groups', 'manage_subjects', 'register_student', 'broadcast']:
+            routes.add(data, self.answer_route("Обработка запроса..."), name='conversation_entry')
         
-        else:
+        routes.compile()
+
+    @staticmethod
+    def query_route(handler):
+        """Маршрут для обработчика вида handler(query, **поля)"""
+        async def route(update, context, **fields):
+            await update.callback_query.answer()
+            await handler(update.callback_query, **fields)
+        return route
+
+    @staticmethod
+    def text_route(text):
+        """Маршрут, показывающий постоянный текст"""
+        async def route(update, context):
+            await update.callback_query.answer()
+            await update.callback_query.edit_message_text(text)
+        return route
+
+    @staticmethod
+    def answer_route(text):
+        """Маршрут, только отвечающий на нажатие"""
+        async def route(update, context):
+            await update.callback_query.answer(text)
+        return route
+
+    async def route_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик кнопок вне диалогов"""
+        if not await callback_router.dispatch(update, context):
+            query = update.callback_query
+            await query.answer()
             await query.edit_message_text("❌ Неизвестная команда")
 
     def run(self):
         """Запуск бота"""
         logger.info("Бот запускается...")
         init_database()
-        self.application.run_polling()
+        if BOT_MODE == 'webhook':
+            asyncio.run(self.run_webhook())
+        else:
+            self.application.run_polling()
+
+    async def run_webhook(self, stop=None):
+        """Запуск в режиме webhook со встроенным HTTP сервером.
+
+        Работает до события stop (по умолчанию - до SIGINT/SIGTERM).
+        """
+        loop = asyncio.get_running_loop()
+        if stop is None:
+            stop = asyncio.Event()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop.set)
+                except NotImplementedError:
+                    # Windows: остановка по Ctrl+C через KeyboardInterrupt
+                    pass
+        
+        self.webhook_server = server = WebhookServer(
+            self.application, loop, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+        )
+        try:
+            # initialize()/shutdown() - как в run_polling, start()/stop() - прием апдейтов
+            async with self.application:
+                await self.application.start()
+                try:
+                    server.start()
+                    if WEBHOOK_URL:
+                        # Все экземпляры за балансировщиком регистрируют один и тот же адрес
+                        await self.application.bot.set_webhook(
+                            url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES
+                        )
+                    server.ready = True
+                    logger.info("Бот запущен в режиме webhook")
+                    await stop.wait()
+                finally:
+                    server.ready = False
+                    await self.application.stop()
+        finally:
+            server.stop()
 
 if __name__ == "__main__":
     bot = UniHelperBot(BOT_TOKEN)
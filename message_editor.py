@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+from telegram.error import RetryAfter, BadRequest, TelegramError
+from utils import retry_after_seconds
+from config import EDIT_COALESCE_WINDOW, EDIT_STATE_SIZE, EDIT_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+def _digest(text, reply_markup):
+    """Хэш того, что видит пользователь: текст и клавиатура"""
+    markup = json.dumps(reply_markup.to_dict(), ensure_ascii=False, sort_keys=True) if reply_markup else ''
+    return hashlib.blake2b(f'{text}\0{markup}'.encode(), digest_size=16).digest()
+
+class _EditState:
+    __slots__ = ('sent_digest', 'sent_at', 'pending', 'task')
+
+    def __init__(self):
+        self.sent_digest = None  # хэш последней отправленной правки
+        self.sent_at = float('-inf')  # time.monotonic() последней отправки
+        self.pending = None  # (bot, текст, клавиатура, хэш) - последняя еще не отправленная правка
+        self.task = None
+
+class MessageEditor:
+    """Правки сообщений с клавиатурой, сливаемые по времени.
+
+    edit() не ждет Telegram: первая правка уходит сразу, а правки того же
+    сообщения в течение window секунд после нее заменяют друг друга, и
+    отправляется только последняя. Правка, совпадающая с уже показанным
+    (хэш текста и клавиатуры), не отправляется. На RetryAfter отправка
+    откладывается на указанное Telegram время, ответ "message is not
+    modified" считается успешной правкой. Итоговое сообщение вместо экрана
+    (сохранение, ошибка) отправляется edit_now(): оно отменяет отложенные
+    правки и не может быть затерто ими.
+    """
+
+    def __init__(self, window=EDIT_COALESCE_WINDOW, max_messages=EDIT_STATE_SIZE):
+        self.window = window
+        self.max_messages = max_messages
+        self._states = OrderedDict()  # (chat_id, message_id) -> _EditState
+        self.counters = Counter()
+
+    def _state(self, key):
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _EditState()
+            if len(self._states) > self.max_messages:
+                self._evict()
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    def _evict(self):
+        for key in list(self._states)[:len(self._states) - self.max_messages]:
+            state = self._states[key]
+            if state.task is None or state.task.done():
+                del self._states[key]
+
+    def edit(self, message, text, reply_markup=None):
+        """Запланировать правку текста и клавиатуры сообщения; вернуться сразу"""
+        key = (message.chat.id, message.message_id)
+        digest = _digest(text, reply_markup)
+        state = self._state(key)
+
+        if state.pending is None and digest == state.sent_digest:
+            self.counters['unchanged'] += 1
+            return
+        if state.pending is not None:
+            self.counters['coalesced'] += 1
+
+        state.pending = (message.get_bot(), text, reply_markup, digest)
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._send_pending(key, state))
+
+    async def _send_pending(self, key, state):
+        chat_id, message_id = key
+        while state.pending is not None:
+            delay = state.sent_at + self.window - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            pending, state.pending = state.pending, None
+            bot, text, reply_markup, digest = pending
+            if digest == state.sent_digest:
+                # Нажатия вернули экран к уже показанному
+                self.counters['unchanged'] += 1
+                continue
+
+            try:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+            except RetryAfter as e:
+                self.counters['retry_after'] += 1
+                # Повторить после паузы; более новая правка заменяет эту
+                if state.pending is None:
+                    state.pending = pending
+                state.sent_at = time.monotonic() + retry_after_seconds(e) - self.window
+                continue
+            except BadRequest as e:
+                state.sent_at = time.monotonic()
+                if 'not modified' in str(e).lower():
+                    self.counters['not_modified'] += 1
+                    state.sent_digest = digest
+                else:
+                    logger.error(f"Ошибка при изменении сообщения {message_id}: {e}")
+                continue
+            except TelegramError as e:
+                state.sent_at = time.monotonic()
+                logger.error(f"Ошибка при изменении сообщения {message_id}: {e}")
+                continue
+
+            state.sent_at = time.monotonic()
+            state.sent_digest = digest
+            self.counters['sent'] += 1
+
+    async def edit_now(self, message, text, reply_markup=None):
+        """Изменить сообщение, дождавшись отправки, вместо отложенных правок"""
+        await self.drop(message)
+
+        for attempt in range(EDIT_MAX_RETRIES + 1):
+            try:
+                await message.get_bot().edit_message_text(
+                    text, chat_id=message.chat.id, message_id=message.message_id, reply_markup=reply_markup
+                )
+            except RetryAfter as e:
+                self.counters['retry_after'] += 1
+                if attempt == EDIT_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(retry_after_seconds(e))
+                continue
+            except BadRequest as e:
+                if 'not modified' not in str(e).lower():
+                    raise
+                self.counters['not_modified'] += 1
+                return
+            self.counters['sent'] += 1
+            return
+
+    async def drop(self, message):
+        """Отменить неотправленные правки перед тем, как изменить сообщение напрямую.
+
+        Ждет окончания окна после последней правки, чтобы прямая правка не
+        упиралась в лимит Telegram.
+        """
+        state = self._states.pop((message.chat.id, message.message_id), None)
+        if state is None:
+            return
+        if state.task is not None and not state.task.done():
+            state.pending = None
+            state.task.cancel()
+            await asyncio.gather(state.task, return_exceptions=True)
+
+        delay = state.sent_at + self.window - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            'sent': self.counters['sent'],
+            'unchanged': self.counters['unchanged'],
+            'coalesced': self.counters['coalesced'],
+            'not_modified': self.counters['not_modified'],
+            'retry_after': self.counters['retry_after'],
+        }
+
+message_editor = MessageEditor()
\ No newline at end of file
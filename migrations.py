@@ -0,0 +1,468 @@
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def _bump_version_trigger(name, event, table, groups_sql):
+    """Триггер, увеличивающий версию данных групп, которые возвращает groups_sql"""
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table}
+        BEGIN
+            INSERT INTO group_data_versions (group_id, version)
+            SELECT group_id, 1 FROM ({groups_sql}) WHERE group_id IS NOT NULL
+            ON CONFLICT(group_id) DO UPDATE SET version = version + 1;
+        END
+    '''
+
+# Полный пересчет сводной посещаемости (миграция 5 и команда /rebuild_stats)
+REBUILD_ATTENDANCE_SUMMARY_SQL = [
+    'DELETE FROM group_subject_stats',
+    '''
+    INSERT INTO group_subject_stats (group_subject_id, lesson_count, last_lesson_date)
+    SELECT group_subject_id, COUNT(*), MAX(date) FROM lessons
+    WHERE group_subject_id IS NOT NULL
+    GROUP BY group_subject_id
+    ''',
+    'DELETE FROM attendance_summary',
+    '''
+    INSERT INTO attendance_summary (student_id, group_subject_id, present, absent, late)
+    SELECT a.student_id, l.group_subject_id,
+        SUM(a.status = 'present'), SUM(a.status = 'absent'), SUM(a.status = 'late')
+    FROM attendance a
+    JOIN lessons l ON l.id = a.lesson_id
+    WHERE a.student_id IS NOT NULL AND l.group_subject_id IS NOT NULL
+    GROUP BY a.student_id, l.group_subject_id
+    ''',
+]
+
+# Добавить (sign = '+') или убрать (sign = '-') одну отметку в сводке
+def _summary_delta_sql(row, sign):
+    if sign == '+':
+        return f'''
+            INSERT INTO attendance_summary (student_id, group_subject_id, present, absent, late)
+            SELECT {row}.student_id, l.group_subject_id,
+                {row}.status = 'present', {row}.status = 'absent', {row}.status = 'late'
+            FROM lessons l WHERE l.id = {row}.lesson_id AND l.group_subject_id IS NOT NULL
+            ON CONFLICT(student_id, group_subject_id) DO UPDATE SET
+                present = present + excluded.present,
+                absent = absent + excluded.absent,
+                late = late + excluded.late;
+        '''
+    return f'''
+        UPDATE attendance_summary SET
+            present = present - ({row}.status = 'present'),
+            absent = absent - ({row}.status = 'absent'),
+            late = late - ({row}.status = 'late')
+        WHERE student_id = {row}.student_id
+        AND group_subject_id = (SELECT group_subject_id FROM lessons WHERE id = {row}.lesson_id);
+    '''
+
+# Пересчитать число и последнюю дату занятий предмета группы;
+# у предмета без занятий строки в сводке нет (как после полного пересчета)
+def _lesson_stats_sql(group_subject_id):
+    return f'''
+        INSERT INTO group_subject_stats (group_subject_id, lesson_count, last_lesson_date)
+        SELECT {group_subject_id}, COUNT(*), MAX(date) FROM lessons
+        WHERE group_subject_id = {group_subject_id} AND {group_subject_id} IS NOT NULL
+        GROUP BY group_subject_id
+        ON CONFLICT(group_subject_id) DO UPDATE SET
+            lesson_count = excluded.lesson_count,
+            last_lesson_date = excluded.last_lesson_date;
+        DELETE FROM group_subject_stats
+        WHERE group_subject_id = {group_subject_id}
+        AND NOT EXISTS (SELECT 1 FROM lessons WHERE group_subject_id = {group_subject_id});
+    '''
+
+def _add_column(table, column, definition):
+    """ALTER TABLE ADD COLUMN, пропускаемый, если столбец уже есть"""
+    def add(conn):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return add
+
+# Каждая миграция: (версия, описание, список SQL-выражений).
+# Миграции применяются строго по возрастанию версии, каждая в своей транзакции,
+# и должны быть идемпотентными (IF NOT EXISTS / OR IGNORE / _add_column).
+# Вместо SQL-выражения может стоять функция, которая получает соединение.
+MIGRATIONS = [
+    (1, 'Базовые таблицы', [
+        '''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            role TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            group_id INTEGER,
+            telegram_id INTEGER UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES groups (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS group_subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER,
+            subject_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES groups (id),
+            FOREIGN KEY (subject_id) REFERENCES subjects (id),
+            UNIQUE(group_id, subject_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lessons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_subject_id INTEGER,
+            date DATE NOT NULL,
+            topic TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_subject_id) REFERENCES group_subjects (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER,
+            lesson_id INTEGER,
+            status TEXT NOT NULL CHECK(status IN ('present', 'absent', 'late')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (student_id) REFERENCES students (id),
+            FOREIGN KEY (lesson_id) REFERENCES lessons (id),
+            UNIQUE(student_id, lesson_id)
+        )
+        ''',
+    ]),
+    (2, 'Покрывающие индексы для горячих запросов', [
+        # students WHERE group_id = ? ORDER BY full_name (id берется из rowid)
+        'CREATE INDEX IF NOT EXISTS idx_students_group ON students (group_id, full_name)',
+        # attendance WHERE lesson_id = ? -> student_id, status
+        'CREATE INDEX IF NOT EXISTS idx_attendance_lesson ON attendance (lesson_id, student_id, status)',
+        # group_subjects WHERE group_id = ? обслуживает UNIQUE(group_id, subject_id),
+        # обратный поиск по предмету - этот индекс
+        'CREATE INDEX IF NOT EXISTS idx_group_subjects_subject ON group_subjects (subject_id, group_id)',
+    ]),
+    (3, 'Одно занятие по предмету группы на дату', [
+        # Переносим отметки с дублирующихся занятий на самое раннее из них
+        '''
+        UPDATE OR IGNORE attendance
+        SET lesson_id = (
+            SELECT MIN(l2.id) FROM lessons l1
+            JOIN lessons l2 ON l1.group_subject_id = l2.group_subject_id AND l1.date = l2.date
+            WHERE l1.id = attendance.lesson_id
+        )
+        ''',
+        '''
+        DELETE FROM attendance WHERE lesson_id NOT IN (
+            SELECT MIN(id) FROM lessons GROUP BY group_subject_id, date
+        )
+        ''',
+        '''
+        DELETE FROM lessons WHERE id NOT IN (
+            SELECT MIN(id) FROM lessons GROUP BY group_subject_id, date
+        )
+        ''',
+        # lessons WHERE group_subject_id = ? AND date BETWEEN ? AND ? (id берется из rowid)
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_lessons_group_subject_date ON lessons (group_subject_id, date)',
+    ]),
+    (4, 'Версии данных групп для кэша отчетов', [
+        # Версия увеличивается при любом изменении данных, попадающих в отчет группы
+        '''
+        CREATE TABLE IF NOT EXISTS group_data_versions (
+            group_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+        _bump_version_trigger('trg_attendance_insert_version', 'INSERT', 'attendance', """
+            SELECT gs.group_id FROM lessons l JOIN group_subjects gs ON gs.id = l.group_subject_id
+            WHERE l.id = NEW.lesson_id
+        """),
+        _bump_version_trigger('trg_attendance_update_version', 'UPDATE', 'attendance', """
+            SELECT DISTINCT gs.group_id FROM lessons l JOIN group_subjects gs ON gs.id = l.group_subject_id
+            WHERE l.id IN (OLD.lesson_id, NEW.lesson_id)
+        """),
+        _bump_version_trigger('trg_attendance_delete_version', 'DELETE', 'attendance', """
+            SELECT gs.group_id FROM lessons l JOIN group_subjects gs ON gs.id = l.group_subject_id
+            WHERE l.id = OLD.lesson_id
+        """),
+        _bump_version_trigger('trg_lessons_insert_version', 'INSERT', 'lessons',
+                              "SELECT group_id FROM group_subjects WHERE id = NEW.group_subject_id"),
+        _bump_version_trigger('trg_lessons_update_version', 'UPDATE', 'lessons',
+                              "SELECT DISTINCT group_id FROM group_subjects WHERE id IN (OLD.group_subject_id, NEW.group_subject_id)"),
+        _bump_version_trigger('trg_lessons_delete_version', 'DELETE', 'lessons',
+                              "SELECT group_id FROM group_subjects WHERE id = OLD.group_subject_id"),
+        _bump_version_trigger('trg_students_insert_version', 'INSERT', 'students', "SELECT NEW.group_id AS group_id"),
+        _bump_version_trigger('trg_students_update_version', 'UPDATE OF full_name, group_id', 'students',
+                              "SELECT OLD.group_id AS group_id UNION SELECT NEW.group_id"),
+        _bump_version_trigger('trg_students_delete_version', 'DELETE', 'students', "SELECT OLD.group_id AS group_id"),
+        _bump_version_trigger('trg_group_subjects_insert_version', 'INSERT', 'group_subjects', "SELECT NEW.group_id AS group_id"),
+        _bump_version_trigger('trg_group_subjects_update_version', 'UPDATE', 'group_subjects',
+                              "SELECT OLD.group_id AS group_id UNION SELECT NEW.group_id"),
+        _bump_version_trigger('trg_group_subjects_delete_version', 'DELETE', 'group_subjects', "SELECT OLD.group_id AS group_id"),
+        _bump_version_trigger('trg_subjects_update_version', 'UPDATE OF name', 'subjects',
+                              "SELECT group_id FROM group_subjects WHERE subject_id = NEW.id"),
+        _bump_version_trigger('trg_groups_update_version', 'UPDATE OF name', 'groups', "SELECT NEW.id AS group_id"),
+    ]),
+    (5, 'Сводная посещаемость, обновляемая триггерами', [
+        # Отметки студента по предмету группы
+        '''
+        CREATE TABLE IF NOT EXISTS attendance_summary (
+            student_id INTEGER NOT NULL,
+            group_subject_id INTEGER NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            absent INTEGER NOT NULL DEFAULT 0,
+            late INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, group_subject_id)
+        ) WITHOUT ROWID
+        ''',
+        # Число занятий и дата последнего занятия предмета группы
+        '''
+        CREATE TABLE IF NOT EXISTS group_subject_stats (
+            group_subject_id INTEGER PRIMARY KEY,
+            lesson_count INTEGER NOT NULL DEFAULT 0,
+            last_lesson_date DATE
+        )
+        ''',
+        # Неотмеченные занятия = занятия предмета - отметки студента
+        '''
+        CREATE VIEW IF NOT EXISTS student_attendance_summary AS
+        SELECT
+            s.id AS student_id,
+            gs.group_id,
+            gs.id AS group_subject_id,
+            gs.subject_id,
+            gss.lesson_count,
+            COALESCE(a.present, 0) AS present,
+            COALESCE(a.absent, 0) AS absent,
+            COALESCE(a.late, 0) AS late,
+            gss.lesson_count - COALESCE(a.present + a.absent + a.late, 0) AS unmarked,
+            gss.last_lesson_date
+        FROM students s
+        JOIN group_subjects gs ON gs.group_id = s.group_id
+        JOIN group_subject_stats gss ON gss.group_subject_id = gs.id
+        LEFT JOIN attendance_summary a ON a.student_id = s.id AND a.group_subject_id = gs.id
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_insert_summary AFTER INSERT ON attendance
+        BEGIN
+            {_summary_delta_sql('NEW', '+')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_update_summary
+        AFTER UPDATE OF status, student_id, lesson_id ON attendance
+        BEGIN
+            {_summary_delta_sql('OLD', '-')}
+            {_summary_delta_sql('NEW', '+')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_delete_summary AFTER DELETE ON attendance
+        BEGIN
+            {_summary_delta_sql('OLD', '-')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_lessons_insert_summary AFTER INSERT ON lessons
+        BEGIN
+            {_lesson_stats_sql('NEW.group_subject_id')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_lessons_update_summary AFTER UPDATE OF date, group_subject_id ON lessons
+        BEGIN
+            {_lesson_stats_sql('OLD.group_subject_id')}
+            {_lesson_stats_sql('NEW.group_subject_id')}
+        END
+        ''',
+        # Перенос занятия в другой предмет: отметки занятия переходят вместе с ним
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_lessons_move_summary AFTER UPDATE OF group_subject_id ON lessons
+        WHEN OLD.group_subject_id IS NOT NEW.group_subject_id
+        BEGIN
+            UPDATE attendance_summary SET
+                present = present - (SELECT COUNT(*) FROM attendance a WHERE a.lesson_id = NEW.id AND a.student_id = attendance_summary.student_id AND a.status = 'present'),
+                absent = absent - (SELECT COUNT(*) FROM attendance a WHERE a.lesson_id = NEW.id AND a.student_id = attendance_summary.student_id AND a.status = 'absent'),
+                late = late - (SELECT COUNT(*) FROM attendance a WHERE a.lesson_id = NEW.id AND a.student_id = attendance_summary.student_id AND a.status = 'late')
+            WHERE group_subject_id = OLD.group_subject_id
+            AND student_id IN (SELECT student_id FROM attendance WHERE lesson_id = NEW.id);
+            INSERT INTO attendance_summary (student_id, group_subject_id, present, absent, late)
+            SELECT a.student_id, NEW.group_subject_id, a.status = 'present', a.status = 'absent', a.status = 'late'
+            FROM attendance a WHERE a.lesson_id = NEW.id AND NEW.group_subject_id IS NOT NULL
+            ON CONFLICT(student_id, group_subject_id) DO UPDATE SET
+                present = present + excluded.present,
+                absent = absent + excluded.absent,
+                late = late + excluded.late;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_lessons_delete_summary AFTER DELETE ON lessons
+        BEGIN
+            {_lesson_stats_sql('OLD.group_subject_id')}
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_group_subjects_delete_summary AFTER DELETE ON group_subjects
+        BEGIN
+            DELETE FROM group_subject_stats WHERE group_subject_id = OLD.id;
+            DELETE FROM attendance_summary WHERE group_subject_id = OLD.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_students_delete_summary AFTER DELETE ON students
+        BEGIN
+            DELETE FROM attendance_summary WHERE student_id = OLD.id;
+        END
+        ''',
+        *REBUILD_ATTENDANCE_SUMMARY_SQL,
+    ]),
+    (6, 'Задания импорта из файлов', [
+        # Прогресс импорта фиксируется в той же транзакции, что и данные,
+        # поэтому прерванный импорт продолжается с последней записанной пачки
+        '''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('running', 'done', 'failed')),
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            rows_written INTEGER NOT NULL DEFAULT 0,
+            rows_skipped INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            UNIQUE(kind, file_hash)
+        )
+        ''',
+    ]),
+    (7, 'Данные диалогов бота', [
+        # user_data, chat_data и состояния ConversationHandler (см. persistence.py)
+        '''
+        CREATE TABLE IF NOT EXISTS persistence (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (8, 'Очередь исходящих сообщений', [
+        # Сообщения отправляются JobQueue с учетом лимитов Telegram (см. outbox.py)
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sent', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            not_before REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        ''',
+        # Очередь к отправке: status = 'pending' AND not_before <= ? GROUP BY chat_id
+        "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (not_before, chat_id) WHERE status = 'pending'",
+    ]),
+    (9, 'Уведомления о пропусках', [
+        # Студент сам включает уведомления об отсутствиях и опозданиях
+        _add_column('students', 'notify_absence', 'INTEGER NOT NULL DEFAULT 0'),
+        # Одно сообщение на ключ: повторное сохранение той же отметки не дублирует уведомление
+        _add_column('outbox', 'dedupe_key', 'TEXT'),
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_dedupe ON outbox (dedupe_key) WHERE dedupe_key IS NOT NULL',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Текущая версия схемы (0 для пустой БД)"""
+    row = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if row is None:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(conn):
+    """Применить недостающие миграции, вернуть список примененных версий"""
+    current = get_schema_version(conn)
+    if current >= LATEST_VERSION:
+        return []
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Миграцию мог успеть применить другой экземпляр бота
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            for sql in statements:
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat(sep=' ', timespec='seconds'))
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка миграции {version} ({description}): {e}")
+            raise
+
+        logger.info(f"Применена миграция {version}: {description}")
+        applied.append(version)
+
+    return applied
+
+def rebuild_attendance_summary(conn):
+    """Пересчитать сводную посещаемость с нуля (если она разошлась с данными)"""
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for sql in REBUILD_ATTENDANCE_SUMMARY_SQL:
+            conn.execute(sql)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Ошибка пересчета сводной посещаемости: {e}")
+        raise
+    
+    return conn.execute("SELECT COUNT(*) FROM attendance_summary").fetchone()[0]
\ No newline at end of file
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from itertools import groupby
+from database import run_db
+from outbox import outbox
+from config import ABSENCE_NOTIFY_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Статусы, о которых сообщается студенту
+ABSENCE_MESSAGES = {
+    'absent': "❌ {date}: вы отмечены отсутствующим на занятии «{subject}».",
+    'late': "⏰ {date}: вы отмечены опоздавшим на занятии «{subject}».",
+}
+
+# Текущие отметки студентов занятия, включивших уведомления
+# (вместо {students} - плейсхолдеры student_id)
+ABSENCE_RECIPIENTS_SQL = """
+    SELECT a.student_id, a.status, s.telegram_id, l.date, subj.name AS subject_name
+    FROM attendance a
+    JOIN students s ON s.id = a.student_id
+    JOIN lessons l ON l.id = a.lesson_id
+    JOIN group_subjects gs ON gs.id = l.group_subject_id
+    JOIN subjects subj ON subj.id = gs.subject_id
+    WHERE a.lesson_id = ? AND a.student_id IN ({students})
+    AND s.notify_absence = 1 AND s.telegram_id IS NOT NULL
+"""
+
+def _load_notifications(conn, marks):
+    """Сообщения [(chat_id, текст, ключ)] по сохраненным отметкам (выполняется в потоке БД).
+
+    marks - отсортированные пары (lesson_id, student_id); по каждому занятию
+    один запрос. Ключ - занятие и студент: в очереди остается сообщение о
+    последнем статусе отметки.
+    """
+    messages = []
+    for lesson_id, pairs in groupby(marks, key=lambda mark: mark[0]):
+        students = [student_id for _, student_id in pairs]
+        rows = conn.execute(
+            ABSENCE_RECIPIENTS_SQL.format(students=', '.join('?' * len(students))),
+            (lesson_id, *students)
+        ).fetchall()
+        for row in rows:
+            # Отметку могли исправить на "присутствовал" до отправки
+            if row['status'] not in ABSENCE_MESSAGES:
+                continue
+            text = ABSENCE_MESSAGES[row['status']].format(date=row['date'], subject=row['subject_name'])
+            messages.append((row['telegram_id'], text, f"absence:{lesson_id}:{row['student_id']}"))
+    return messages
+
+class AbsenceNotifier:
+    """Уведомления студентам об отсутствии и опоздании.
+
+    После сохранения отметок сессия только запоминает пары (занятие,
+    студент) со статусом "отсутствовал" или "опоздал" - сохранение не ждет
+    ни БД, ни Telegram. Через delay секунд накопленные пары проверяются по
+    сохраненным отметкам одним заходом в БД и ставятся в очередь outbox:
+    исправленные за это время отметки не отправляются, а ключ сообщения
+    (занятие, студент) не дает отправить отметку дважды - если сообщение
+    еще в очереди, его текст заменяется последним статусом. Статус
+    доставки хранится в outbox.
+    """
+
+    def __init__(self, delay=ABSENCE_NOTIFY_DELAY):
+        self.delay = delay
+        self._marks = set()  # (lesson_id, student_id)
+        self._task = None
+        self.queued = 0
+        self.duplicates = 0
+
+    def collect(self, lesson_id, marks):
+        """Запомнить сохраненные отметки занятия {student_id: статус} (без обращения к БД)"""
+        keys = {(lesson_id, student_id) for student_id, status in marks.items() if status in ABSENCE_MESSAGES}
+        if not keys:
+            return
+        self._marks |= keys
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Отметки, собранные во время записи, уходят следующей порцией
+        while self._marks:
+            await asyncio.sleep(self.delay)
+            await self.flush()
+
+    async def flush(self):
+        """Поставить накопленные уведомления в очередь; вернуть число новых сообщений"""
+        marks, self._marks = self._marks, set()
+        if not marks:
+            return 0
+
+        try:
+            messages = await run_db(_load_notifications, sorted(marks))
+            queued = await outbox.enqueue(messages, 'absence') if messages else 0
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке уведомлений о пропусках: {e}")
+            self._marks |= marks
+            return 0
+
+        self.queued += queued
+        self.duplicates += len(messages) - queued
+        if queued:
+            logger.info(f"Уведомлений о пропусках в очереди: {queued}")
+        return queued
+
+    async def shutdown(self):
+        """Поставить в очередь уведомления, ожидающие отправки, при остановке бота"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+    def stats(self):
+        return {
+            'waiting': len(self._marks),
+            'queued': self.queued,
+            'duplicates': self.duplicates,
+        }
+
+absence_notifier = AbsenceNotifier()
\ No newline at end of file
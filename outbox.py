@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+from database import run_db
+from utils import retry_after_seconds
+from config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_INTERVAL, OUTBOX_TICK, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_BACKOFF
+)
+
+logger = logging.getLogger(__name__)
+
+# Самое старое готовое к отправке сообщение каждого чата: при MIN() SQLite
+# берет остальные колонки из той же строки
+DUE_MESSAGES_SQL = """
+    SELECT MIN(id) AS id, chat_id, text, attempts
+    FROM outbox
+    WHERE status = 'pending' AND not_before <= ?
+    GROUP BY chat_id
+    ORDER BY id
+    LIMIT ?
+"""
+
+RECORD_RESULT_SQL = """
+    UPDATE outbox SET
+        status = :status,
+        attempts = :attempts,
+        not_before = :not_before,
+        error = :error,
+        sent_at = CASE WHEN :status = 'sent' THEN CURRENT_TIMESTAMP END
+    WHERE id = :id
+"""
+
+# Получатели рассылки: студенты, зарегистрированные в боте
+BROADCAST_RECIPIENTS_SQL = """
+    SELECT DISTINCT telegram_id FROM students
+    WHERE telegram_id IS NOT NULL AND (? IS NULL OR group_id = ?)
+"""
+
+def _load_due(conn, now, limit):
+    return conn.execute(DUE_MESSAGES_SQL, (now, limit)).fetchall()
+
+def _record_results(conn, results):
+    conn.executemany(RECORD_RESULT_SQL, results)
+    conn.commit()
+
+def _enqueue_broadcast(conn, group_id, text, kind):
+    cursor = conn.execute(f"""
+        INSERT INTO outbox (chat_id, text, kind)
+        SELECT telegram_id, ?, ? FROM ({BROADCAST_RECIPIENTS_SQL})
+    """, (text, kind, group_id, group_id))
+    conn.commit()
+    return cursor.rowcount
+
+# Сообщение с уже встречавшимся ключом не добавляется: если оно еще не
+# отправлено, в очереди заменяется его текст
+ENQUEUE_SQL = """
+    INSERT INTO outbox (chat_id, text, kind, dedupe_key) VALUES (?, ?, ?, ?)
+    ON CONFLICT(dedupe_key) WHERE dedupe_key IS NOT NULL DO UPDATE SET
+        chat_id = excluded.chat_id,
+        text = excluded.text
+    WHERE outbox.status = 'pending' AND outbox.text IS NOT excluded.text
+"""
+
+def _enqueue(conn, messages, kind):
+    cursor = conn.executemany(
+        ENQUEUE_SQL,
+        [(chat_id, text, kind, dedupe_key) for chat_id, text, dedupe_key in messages]
+    )
+    conn.commit()
+    return cursor.rowcount
+
+def _count_broadcast_recipients(conn, group_id):
+    return conn.execute(
+        f"SELECT COUNT(*) FROM ({BROADCAST_RECIPIENTS_SQL})", (group_id, group_id)
+    ).fetchone()[0]
+
+def _result(row, status, attempts, not_before=0, error=None):
+    """Параметры RECORD_RESULT_SQL после попытки отправки"""
+    return {'id': row['id'], 'status': status, 'attempts': attempts, 'not_before': not_before, 'error': error}
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity сразу"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def take(self, count):
+        """Взять до count токенов без ожидания; вернуть, сколько выдано"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return 0
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        granted = min(count, int(self._tokens))
+        self._tokens -= granted
+        return granted
+
+    def pause(self, seconds):
+        """Не выдавать токены seconds секунд (ответ Telegram retry_after)"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+class Outbox:
+    """Очередь исходящих сообщений в таблице outbox.
+
+    Сообщения ставятся в очередь одной вставкой и переживают перезапуск
+    бота. Задача JobQueue каждые OUTBOX_TICK секунд берет самое старое
+    сообщение каждого чата, не получавшего сообщений последние
+    OUTBOX_CHAT_INTERVAL секунд, сколько позволяет общее ведро токенов
+    (OUTBOX_GLOBAL_RATE в секунду), и отправляет их одновременно. Результаты
+    порции записываются одной транзакцией. На RetryAfter отправка
+    приостанавливается на указанное Telegram время, сетевые ошибки
+    повторяются с растущей паузой, заблокировавшие бота и несуществующие
+    чаты помечаются failed сразу.
+    """
+
+    def __init__(self, rate=OUTBOX_GLOBAL_RATE, chat_interval=OUTBOX_CHAT_INTERVAL):
+        # Запас ведра - одна порция, чтобы за любую секунду уходило не больше ~rate сообщений
+        self.bucket = TokenBucket(rate, capacity=max(1, int(rate * OUTBOX_TICK)))
+        self.chat_interval = chat_interval
+        self._chat_next = {}  # chat_id -> time.monotonic(), раньше которого в чат не пишем
+        self._delivering = False
+        self.counters = Counter()
+
+    def start(self, job_queue):
+        """Запустить отправку из JobQueue приложения"""
+        job_queue.run_repeating(self._deliver_job, interval=OUTBOX_TICK, first=OUTBOX_TICK, name='outbox')
+
+    async def enqueue(self, messages, kind):
+        """Поставить в очередь [(chat_id, текст, ключ или None)]; вернуть число новых и измененных сообщений.
+
+        Сообщение с уже встречавшимся ключом не ставится повторно: у
+        неотправленного заменяется текст, отправленное не меняется.
+        """
+        return await run_db(_enqueue, messages, kind)
+
+    async def enqueue_broadcast(self, group_id, text, kind='broadcast'):
+        """Поставить в очередь рассылку студентам группы (None - всем группам); вернуть число сообщений"""
+        return await run_db(_enqueue_broadcast, group_id, text, kind)
+
+    async def count_broadcast_recipients(self, group_id=None):
+        """Число получателей рассылки группе (None - всем группам)"""
+        return await run_db(_count_broadcast_recipients, group_id)
+
+    async def _deliver_job(self, context):
+        # Порция может отправляться дольше OUTBOX_TICK: задача JobQueue только
+        # запускает ее, а следующая порция начнется после завершения текущей
+        if not self._delivering:
+            context.application.create_task(self.deliver(context.bot), name='outbox')
+
+    async def deliver(self, bot):
+        """Отправить очередную порцию сообщений"""
+        if self._delivering:
+            return
+        self._delivering = True
+        try:
+            now = time.monotonic()
+            self._chat_next = {chat_id: t for chat_id, t in self._chat_next.items() if t > now}
+
+            rows = await run_db(_load_due, time.time(), self.bucket.capacity + len(self._chat_next))
+            rows = [row for row in rows if row['chat_id'] not in self._chat_next]
+            rows = rows[:self.bucket.take(len(rows))]
+            if not rows:
+                return
+
+            for row in rows:
+                self._chat_next[row['chat_id']] = now + self.chat_interval
+            results = await asyncio.gather(*(self._send(bot, row) for row in rows))
+            await run_db(_record_results, results)
+        except Exception as e:
+            logger.error(f"Ошибка отправки очереди сообщений: {e}")
+        finally:
+            self._delivering = False
+
+    async def _send(self, bot, row):
+        """Отправить одно сообщение; вернуть параметры RECORD_RESULT_SQL (не выбрасывает исключений)"""
+        attempts = row['attempts'] + 1
+        try:
+            await bot.send_message(chat_id=row['chat_id'], text=row['text'])
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            self.bucket.pause(delay)
+            self._chat_next[row['chat_id']] = time.monotonic() + delay
+            self.counters['flood_waits'] += 1
+            logger.warning(f"Ограничение Telegram: пауза отправки {delay:.0f} с")
+            # Повтор после паузы не считается попыткой
+            return _result(row, 'pending', row['attempts'], time.time() + delay, str(e))
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован или чат не существует - повтор не поможет
+            self.counters['failed'] += 1
+            return _result(row, 'failed', attempts, error=str(e))
+        except Exception as e:
+            # Сетевые и любые другие ошибки одного сообщения не должны
+            # помешать записать результаты остальных сообщений порции
+            if not isinstance(e, TelegramError):
+                logger.error(f"Ошибка при отправке сообщения {row['id']}: {e}")
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                self.counters['failed'] += 1
+                logger.error(f"Сообщение {row['id']} не отправлено за {attempts} попыток: {e}")
+                return _result(row, 'failed', attempts, error=str(e))
+            self.counters['retried'] += 1
+            backoff = min(OUTBOX_MAX_BACKOFF, 2 ** attempts)
+            return _result(row, 'pending', attempts, time.time() + backoff, str(e))
+
+        self.counters['sent'] += 1
+        return _result(row, 'sent', attempts)
+
+    def stats(self):
+        return {
+            'sent': self.counters['sent'],
+            'failed': self.counters['failed'],
+            'retried': self.counters['retried'],
+            'flood_waits': self.counters['flood_waits'],
+        }
+
+outbox = Outbox()
\ No newline at end of file
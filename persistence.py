@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import zlib
+from telegram.ext import BasePersistence, PersistenceInput
+from database import run_db
+from config import PERSISTENCE_UPDATE_INTERVAL, PERSISTENCE_COMPRESS_MIN_BYTES
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+BOT_DATA = 'bot_data'
+CONVERSATION = 'conversation:'  # + имя ConversationHandler
+
+# Первый байт записи: как хранится pickle
+RAW = b'p'
+COMPRESSED = b'z'
+
+UPSERT_PERSISTENCE_SQL = """
+    INSERT INTO persistence (kind, key, data, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+"""
+
+def _dumps(obj):
+    """Компактная запись: pickle, сжатый zlib, если так короче"""
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    if len(data) >= PERSISTENCE_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return COMPRESSED + compressed
+    return RAW + data
+
+def _loads(blob):
+    blob = bytes(blob)
+    data = blob[1:]
+    if blob[:1] == COMPRESSED:
+        data = zlib.decompress(data)
+    return pickle.loads(data)
+
+def _digest(blob):
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+def _load_kind(conn, kind):
+    return conn.execute("SELECT key, data FROM persistence WHERE kind = ?", (kind,)).fetchall()
+
+def _write_batch(conn, upserts, deletes):
+    """Записать накопленные изменения одной транзакцией (выполняется в потоке БД)"""
+    conn.executemany(UPSERT_PERSISTENCE_SQL, upserts)
+    conn.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", deletes)
+    conn.commit()
+
+class SQLitePersistence(BasePersistence):
+    """Хранение user_data, chat_data и состояний диалогов в БД бота.
+
+    Application раз в update_interval секунд передает данные, изменившиеся
+    с прошлого раза; здесь они только сериализуются и откладываются в
+    памяти, а затем записываются одной транзакцией. Записи, не изменившиеся
+    с последней записи, пропускаются. Данные, которые не удалось прочитать
+    (например, после изменения классов), пропускаются с предупреждением.
+    """
+
+    def __init__(self, update_interval=PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self._dirty = {}  # (kind, key) -> запись или None (удалить)
+        self._digests = {}  # (kind, key) -> хэш последней записанной записи
+        self._flush_task = None
+        self.written = 0
+        self.unchanged = 0
+        self.batches = 0
+
+    async def _load(self, kind):
+        """{key: объект} для записей одного вида"""
+        result = {}
+        for key, blob in await run_db(_load_kind, kind):
+            try:
+                result[key] = _loads(blob)
+            except Exception as e:
+                logger.warning(f"Пропущены сохраненные данные {kind} {key}: {e}")
+                continue
+            self._digests[(kind, key)] = _digest(bytes(blob))
+        return result
+
+    def _stage(self, kind, key, blob):
+        """Отложить запись (None - удалить); неизменившиеся записи пропускаются"""
+        item = (kind, key)
+        digest = _digest(blob) if blob is not None else None
+        if item not in self._dirty and self._digests.get(item) == digest:
+            self.unchanged += 1
+            return
+        self._dirty[item] = blob
+        if self._flush_task is None or self._flush_task.done():
+            # Задача запускается после всех update_* текущего прохода Application
+            self._flush_task = asyncio.create_task(self._write_dirty())
+
+    async def _write_dirty(self):
+        while self._dirty:
+            batch, self._dirty = self._dirty, {}
+            upserts = [(kind, key, blob) for (kind, key), blob in batch.items() if blob is not None]
+            deletes = [item for item, blob in batch.items() if blob is None]
+            try:
+                await run_db(_write_batch, upserts, deletes)
+            except Exception as e:
+                logger.error(f"Ошибка записи данных диалогов: {e}")
+                # Вернуть несохраненное, не затирая более новые изменения
+                for item, blob in batch.items():
+                    self._dirty.setdefault(item, blob)
+                return
+
+            for item, blob in batch.items():
+                if blob is None:
+                    self._digests.pop(item, None)
+                else:
+                    self._digests[item] = _digest(blob)
+            self.written += len(batch)
+            self.batches += 1
+
+    async def get_user_data(self):
+        return {int(key): data for key, data in (await self._load(USER_DATA)).items()}
+
+    async def get_chat_data(self):
+        return {int(key): data for key, data in (await self._load(CHAT_DATA)).items()}
+
+    async def get_bot_data(self):
+        return (await self._load(BOT_DATA)).get('', {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {
+            tuple(json.loads(key)): state
+            for key, state in (await self._load(CONVERSATION + name)).items()
+        }
+
+    async def update_user_data(self, user_id, data):
+        self._stage(USER_DATA, str(user_id), _dumps(data) if data else None)
+
+    async def update_chat_data(self, chat_id, data):
+        self._stage(CHAT_DATA, str(chat_id), _dumps(data) if data else None)
+
+    async def update_bot_data(self, data):
+        self._stage(BOT_DATA, '', _dumps(data) if data else None)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        blob = None if new_state is None else _dumps(new_state)
+        self._stage(CONVERSATION + name, json.dumps(list(key)), blob)
+
+    async def drop_user_data(self, user_id):
+        self._stage(USER_DATA, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        self._stage(CHAT_DATA, str(chat_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Дописать отложенные изменения (при остановке бота)"""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_dirty()
+        logger.info(f"Данные диалогов сохранены: записей {self.written}, транзакций {self.batches}")
+
+    def stats(self):
+        return {
+            'pending': len(self._dirty),
+            'written': self.written,
+            'unchanged': self.unchanged,
+            'batches': self.batches,
+        }
\ No newline at end of file
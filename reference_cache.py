@@ -0,0 +1,136 @@
+import logging
+import time
+from telegram import InlineKeyboardButton
+from database import async_db_connection
+from config import REFERENCE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+def _load_reference_data(conn):
+    """Загрузить справочники одним заходом в поток БД"""
+    groups = [(row['id'], row['name']) for row in conn.execute("SELECT id, name FROM groups ORDER BY name")]
+    subjects = dict(conn.execute("SELECT id, name FROM subjects").fetchall())
+
+    group_subjects = {}
+    for row in conn.execute("""
+        SELECT gs.id, gs.group_id, gs.subject_id, s.name
+        FROM group_subjects gs
+        JOIN subjects s ON s.id = gs.subject_id
+        ORDER BY s.name
+    """):
+        group_subjects.setdefault(row['group_id'], []).append((row['subject_id'], row['name'], row['id']))
+
+    return ReferenceData(groups, subjects, group_subjects)
+
+class ReferenceData:
+    """Снимок справочников: группы, предметы и предметы групп.
+
+    Снимок не меняется; после изменения справочников загружается новый.
+    Клавиатуры строятся при первом запросе и хранятся в снимке.
+    """
+
+    def __init__(self, groups, subjects, group_subjects):
+        self.groups = groups  # [(group_id, название)] по названию
+        self.group_names = dict(groups)
+        self.subject_names = subjects  # subject_id -> название
+        self.group_subjects = group_subjects  # group_id -> [(subject_id, название, group_subject_id)] по названию
+        self._group_subject_ids = {
+            (group_id, subject_id): group_subject_id
+            for group_id, items in group_subjects.items()
+            for subject_id, _, group_subject_id in items
+        }
+        self._keyboards = {}
+
+    def group_name(self, group_id):
+        return self.group_names.get(group_id)
+
+    def subject_name(self, subject_id):
+        return self.subject_names.get(subject_id)
+
+    def subjects_of(self, group_id):
+        """Предметы группы: [(subject_id, название, group_subject_id)]"""
+        return self.group_subjects.get(group_id, [])
+
+    def group_subject_id(self, group_id, subject_id):
+        return self._group_subject_ids.get((group_id, subject_id))
+
+    def groups_keyboard(self, prefix):
+        """Ряды кнопок групп с callback_data '<prefix>_<group_id>'"""
+        key = ('groups', prefix)
+        rows = self._keyboards.get(key)
+        if rows is None:
+            rows = self._keyboards[key] = tuple(
+                [InlineKeyboardButton(name, callback_data=f'{prefix}_{group_id}')] for group_id, name in self.groups
+            )
+        # Копия списка рядов: вызывающий код дописывает свои кнопки
+        return list(rows)
+
+    def subjects_keyboard(self, group_id, prefix):
+        """Ряды кнопок предметов группы с callback_data '<prefix>_<subject_id>'"""
+        key = ('subjects', group_id, prefix)
+        rows = self._keyboards.get(key)
+        if rows is None:
+            rows = self._keyboards[key] = tuple(
+                [InlineKeyboardButton(name, callback_data=f'{prefix}_{subject_id}')]
+                for subject_id, name, _ in self.subjects_of(group_id)
+            )
+        return list(rows)
+
+class ReferenceCache:
+    """Кэш справочников в памяти процесса.
+
+    Сбрасывается обработчиками, меняющими группы и предметы. Время жизни
+    ttl ограничивает устаревание, если справочники меняет другой экземпляр
+    бота или импорт из файла.
+    """
+
+    def __init__(self, ttl=REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = None
+        self._expires_at = 0.0
+        self._generation = 0
+
+    async def get(self):
+        """Текущий снимок справочников (из БД только при первом обращении или после сброса)"""
+        data = self._data
+        if data is not None and self._expires_at > time.monotonic():
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        generation = self._generation
+        async with async_db_connection() as conn:
+            data = await conn.run(_load_reference_data)
+
+        # Снимок, загруженный до сброса, может уже не содержать изменений
+        if generation == self._generation:
+            self._data = data
+            self._expires_at = time.monotonic() + self.ttl
+        return data
+
+    def invalidate(self):
+        """Сбросить справочники после изменения групп или предметов"""
+        self._generation += 1
+        self._data = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'loaded': self._data is not None,
+            'groups': len(self._data.groups) if self._data is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total * 100 if total else 0.0,
+        }
+
+reference_cache = ReferenceCache()
+
+async def get_reference_data():
+    """Снимок справочников: группы, предметы, предметы групп"""
+    return await reference_cache.get()
+
+def invalidate_reference_data():
+    """Сбросить кэш справочников после изменений в groups/subjects/group_subjects"""
+    reference_cache.invalidate()
\ No newline at end of file
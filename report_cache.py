@@ -0,0 +1,169 @@
+import logging
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from config import REPORT_CACHE_SIZE, REPORT_CACHE_MAX_BYTES, REPORT_CACHE_DIR, REPORT_CACHE_DISK_BYTES
+
+logger = logging.getLogger(__name__)
+
+def get_group_data_version(conn, group_id):
+    """Версия данных группы; меняется триггерами при любом изменении ее данных"""
+    row = conn.execute("SELECT version FROM group_data_versions WHERE group_id = ?", (group_id,)).fetchone()
+    return row[0] if row else 0
+
+def _result_size(result):
+    """Размер готового отчета в байтах (group_name, содержимое или None)"""
+    content = result[1]
+    if not content:
+        return 0
+    if isinstance(content, (bytes, str)):
+        return len(content)
+    # Посчитанные данные отчета (общие для всех форматов) - оценка по размеру в pickle
+    return len(pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL))
+
+class ReportCache:
+    """Кэш готовых отчетов с вытеснением давно неиспользованных.
+
+    Ключ - (group_id, начало, конец, формат, версия данных группы). Версия
+    хранится в БД и увеличивается триггерами, поэтому после любого изменения
+    данных группы старые отчеты просто перестают запрашиваться и вытесняются.
+    В памяти хранится не больше max_entries отчетов общим размером max_bytes;
+    если задан spill_dir, вытесненные из памяти отчеты сохраняются на диск
+    (не больше max_disk_bytes).
+    """
+
+    def __init__(self, max_entries=REPORT_CACHE_SIZE, max_bytes=REPORT_CACHE_MAX_BYTES,
+                 spill_dir=REPORT_CACHE_DIR, max_disk_bytes=REPORT_CACHE_DISK_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # ключ -> (результат, размер)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # ключ -> (путь к файлу, размер)
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._spill_ready = False
+
+    def _prepare_spill_dir(self):
+        """Создать каталог для отчетов на диске при первом вытеснении"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        # Индекс диска хранится в памяти, файлы прошлого запуска не нужны
+        for name in os.listdir(self.spill_dir):
+            if name.startswith('report_') and name.endswith('.pkl'):
+                os.remove(os.path.join(self.spill_dir, name))
+        self._spill_ready = True
+
+    def get(self, key):
+        """Готовый отчет по ключу или None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            disk_entry = self._disk.get(key)
+            if disk_entry is None:
+                self.misses += 1
+                return None
+
+        try:
+            with open(disk_entry[0], 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError) as e:
+            logger.error(f"Ошибка чтения отчета из кэша {disk_entry[0]}: {e}")
+            with self._lock:
+                self._drop_disk(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._store(key, result)
+        return result
+
+    def put(self, key, result):
+        """Сохранить отчет; более старые версии того же отчета удаляются"""
+        with self._lock:
+            report = key[:-1]
+            for old_key in [k for k in self._memory if k[:-1] == report and k[-1] < key[-1]]:
+                self._memory_bytes -= self._memory.pop(old_key)[1]
+            for old_key in [k for k in self._disk if k[:-1] == report and k[-1] < key[-1]]:
+                self._drop_disk(old_key)
+            self._store(key, result)
+
+    def _store(self, key, result):
+        size = _result_size(result)
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        self._memory[key] = (result, size)
+        self._memory_bytes += size
+
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            old_key, (old_result, old_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_size
+            self._spill(old_key, old_result, old_size)
+
+    def _spill(self, key, result, size):
+        """Перенести вытесненный из памяти отчет на диск (если включено)"""
+        if not self.spill_dir or key in self._disk or size > self.max_disk_bytes:
+            return
+
+        try:
+            if not self._spill_ready:
+                self._prepare_spill_dir()
+        except OSError as e:
+            logger.error(f"Ошибка подготовки каталога кэша отчетов {self.spill_dir}: {e}")
+            return
+
+        path = os.path.join(self.spill_dir, f"report_{hashlib.sha1(repr(key).encode()).hexdigest()}.pkl")
+        try:
+            with open(path, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logger.error(f"Ошибка записи отчета в кэш {path}: {e}")
+            return
+
+        self._disk[key] = (path, size)
+        self._disk_bytes += size
+        while self._disk_bytes > self.max_disk_bytes:
+            self._drop_disk(next(iter(self._disk)))
+
+    def _drop_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_bytes -= entry[1]
+        try:
+            os.remove(entry[0])
+        except OSError:
+            pass
+
+    def invalidate(self, group_id=None):
+        """Удалить отчеты группы (или все отчеты)"""
+        with self._lock:
+            for key in [k for k in self._memory if group_id is None or k[0] == group_id]:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            for key in [k for k in self._disk if group_id is None or k[0] == group_id]:
+                self._drop_disk(key)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._memory),
+                'bytes': self._memory_bytes,
+                'disk_size': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total * 100 if total else 0.0,
+            }
\ No newline at end of file
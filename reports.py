@@ -0,0 +1,588 @@
+import asyncio
+import csv
+import gzip
+import io
+import logging
+import multiprocessing
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from openpyxl import Workbook
+from telegram.constants import MessageLimit
+from config import REPORT_WORKERS, REPORT_QUEUE_SIZE, REPORT_CHUNK_SIZE, REPORT_SPOOL_MAX_BYTES
+from database import run_db, _connect
+from report_cache import ReportCache, get_group_data_version
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet предлагается, только если установлен pyarrow
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# --- Построение отчетов (выполняется в процессах пула)
+
+_worker_conn = None
+
+def _get_worker_connection():
+    """Соединение с БД, открываемое один раз на процесс пула"""
+    global _worker_conn
+    if _worker_conn is None:
+        _worker_conn = _connect()
+    return _worker_conn
+
+def _read_snapshot(conn, group_id, build, *args):
+    """Выполнить build(conn, ...) в одном снимке БД; вернуть (версия данных, результат)"""
+    try:
+        # Версия и данные читаются из одного снимка БД
+        conn.execute("BEGIN")
+        version = get_group_data_version(conn, group_id)
+        return version, build(conn, *args)
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+def load_report_data(group_id, start_date_str, end_date_str):
+    """Посчитать данные отчета; вернуть (версия данных, (название группы, данные или None))"""
+    conn = _get_worker_connection()
+    return _read_snapshot(conn, group_id, _load_report_data, group_id, start_date_str, end_date_str)
+
+def build_detailed_excel_report(group_id, start_date_str, end_date_str):
+    """Excel отчет с детальной посещаемостью; вернуть (версия данных, (название группы, байты или None))"""
+    conn = _get_worker_connection()
+    return _read_snapshot(conn, group_id, _build_detailed_excel_report, group_id, start_date_str, end_date_str)
+
+# Занятия группы за период; общий для запросов статистики
+PERIOD_LESSONS_SQL = """
+    SELECT l.id, l.date, gs.subject_id FROM lessons l
+    JOIN group_subjects gs ON l.group_subject_id = gs.id
+    WHERE gs.group_id = :group_id AND l.date BETWEEN :start AND :end
+"""
+
+# Статистика студент x предмет: каждый студент группы должен был быть на каждом занятии предмета
+REPORT_STATS_SQL = f"""
+    WITH period_lessons AS ({PERIOD_LESSONS_SQL}),
+    subject_lessons AS (
+        SELECT subject_id, COUNT(*) as lessons FROM period_lessons GROUP BY subject_id
+    ),
+    marks AS (
+        SELECT
+            a.student_id,
+            pl.subject_id,
+            COUNT(CASE WHEN a.status = 'present' THEN 1 END) as present,
+            COUNT(CASE WHEN a.status = 'absent' THEN 1 END) as absent,
+            COUNT(CASE WHEN a.status = 'late' THEN 1 END) as late
+        FROM period_lessons pl
+        JOIN attendance a ON a.lesson_id = pl.id
+        GROUP BY a.student_id, pl.subject_id
+    )
+    SELECT
+        s.id as student_id,
+        s.full_name as student_name,
+        sub.name as subject_name,
+        sl.lessons as total,
+        COALESCE(m.present, 0) as present,
+        COALESCE(m.absent, 0) as absent,
+        COALESCE(m.late, 0) as late
+    FROM students s
+    CROSS JOIN subject_lessons sl
+    JOIN subjects sub ON sub.id = sl.subject_id
+    LEFT JOIN marks m ON m.student_id = s.id AND m.subject_id = sl.subject_id
+    WHERE s.group_id = :group_id
+    ORDER BY s.full_name, s.id, sub.name
+"""
+
+LESSON_DATES_SQL = f"""
+    WITH period_lessons AS ({PERIOD_LESSONS_SQL})
+    SELECT COUNT(DISTINCT date) FROM period_lessons
+"""
+
+REPORT_DETAIL_SQL = """
+    SELECT
+        g.name as group_name,
+        s.full_name as student_name,
+        sub.name as subject_name,
+        l.date as lesson_date,
+        CASE
+            WHEN a.status = 'present' THEN 'Присутствовал'
+            WHEN a.status = 'absent' THEN 'Отсутствовал'
+            WHEN a.status = 'late' THEN 'Опоздал'
+            ELSE 'Не отмечен'
+        END as attendance_status,
+        CASE
+            WHEN a.status = 'present' THEN 1
+            WHEN a.status = 'absent' THEN 0
+            WHEN a.status = 'late' THEN 0.5
+            ELSE NULL
+        END as attendance_score
+    FROM lessons l
+    JOIN group_subjects gs ON l.group_subject_id = gs.id
+    JOIN groups g ON gs.group_id = g.id
+    JOIN subjects sub ON gs.subject_id = sub.id
+    JOIN students s ON s.group_id = g.id
+    LEFT JOIN attendance a ON l.id = a.lesson_id AND a.student_id = s.id
+    WHERE g.id = ?
+    AND l.date BETWEEN ? AND ?
+    ORDER BY s.full_name, l.date
+"""
+
+STATUS_COLUMNS = ['Не отмечен', 'Опоздал', 'Отсутствовал', 'Присутствовал']
+COUNT_FIELDS = ('total', 'present', 'absent', 'late')
+
+def _status_counts(row):
+    """Значения колонок STATUS_COLUMNS для строки статистики"""
+    unmarked = row['total'] - row['present'] - row['absent'] - row['late']
+    return [unmarked, row['late'], row['absent'], row['present']]
+
+def _attendance_percent(row):
+    return round((row['present'] + row['late'] * 0.5) / row['total'] * 100, 1)
+
+def _load_report_data(conn, group_id, start_date_str, end_date_str):
+    """Общий для всех форматов результат: статистика студент x предмет за период"""
+    group_name = conn.execute("SELECT name FROM groups WHERE id = ?", (group_id,)).fetchone()['name']
+
+    params = {'group_id': group_id, 'start': start_date_str, 'end': end_date_str}
+    rows = [dict(row) for row in conn.execute(REPORT_STATS_SQL, params)]
+    if not rows:
+        return group_name, None
+
+    return group_name, {
+        'group_id': group_id,
+        'group_name': group_name,
+        'start': start_date_str,
+        'end': end_date_str,
+        'lesson_dates': conn.execute(LESSON_DATES_SQL, params).fetchone()[0],
+        'rows': rows,
+    }
+
+def _totals(rows, key, name):
+    """Сложить строки студент x предмет по ключу key (порядок первого появления)"""
+    totals = {}
+    for row in rows:
+        total = totals.get(row[key])
+        if total is None:
+            total = totals[row[key]] = {name: row[name], **dict.fromkeys(COUNT_FIELDS, 0)}
+        for field in COUNT_FIELDS:
+            total[field] += row[field]
+    return list(totals.values())
+
+def student_totals(data):
+    return _totals(data['rows'], 'student_id', 'student_name')
+
+def subject_totals(data):
+    return sorted(_totals(data['rows'], 'subject_name', 'subject_name'), key=lambda row: row['subject_name'])
+
+# --- Форматы отчета (строятся из общего результата _load_report_data)
+
+STATS_COLUMNS = ['student_name', 'subject_name', *STATUS_COLUMNS, 'Всего занятий', 'Процент посещаемости']
+
+def _stats_table(data):
+    """Строки статистики студент x предмет для табличных форматов"""
+    for row in data['rows']:
+        yield [row['student_name'], row['subject_name'], *_status_counts(row), row['total'], _attendance_percent(row)]
+
+def render_xlsx(data, conn=None):
+    """Excel отчет; с conn первым листом потоково пишется детальная посещаемость"""
+    student_stats = student_totals(data)
+
+    # write_only: строки листа не хранятся в памяти, а сразу пишутся во временный файл
+    workbook = Workbook(write_only=True)
+
+    # Лист с детальной посещаемостью (студенты x занятия) - только по запросу
+    if conn is not None:
+        detail_sheet = workbook.create_sheet('Детальная посещаемость')
+        cur = conn.execute(REPORT_DETAIL_SQL, (data['group_id'], data['start'], data['end']))
+        detail_sheet.append([column[0] for column in cur.description])
+        rows = cur.fetchmany(REPORT_CHUNK_SIZE)
+        while rows:
+            for row in rows:
+                detail_sheet.append(tuple(row))
+            rows = cur.fetchmany(REPORT_CHUNK_SIZE)
+
+    # Лист со статистикой по студентам
+    student_sheet = workbook.create_sheet('Статистика по студентам')
+    student_sheet.append(['student_name', *STATUS_COLUMNS, 'Всего занятий', 'Процент посещаемости'])
+    percents = []
+    for row in student_stats:
+        percent = _attendance_percent(row)
+        percents.append(percent)
+        student_sheet.append([row['student_name'], *_status_counts(row), row['total'], percent])
+
+    # Лист со статистикой по предметам
+    subject_sheet = workbook.create_sheet('Статистика по предметам')
+    subject_sheet.append(['subject_name', *STATUS_COLUMNS, 'Всего занятий'])
+    for row in subject_totals(data):
+        subject_sheet.append([row['subject_name'], *_status_counts(row), row['total']])
+
+    # Лист с общей сводкой
+    summary_sheet = workbook.create_sheet('Общая сводка')
+    summary_sheet.append(['Параметр', 'Значение'])
+    summary_sheet.append(['Группа', data['group_name']])
+    summary_sheet.append(['Период отчета', f"{data['start']} - {data['end']}"])
+    summary_sheet.append(['Всего занятий', data['lesson_dates']])
+    summary_sheet.append(['Всего студентов', len(student_stats)])
+    summary_sheet.append(['Средняя посещаемость', f"{sum(percents) / len(percents):.1f}%"])
+
+    # Архив собирается во временном файле, который уходит на диск, если вырастет
+    with SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES) as output:
+        workbook.save(output)
+        output.seek(0)
+        # Между процессами передаются байты готового файла
+        return output.read()
+
+def _build_detailed_excel_report(conn, group_id, start_date_str, end_date_str):
+    group_name, data = _load_report_data(conn, group_id, start_date_str, end_date_str)
+    if data is None:
+        return group_name, None
+    return group_name, render_xlsx(data, conn)
+
+def render_csv_gz(data):
+    """Статистика студент x предмет в CSV, сжатом gzip"""
+    output = BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb', mtime=0) as archive:
+        with io.TextIOWrapper(archive, encoding='utf-8', newline='') as text:
+            writer = csv.writer(text)
+            writer.writerow(STATS_COLUMNS)
+            writer.writerows(_stats_table(data))
+    return output.getvalue()
+
+def render_parquet(data):
+    """Статистика студент x предмет в Parquet (нужен pyarrow)"""
+    if pa is None:
+        raise RuntimeError("Для отчета в Parquet нужен пакет pyarrow")
+    columns = list(zip(*_stats_table(data)))
+    table = pa.table({name: list(values) for name, values in zip(STATS_COLUMNS, columns)})
+    output = BytesIO()
+    pq.write_table(table, output)
+    return output.getvalue()
+
+# Сколько студентов выводится в текстовой сводке (сообщение Telegram - до 4096 символов)
+TEXT_REPORT_MAX_STUDENTS = 40
+TEXT_REPORT_TRUNCATED = "... (сводка сокращена, полный отчет - в файле)"
+
+def _message_length(text):
+    """Длина текста так, как ее считает Telegram (в единицах UTF-16)"""
+    return len(text.encode('utf-16-le')) // 2
+
+def _fit_message(lines, limit=MessageLimit.MAX_TEXT_LENGTH):
+    """Склеить строки сообщения; то, что не влезает в лимит, отбрасывается с пометкой"""
+    text = "\n".join(lines)
+    if _message_length(text) <= limit:
+        return text
+
+    kept = []
+    size = _message_length(TEXT_REPORT_TRUNCATED)
+    for line in lines:
+        size += _message_length(line) + 1
+        if size > limit:
+            break
+        kept.append(line)
+    return "\n".join(kept + [TEXT_REPORT_TRUNCATED])
+
+def render_text(data):
+    """Краткая сводка для отправки сообщением, без файла"""
+    student_stats = student_totals(data)
+    percents = [_attendance_percent(row) for row in student_stats]
+
+    lines = [
+        "📊 Отчет по посещаемости",
+        "",
+        f"Группа: {data['group_name']}",
+        f"Период: {data['start']} - {data['end']}",
+        f"Занятий: {data['lesson_dates']}, студентов: {len(student_stats)}",
+        f"Средняя посещаемость: {sum(percents) / len(percents):.1f}%",
+        "",
+        "📚 По предметам:",
+    ]
+    for row in subject_totals(data):
+        lines.append(f"• {row['subject_name']}: {_attendance_percent(row)}% (пропусков: {row['absent']})")
+
+    lines.extend(["", "👥 По студентам:"])
+    for row, percent in list(zip(student_stats, percents))[:TEXT_REPORT_MAX_STUDENTS]:
+        lines.append(f"• {row['student_name']}: {percent}% (пропусков: {row['absent']})")
+    if len(student_stats) > TEXT_REPORT_MAX_STUDENTS:
+        lines.append(f"... и еще {len(student_stats) - TEXT_REPORT_MAX_STUDENTS} (полный список - в файле)")
+    # Длинные названия предметов и ФИО могут не влезть даже в 40 строк
+    return _fit_message(lines)
+
+# Формат -> расширение файла; text отправляется сообщением
+REPORT_FILE_SUFFIXES = {
+    'xlsx': '.xlsx',
+    'xlsx_detail': '_детальный.xlsx',
+    'csv': '.csv.gz',
+    'parquet': '.parquet',
+}
+
+def available_report_formats():
+    """Форматы отчета по группе, доступные в этой установке"""
+    formats = ['xlsx', 'xlsx_detail', 'csv', 'text']
+    if pa is not None:
+        formats.insert(3, 'parquet')
+    return formats
+
+# Сводка по всем группам: отметки считаются только для студентов своей группы
+CAMPUS_SUMMARY_SQL = """
+    WITH period_lessons AS (
+        SELECT l.id, gs.group_id FROM lessons l
+        JOIN group_subjects gs ON l.group_subject_id = gs.id
+        WHERE l.date BETWEEN :start AND :end
+    ),
+    lesson_counts AS (
+        SELECT group_id, COUNT(*) as lessons FROM period_lessons GROUP BY group_id
+    ),
+    student_counts AS (
+        SELECT group_id, COUNT(*) as students FROM students GROUP BY group_id
+    ),
+    marks AS (
+        SELECT
+            pl.group_id,
+            COUNT(CASE WHEN a.status = 'present' THEN 1 END) as present,
+            COUNT(CASE WHEN a.status = 'absent' THEN 1 END) as absent,
+            COUNT(CASE WHEN a.status = 'late' THEN 1 END) as late
+        FROM period_lessons pl
+        JOIN attendance a ON a.lesson_id = pl.id
+        JOIN students s ON s.id = a.student_id AND s.group_id = pl.group_id
+        GROUP BY pl.group_id
+    )
+    SELECT
+        g.name as group_name,
+        COALESCE(sc.students, 0) as students,
+        COALESCE(lc.lessons, 0) as lessons,
+        COALESCE(lc.lessons, 0) * COALESCE(sc.students, 0) as total,
+        COALESCE(m.present, 0) as present,
+        COALESCE(m.absent, 0) as absent,
+        COALESCE(m.late, 0) as late
+    FROM groups g
+    LEFT JOIN student_counts sc ON sc.group_id = g.id
+    LEFT JOIN lesson_counts lc ON lc.group_id = g.id
+    LEFT JOIN marks m ON m.group_id = g.id
+    ORDER BY g.name
+"""
+
+def build_campus_summary(start_date_str, end_date_str):
+    """Построить Excel сводку по всем группам за период (байты файла)"""
+    conn = _get_worker_connection()
+    try:
+        rows = conn.execute(CAMPUS_SUMMARY_SQL, {'start': start_date_str, 'end': end_date_str}).fetchall()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Сводка по группам')
+    sheet.append(['Группа', 'Студентов', 'Занятий', *STATUS_COLUMNS, 'Процент посещаемости'])
+    for row in rows:
+        percent = _attendance_percent(row) if row['total'] else None
+        sheet.append([row['group_name'], row['students'], row['lessons'], *_status_counts(row), percent])
+
+    with SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES) as output:
+        workbook.save(output)
+        output.seek(0)
+        return output.read()
+
+def _load_groups(conn):
+    return [(row['id'], row['name']) for row in conn.execute("SELECT id, name FROM groups ORDER BY name")]
+
+def _safe_filename(name):
+    return re.sub(r'[\\/:*?"<>|]+', '_', name).strip() or 'группа'
+
+def _pack_bundle(files):
+    """Упаковать [(имя файла, байты)] в ZIP; xlsx уже сжат, поэтому без повторного сжатия"""
+    with SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES) as output:
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for filename, content in files:
+                archive.writestr(filename, content)
+        output.seek(0)
+        return output.read()
+
+# --- Очередь отчетов (выполняется в процессе бота)
+
+class ReportQueueFull(Exception):
+    """Очередь отчетов заполнена, новый отчет не принят"""
+
+class ReportService:
+    """Построение отчетов в пуле процессов.
+
+    Одновременно выполняется не больше workers отчетов, всего принятых
+    заданий в работе и в очереди - не больше max_pending; сверх этого отчет
+    отклоняется с ReportQueueFull. Части принятого задания (данные отчета,
+    отчеты групп в архиве) в этот лимит не входят. Одинаковые запросы,
+    пришедшие пока отчет строится, ждут тот же результат, а не запускают
+    построение заново.
+    """
+
+    def __init__(self, workers=REPORT_WORKERS, max_pending=REPORT_QUEUE_SIZE, cache=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = asyncio.Semaphore(workers)
+        self._inflight = {}  # ключ отчета -> asyncio.Task
+        self._admitted = set()  # ключи принятых заданий, учитываемых в max_pending
+        self.cache = cache if cache is not None else ReportCache()
+        self.completed = 0
+        self.shared = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют потоки и соединения бота
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    @property
+    def pending(self):
+        return len(self._admitted)
+
+    async def submit(self, key, factory, admit=True):
+        """Запустить factory() как задачу; одинаковые key разделяют одно построение.
+
+        admit=False - для частей уже принятого задания (отчеты групп в архиве):
+        они не проходят проверку заполненности очереди и не занимают в ней места.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            if admit and len(self._admitted) >= self.max_pending:
+                self.rejected += 1
+                raise ReportQueueFull()
+
+            task = asyncio.create_task(factory())
+            self._inflight[key] = task
+            if admit:
+                self._admitted.add(key)
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        # Отмена одного ожидающего не должна отменять построение для остальных
+        return await asyncio.shield(task)
+
+    async def _run(self, func, *args):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # Процесс пула упал (например, по памяти) - следующий отчет запустит новый пул
+                if self._executor is executor:
+                    self._executor = None
+                executor.shutdown(wait=False)
+                raise
+
+    def _done(self, key, task):
+        self._inflight.pop(key, None)
+        self._admitted.discard(key)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Ошибка построения отчета {key}: {task.exception()}")
+        else:
+            self.completed += 1
+
+    async def build_report(self, group_id, start_date_str, end_date_str, report_format='xlsx', admit=True):
+        """Отчет по группе за период: (название группы, содержимое в формате report_format или None).
+
+        admit=False - отчет для архива: он уже принят вместе с архивом и не
+        сохраняется в кэш, чтобы отчеты всех групп не вытеснили из него
+        отчеты, запрошенные по отдельности.
+        """
+        version = await run_db(get_group_data_version, group_id)
+        key = (group_id, start_date_str, end_date_str, report_format, version)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        
+        built_version, result = await self.submit(
+            key, partial(self._build_report, group_id, start_date_str, end_date_str, report_format, version, admit), admit
+        )
+        if admit:
+            self.cache.put((group_id, start_date_str, end_date_str, report_format, built_version), result)
+        return result
+
+    async def _build_report(self, group_id, start_date_str, end_date_str, report_format, version, store=True):
+        if report_format == 'xlsx_detail':
+            # Детальный лист читается из БД построчно, поэтому отчет целиком строится в процессе пула
+            return await self._run(build_detailed_excel_report, group_id, start_date_str, end_date_str)
+        
+        # Все остальные форматы строятся из одного посчитанного результата
+        version, (group_name, data) = await self._get_report_data(group_id, start_date_str, end_date_str, version, store)
+        if data is None:
+            return version, (group_name, None)
+        
+        if report_format == 'xlsx':
+            content = await self._run(render_xlsx, data)
+        elif report_format == 'csv':
+            content = await asyncio.to_thread(render_csv_gz, data)
+        elif report_format == 'parquet':
+            content = await asyncio.to_thread(render_parquet, data)
+        elif report_format == 'text':
+            content = render_text(data)
+        else:
+            raise ValueError(f"Неизвестный формат отчета: {report_format}")
+        return version, (group_name, content)
+
+    async def _get_report_data(self, group_id, start_date_str, end_date_str, version, store=True):
+        """Посчитанные данные отчета: (версия данных, (название группы, данные или None))"""
+        key = (group_id, start_date_str, end_date_str, 'data', version)
+        result = self.cache.get(key)
+        if result is not None:
+            return version, result
+        
+        built_version, result = await self.submit(
+            key, partial(self._run, load_report_data, group_id, start_date_str, end_date_str), admit=False
+        )
+        if store:
+            self.cache.put((group_id, start_date_str, end_date_str, 'data', built_version), result)
+        return built_version, result
+
+    async def build_campus_bundle(self, start_date_str, end_date_str):
+        """ZIP с отчетами всех групп и общей сводкой: (байты архива, число групп, группы с ошибкой)"""
+        key = ('campus', start_date_str, end_date_str)
+        return await self.submit(key, partial(self._build_campus_bundle, start_date_str, end_date_str))
+
+    async def _build_campus_bundle(self, start_date_str, end_date_str):
+        groups = await run_db(_load_groups)
+        
+        # Отчеты групп строятся параллельно во всех процессах пула (и берутся из кэша, если готовы)
+        summary, *results = await asyncio.gather(
+            self._run(build_campus_summary, start_date_str, end_date_str),
+            *(self.build_report(group_id, start_date_str, end_date_str, admit=False) for group_id, _ in groups),
+            return_exceptions=True
+        )
+        if isinstance(summary, BaseException):
+            raise summary
+        
+        files = [('Сводка по группам.xlsx', summary)]
+        failed = []
+        for (group_id, group_name), result in zip(groups, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка построения отчета группы {group_id}: {result}")
+                failed.append(group_name)
+            elif result[1] is not None:
+                files.append((f"{_safe_filename(group_name)}_{group_id}.xlsx", result[1]))
+        
+        content = await asyncio.to_thread(_pack_bundle, files)
+        return content, len(files) - 1, failed
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'completed': self.completed,
+            'shared': self.shared,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self):
+        """Остановить пул процессов (недостроенные отчеты отменяются)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+report_service = ReportService()
\ No newline at end of file
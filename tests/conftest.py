@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from reference_cache import reference_cache
+from utils import role_cache
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """БД последней версии схемы во временном каталоге; соединение для подготовки и проверок"""
+    monkeypatch.chdir(tmp_path)
+    # Пул открывает соединения по относительному пути DB_NAME
+    database._pool.close()
+    database.init_database()
+    conn = database._connect()
+    yield conn
+    conn.close()
+    database._pool.close()
+    reference_cache.invalidate()
+    role_cache.invalidate()
\ No newline at end of file
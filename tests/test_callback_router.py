@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from callback_router import CallbackRoute, CallbackRouter
+
+REPORT_FORMAT = 'report_format_{group_id:int}_{start_date_str}_{end_date_str}_{report_format}'
+
+def build_router():
+    router = CallbackRouter()
+    router.add('help', 'help')
+    router.add('back_to_main', 'back_to_main')
+    router.add('list_subjects_group_{group_id:int}', 'list_subjects_group')
+    router.add('list_{what}', 'list')
+    router.add(REPORT_FORMAT, 'report_format')
+    router.compile()
+    return router
+
+def test_exact_route_without_fields():
+    route, fields = build_router().match('help')
+    assert (route.handler, fields) == ('help', {})
+
+def test_int_field_is_converted():
+    route, fields = build_router().match('list_subjects_group_12')
+    assert (route.handler, fields) == ('list_subjects_group', {'group_id': 12})
+
+def test_longest_prefix_wins_and_falls_back_to_shorter():
+    router = build_router()
+    assert router.match('list_subjects_group_7')[0].handler == 'list_subjects_group'
+    # Поле не число - подходит только более короткий префикс
+    route, fields = router.match('list_subjects_group_all')
+    assert (route.handler, fields) == ('list', {'what': 'subjects_group_all'})
+
+def test_report_format_tail_field_keeps_underscores():
+    route, fields = build_router().match('report_format_3_2024-01-01_2024-01-31_xlsx_detail')
+    assert route.handler == 'report_format'
+    assert fields == {
+        'group_id': 3,
+        'start_date_str': '2024-01-01',
+        'end_date_str': '2024-01-31',
+        'report_format': 'xlsx_detail',
+    }
+
+@pytest.mark.parametrize('data', [
+    'unknown',
+    'report_format_x_2024-01-01_2024-01-31_csv',  # group_id не число
+    'report_format_3_2024-01-01',  # не хватает полей
+    'list_',  # пустое поле
+    'help_me',
+])
+def test_unmatched(data):
+    assert build_router().match(data) == (None, None)
+
+def test_route_match_parses_whole_callback_data():
+    route = CallbackRoute('confirm_delete_group_{group_id:int}')
+    with_students = CallbackRoute('confirm_delete_group_with_students_{group_id:int}')
+    assert route.match('confirm_delete_group_5') == {'group_id': 5}
+    assert route.match('confirm_delete_group_with_students_5') is None
+    assert with_students.match('confirm_delete_group_with_students_5') == {'group_id': 5}
+    assert CallbackRoute('mark_{action}_{student_id:int}').match('mark_all_present') is None
+    assert CallbackRoute('back_to_main').match('back_to_main') == {}
+    assert CallbackRoute('back_to_main').match('back_to_main_menu') is None
+
+def test_invalid_tables():
+    with pytest.raises(ValueError):
+        CallbackRoute('report_{group_id:int}_format')
+    router = CallbackRouter()
+    router.add('help', 'a')
+    router.add('help', 'b')
+    with pytest.raises(ValueError):
+        router.compile()
+    router = CallbackRouter()
+    router.compile()
+    with pytest.raises(RuntimeError):
+        router.add('help', 'a')
+
+def test_dispatch_counts_hits_and_unmatched():
+    calls = []
+
+    async def handler(update, context, **fields):
+        calls.append(fields)
+
+    router = CallbackRouter()
+    router.add('list_subjects_group_{group_id:int}', handler)
+    router.compile()
+
+    def update(data):
+        return SimpleNamespace(callback_query=SimpleNamespace(data=data))
+
+    assert asyncio.run(router.dispatch(update('list_subjects_group_4'), None)) is True
+    assert asyncio.run(router.dispatch(update('nothing'), None)) is False
+    assert calls == [{'group_id': 4}]
+    assert router.stats() == {'routes': 1, 'hits': [('list_subjects_group', 1)], 'unmatched': 1}
\ No newline at end of file
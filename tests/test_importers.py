@@ -0,0 +1,86 @@
+import io
+
+import pytest
+
+from importers import ImportFileError, apply_roster_import, diff_roster, read_roster
+
+def csv_file(text):
+    return io.BytesIO(text.encode('utf-8-sig'))
+
+def roster(db):
+    return sorted(
+        (row['full_name'], row['name'], row['telegram_id'])
+        for row in db.execute("SELECT s.full_name, g.name, s.telegram_id FROM students s JOIN groups g ON g.id = s.group_id")
+    )
+
+def fill(db):
+    db.executescript('''
+        INSERT INTO groups (id, name) VALUES (1, 'ИВТ-24-1'), (2, 'ИВТ-24-2'), (3, 'ПИ-24-1');
+        INSERT INTO students (id, full_name, group_id, telegram_id) VALUES
+            (1, 'Иванов Иван', 1, 101),
+            (2, 'Петров Петр', 1, NULL),
+            (3, 'Сидоров Сидор', 2, 103),
+            (4, 'Кузнецов Кузьма', 3, NULL);
+    ''')
+    db.commit()
+
+def test_read_roster_skips_header_duplicates_and_incomplete_rows():
+    data = csv_file(
+        "ФИО;Группа\n"
+        "Иванов  Иван;ИВТ-24-1\n"
+        "Иванов Иван;ИВТ-24-1\n"
+        "Иванов Иван;ИВТ-24-2\n"
+        "Петров Петр;\n"
+        ";\n"
+    )
+    entries, skipped = read_roster(data, 'roster.CSV')
+    # Тезки в разных группах - разные записи, повтор той же пары - одна
+    assert entries == [('Иванов Иван', 'ИВТ-24-1'), ('Иванов Иван', 'ИВТ-24-2')]
+    assert skipped == 2
+
+def test_read_roster_rejects_unknown_format():
+    with pytest.raises(ImportFileError):
+        read_roster(io.BytesIO(b''), 'roster.txt')
+
+def test_diff_roster(db):
+    fill(db)
+    diff = diff_roster(db, [
+        ('Иванов Иван', 'ИВТ-24-1'),  # без изменений
+        ('Сидоров Сидор', 'ИВТ-24-1'),  # перевод из ИВТ-24-2
+        ('Новиков Николай', 'ИВТ-24-3'),  # новая группа
+    ])
+    assert diff['unchanged'] == 1
+    assert diff['new_groups'] == ['ИВТ-24-3']
+    assert diff['moves'] == [('Сидоров Сидор', 'ИВТ-24-1', 3)]
+    assert diff['inserts'] == [('Новиков Николай', 'ИВТ-24-3')]
+    # Удаляются только студенты групп из файла: Кузнецова (ПИ-24-1) файл не касается
+    assert [row['id'] for row in diff['removals']] == [2]
+
+def test_diff_roster_namesakes_are_added_not_moved(db):
+    fill(db)
+    db.execute("INSERT INTO students (full_name, group_id) VALUES ('Иванов Иван', 2)")
+    db.commit()
+    diff = diff_roster(db, [('Иванов Иван', 'ПИ-24-1'), ('Кузнецов Кузьма', 'ПИ-24-1')])
+    assert diff['moves'] == []
+    assert diff['inserts'] == [('Иванов Иван', 'ПИ-24-1')]
+    assert diff['removals'] == []
+
+def test_apply_roster_import_removes_only_when_asked(db):
+    fill(db)
+    entries = [('Иванов Иван', 'ИВТ-24-1'), ('Сидоров Сидор', 'ИВТ-24-1'), ('Новиков Николай', 'ИВТ-24-3')]
+
+    summary, removed = apply_roster_import(db, entries)
+    assert (summary['inserted'], summary['moved'], summary['removed'], summary['groups_created']) == (1, 1, 0, 1)
+    assert removed == []
+    assert roster(db) == [
+        ('Иванов Иван', 'ИВТ-24-1', 101),
+        ('Кузнецов Кузьма', 'ПИ-24-1', None),
+        ('Новиков Николай', 'ИВТ-24-3', None),
+        ('Петров Петр', 'ИВТ-24-1', None),
+        ('Сидоров Сидор', 'ИВТ-24-1', 103),
+    ]
+
+    summary, removed = apply_roster_import(db, entries, remove_missing=True)
+    assert (summary['inserted'], summary['moved'], summary['removed'], summary['unchanged']) == (0, 0, 1, 3)
+    assert ('Петров Петр', 'ИВТ-24-1', None) not in roster(db)
+    assert removed == []
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
+
+from message_editor import MessageEditor
+
+WINDOW = 0.05
+
+class FakeBot:
+    """Записывает правки; errors - исключения для первых вызовов"""
+
+    def __init__(self, errors=()):
+        self.edits = []
+        self.errors = list(errors)
+
+    async def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.edits.append(text)
+
+def message(bot, message_id=1):
+    return SimpleNamespace(chat=SimpleNamespace(id=10), message_id=message_id, get_bot=lambda: bot)
+
+def keyboard(label):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=label)]])
+
+async def settle(editor):
+    while any(state.task is not None and not state.task.done() for state in editor._states.values()):
+        await asyncio.sleep(WINDOW / 5)
+
+def test_rapid_edits_coalesce_into_first_and_last():
+    bot = FakeBot()
+    editor = MessageEditor(window=WINDOW)
+
+    async def scenario():
+        for n in range(5):
+            editor.edit(message(bot), f"экран {n}", keyboard(str(n)))
+            await asyncio.sleep(0)
+        await settle(editor)
+
+    asyncio.run(scenario())
+    assert bot.edits == ["экран 0", "экран 4"]
+    assert editor.stats()['coalesced'] == 3
+
+def test_unchanged_screen_is_not_sent():
+    bot = FakeBot()
+    editor = MessageEditor(window=WINDOW)
+
+    async def scenario():
+        editor.edit(message(bot), "экран", keyboard('a'))
+        await settle(editor)
+        editor.edit(message(bot), "экран", keyboard('a'))
+        # Нажатия вернули экран к уже показанному до отправки
+        editor.edit(message(bot), "другой", keyboard('a'))
+        editor.edit(message(bot), "экран", keyboard('a'))
+        await settle(editor)
+
+    asyncio.run(scenario())
+    assert bot.edits == ["экран"]
+    assert editor.stats()['unchanged'] == 2
+
+def test_messages_are_edited_independently():
+    bot = FakeBot()
+    editor = MessageEditor(window=WINDOW)
+
+    async def scenario():
+        editor.edit(message(bot, 1), "первое")
+        editor.edit(message(bot, 2), "второе")
+        await settle(editor)
+
+    asyncio.run(scenario())
+    assert sorted(bot.edits) == ["второе", "первое"]
+
+def test_edit_now_replaces_pending_edits():
+    bot = FakeBot()
+    editor = MessageEditor(window=WINDOW)
+
+    async def scenario():
+        editor.edit(message(bot), "экран 1")
+        await asyncio.sleep(0)
+        editor.edit(message(bot), "экран 2")
+        await editor.edit_now(message(bot), "сохранено")
+        await asyncio.sleep(WINDOW * 2)
+
+    asyncio.run(scenario())
+    assert bot.edits == ["экран 1", "сохранено"]
+
+def test_retry_after_and_not_modified():
+    bot = FakeBot([RetryAfter(timedelta(seconds=WINDOW)), BadRequest("Message is not modified")])
+    editor = MessageEditor(window=WINDOW)
+
+    async def scenario():
+        editor.edit(message(bot), "экран")
+        await settle(editor)
+        editor.edit(message(bot), "новый экран")
+        await settle(editor)
+
+    asyncio.run(scenario())
+    # Правка повторена после паузы, и Telegram ответил, что она уже показана
+    assert bot.edits == ["новый экран"]
+    stats = editor.stats()
+    assert (stats['retry_after'], stats['not_modified'], stats['sent']) == (1, 1, 1)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import pytest
+
+from database import _connect
+from migrations import LATEST_VERSION, get_schema_version, migrate, rebuild_attendance_summary
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = _connect(str(tmp_path / 'migrations.db'))
+    yield conn
+    conn.close()
+
+def summary(conn):
+    """Сводка без пустых строк: триггеры оставляют нули, полный пересчет - нет"""
+    return sorted(tuple(row) for row in conn.execute(
+        "SELECT student_id, group_subject_id, present, absent, late FROM attendance_summary "
+        "WHERE present + absent + late > 0"
+    ))
+
+def lesson_stats(conn):
+    return sorted(tuple(row) for row in conn.execute(
+        "SELECT group_subject_id, lesson_count, last_lesson_date FROM group_subject_stats"
+    ))
+
+def assert_matches_rebuild(conn):
+    by_triggers = summary(conn), lesson_stats(conn)
+    rebuild_attendance_summary(conn)
+    assert (summary(conn), lesson_stats(conn)) == by_triggers
+
+def fill(conn):
+    """Группа с двумя предметами, два студента, три занятия с отметками"""
+    conn.executescript('''
+        INSERT INTO groups (id, name) VALUES (1, 'ИВТ-24-1');
+        INSERT INTO students (id, full_name, group_id) VALUES (1, 'Иванов', 1), (2, 'Петров', 1);
+        INSERT INTO subjects (id, name) VALUES (1, 'Математика'), (2, 'Физика');
+        INSERT INTO group_subjects (id, group_id, subject_id) VALUES (1, 1, 1), (2, 1, 2);
+        INSERT INTO lessons (id, group_subject_id, date) VALUES
+            (1, 1, '2024-01-10'), (2, 1, '2024-01-17'), (3, 2, '2024-01-11');
+        INSERT INTO attendance (student_id, lesson_id, status) VALUES
+            (1, 1, 'present'), (2, 1, 'absent'),
+            (1, 2, 'late'), (2, 2, 'present'),
+            (1, 3, 'absent');
+    ''')
+    conn.commit()
+
+def test_all_migrations_applied_once(conn):
+    assert migrate(conn) == list(range(1, LATEST_VERSION + 1))
+    assert get_schema_version(conn) == LATEST_VERSION
+    assert migrate(conn) == []
+
+def test_reapplied_migrations_are_idempotent(conn):
+    migrate(conn)
+    # Миграция прервана до записи версии: ее столбцы уже добавлены
+    conn.execute("DELETE FROM schema_version WHERE version = 9")
+    conn.commit()
+    assert migrate(conn) == [9]
+
+def test_triggers_keep_summary_in_sync(conn):
+    migrate(conn)
+    fill(conn)
+    assert lesson_stats(conn) == [(1, 2, '2024-01-17'), (2, 1, '2024-01-11')]
+    assert_matches_rebuild(conn)
+
+    conn.execute("UPDATE attendance SET status = 'present' WHERE student_id = 2 AND lesson_id = 1")
+    conn.execute("DELETE FROM attendance WHERE student_id = 1 AND lesson_id = 3")
+    conn.execute("UPDATE lessons SET date = '2024-01-24' WHERE id = 2")
+    conn.commit()
+    assert lesson_stats(conn) == [(1, 2, '2024-01-24'), (2, 1, '2024-01-11')]
+    assert_matches_rebuild(conn)
+
+def test_moved_lesson_takes_its_marks(conn):
+    migrate(conn)
+    fill(conn)
+    conn.execute("UPDATE lessons SET group_subject_id = 2 WHERE id = 2")
+    conn.commit()
+    assert lesson_stats(conn) == [(1, 1, '2024-01-10'), (2, 2, '2024-01-17')]
+    assert_matches_rebuild(conn)
+
+def test_moving_last_lesson_away_removes_subject_stats(conn):
+    migrate(conn)
+    fill(conn)
+    conn.execute("UPDATE lessons SET group_subject_id = 1 WHERE id = 3")
+    conn.commit()
+    assert lesson_stats(conn) == [(1, 3, '2024-01-17')]
+    assert_matches_rebuild(conn)
+
+def test_deleting_lessons_updates_subject_stats(conn):
+    migrate(conn)
+    fill(conn)
+    conn.execute("DELETE FROM attendance WHERE lesson_id IN (2, 3)")
+    conn.execute("DELETE FROM lessons WHERE id IN (2, 3)")
+    conn.commit()
+    # У предмета без занятий строки нет, как после полного пересчета
+    assert lesson_stats(conn) == [(1, 1, '2024-01-10')]
+    assert_matches_rebuild(conn)
\ No newline at end of file
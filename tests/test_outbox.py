@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import Forbidden, NetworkError
+
+import outbox
+from outbox import Outbox, TokenBucket
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(outbox, 'time', SimpleNamespace(monotonic=clock, time=lambda: clock.now))
+    return clock
+
+def test_bucket_starts_full_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate=30, capacity=15)
+    assert bucket.take(50) == 15
+    assert bucket.take(1) == 0
+    clock.now += 0.25
+    assert bucket.take(50) == 7
+
+def test_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(rate=30, capacity=15)
+    bucket.take(15)
+    clock.now += 60
+    assert bucket.take(100) == 15
+
+def test_bucket_pause_stops_tokens_until_retry_after(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.pause(2)
+    clock.now += 1.9
+    assert bucket.take(10) == 0
+    # Токены копятся только с конца паузы
+    clock.now += 0.25
+    assert bucket.take(10) == 1
+    # Более короткая пауза не сокращает текущую
+    bucket.pause(5)
+    bucket.pause(1)
+    clock.now += 4
+    assert bucket.take(10) == 0
+
+class FailingBot:
+    """Бот, отправка которого в некоторые чаты завершается ошибкой"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        self.sent.append(chat_id)
+
+def test_deliver_records_every_result_when_some_sends_fail(monkeypatch):
+    rows = [{'id': chat_id, 'chat_id': chat_id, 'text': 'текст', 'attempts': 0} for chat_id in (1, 2, 3, 4)]
+    recorded = []
+
+    async def fake_run_db(func, *args):
+        if func is outbox._load_due:
+            return rows
+        recorded.extend(args[0])
+
+    monkeypatch.setattr(outbox, 'run_db', fake_run_db)
+    bot = FailingBot({1: ValueError('сбой'), 2: Forbidden('blocked'), 3: NetworkError('timeout')})
+    asyncio.run(Outbox(rate=10).deliver(bot))
+
+    assert bot.sent == [4]
+    assert {result['id']: result['status'] for result in recorded} == {
+        1: 'pending', 2: 'failed', 3: 'pending', 4: 'sent'
+    }
\ No newline at end of file
@@ -0,0 +1,88 @@
+import asyncio
+
+from persistence import COMPRESSED, RAW, SQLitePersistence
+
+def stored(db, kind):
+    return {key: bytes(data) for key, data in db.execute("SELECT key, data FROM persistence WHERE kind = ?", (kind,))}
+
+def test_data_survives_restart(db):
+    async def save():
+        persistence = SQLitePersistence()
+        await persistence.update_user_data(42, {'group_id': 3})
+        await persistence.update_chat_data(42, {'page': 2})
+        await persistence.update_bot_data({'started': True})
+        await persistence.update_conversation('add_student', (42, 42), 1)
+        await persistence.flush()
+        return persistence.stats()
+
+    async def load():
+        persistence = SQLitePersistence()
+        return (
+            await persistence.get_user_data(),
+            await persistence.get_chat_data(),
+            await persistence.get_bot_data(),
+            await persistence.get_conversations('add_student'),
+        )
+
+    stats = asyncio.run(save())
+    assert (stats['written'], stats['batches'], stats['pending']) == (4, 1, 0)
+    assert asyncio.run(load()) == ({42: {'group_id': 3}}, {42: {'page': 2}}, {'started': True}, {(42, 42): 1})
+
+def test_unchanged_data_is_not_rewritten(db):
+    async def scenario():
+        persistence = SQLitePersistence()
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.flush()
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.update_user_data(2, {'b': 2})
+        await persistence.flush()
+        # Загруженная запись тоже известна и не перезаписывается
+        restarted = SQLitePersistence()
+        await restarted.get_user_data()
+        await restarted.update_user_data(2, {'b': 2})
+        await restarted.flush()
+        return persistence.stats(), restarted.stats()
+
+    stats, restarted = asyncio.run(scenario())
+    assert (stats['written'], stats['unchanged']) == (2, 1)
+    assert (restarted['written'], restarted['unchanged']) == (0, 1)
+
+def test_empty_data_and_ended_conversations_are_deleted(db):
+    async def scenario():
+        persistence = SQLitePersistence()
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.update_chat_data(1, {'a': 1})
+        await persistence.update_conversation('add_student', (1, 1), 2)
+        await persistence.flush()
+        await persistence.update_user_data(1, {})
+        await persistence.drop_chat_data(1)
+        await persistence.update_conversation('add_student', (1, 1), None)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert db.execute("SELECT COUNT(*) FROM persistence").fetchone()[0] == 0
+
+def test_large_data_is_compressed(db):
+    async def scenario():
+        persistence = SQLitePersistence()
+        await persistence.update_user_data(1, {'note': 'x' * 1000})
+        await persistence.update_user_data(2, {'a': 1})
+        await persistence.flush()
+        return await SQLitePersistence().get_user_data()
+
+    loaded = asyncio.run(scenario())
+    blobs = stored(db, 'user_data')
+    assert blobs['1'][:1] == COMPRESSED and len(blobs['1']) < 1000
+    assert blobs['2'][:1] == RAW
+    assert loaded == {1: {'note': 'x' * 1000}, 2: {'a': 1}}
+
+def test_unreadable_record_is_skipped(db):
+    async def scenario():
+        persistence = SQLitePersistence()
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    db.execute("INSERT INTO persistence (kind, key, data) VALUES ('user_data', '2', ?)", (b'p-broken',))
+    db.commit()
+    assert asyncio.run(SQLitePersistence().get_user_data()) == {1: {'a': 1}}
\ No newline at end of file
@@ -0,0 +1,75 @@
+import os
+
+from report_cache import ReportCache, get_group_data_version
+
+def key(group_id, version, report_format='xlsx'):
+    return (group_id, '2024-01-01', '2024-01-31', report_format, version)
+
+def test_key_includes_data_version():
+    cache = ReportCache(spill_dir=None)
+    cache.put(key(1, 1), ('ИВТ-24-1', b'old'))
+    assert cache.get(key(1, 1)) == ('ИВТ-24-1', b'old')
+    # Данные группы изменились - отчета новой версии еще нет
+    assert cache.get(key(1, 2)) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_new_version_replaces_older_versions_of_same_report():
+    cache = ReportCache(spill_dir=None)
+    cache.put(key(1, 1), ('g', b'v1'))
+    cache.put(key(1, 1, 'csv'), ('g', b'csv'))
+    cache.put(key(1, 2), ('g', b'v2'))
+    assert cache.get(key(1, 1)) is None
+    assert cache.get(key(1, 2)) == ('g', b'v2')
+    # Другой формат - другой отчет
+    assert cache.get(key(1, 1, 'csv')) == ('g', b'csv')
+
+def test_group_version_follows_triggers(db):
+    db.execute("INSERT INTO groups (id, name) VALUES (1, 'A')")
+    db.commit()
+    before = get_group_data_version(db, 1)
+    db.execute("INSERT INTO students (full_name, group_id) VALUES ('Иванов', 1)")
+    db.commit()
+    assert get_group_data_version(db, 1) == before + 1
+    assert get_group_data_version(db, 2) == 0
+
+def test_evicted_reports_spill_to_disk_and_come_back(tmp_path):
+    spill_dir = tmp_path / 'cache'
+    cache = ReportCache(max_entries=1, max_bytes=1024, spill_dir=str(spill_dir), max_disk_bytes=1024)
+    cache.put(key(1, 1), ('A', b'a' * 100))
+    cache.put(key(2, 1), ('B', b'b' * 100))
+
+    stats = cache.stats()
+    assert (stats['size'], stats['disk_size'], stats['disk_bytes']) == (1, 1, 100)
+    assert len(os.listdir(spill_dir)) == 1
+
+    # Отчет читается с диска и снова попадает в память, вытесняя другой
+    assert cache.get(key(1, 1)) == ('A', b'a' * 100)
+    assert cache.get(key(2, 1)) == ('B', b'b' * 100)
+    assert cache.stats()['misses'] == 0
+
+def test_disk_limit_and_invalidate(tmp_path):
+    spill_dir = tmp_path / 'cache'
+    cache = ReportCache(max_entries=1, max_bytes=1024, spill_dir=str(spill_dir), max_disk_bytes=150)
+    for group_id in range(1, 4):
+        cache.put(key(group_id, 1), ('g', bytes(100)))
+
+    # На диске помещается один отчет: первый вытесненный удален
+    assert cache.get(key(1, 1)) is None
+    assert cache.get(key(2, 1)) is not None
+    assert cache.stats()['disk_bytes'] <= 150
+
+    cache.invalidate()
+    assert cache.stats()['size'] == cache.stats()['disk_size'] == 0
+    assert os.listdir(spill_dir) == []
+
+def test_stale_spill_files_are_removed(tmp_path):
+    spill_dir = tmp_path / 'cache'
+    spill_dir.mkdir()
+    (spill_dir / 'report_old.pkl').write_bytes(b'')
+    (spill_dir / 'other.txt').write_bytes(b'')
+    cache = ReportCache(max_entries=1, max_bytes=1024, spill_dir=str(spill_dir))
+    cache.put(key(1, 1), ('g', b'1'))
+    cache.put(key(2, 1), ('g', b'2'))
+    assert 'report_old.pkl' not in os.listdir(spill_dir)
+    assert 'other.txt' in os.listdir(spill_dir)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import asyncio
+
+import reports
+from report_cache import ReportCache
+from reports import ReportService
+
+GROUPS = 12
+
+def fill(db):
+    db.executemany("INSERT INTO groups (id, name) VALUES (?, ?)", [(n, f'Группа {n}') for n in range(1, GROUPS + 1)])
+    db.commit()
+
+def gated_service(gate):
+    """Сервис, у которого построение в пуле процессов ждет gate"""
+    service = ReportService(workers=2, max_pending=8, cache=ReportCache(spill_dir=None))
+    results = {
+        reports.build_campus_summary: b'summary',
+        reports.load_report_data: (0, ('Группа', {'rows': 1})),  # (версия данных, результат)
+        reports.render_xlsx: b'xlsx',
+    }
+
+    async def run(func, *args):
+        await gate.wait()
+        return results[func]
+
+    service._run = run
+    return service
+
+async def wait_until(condition, timeout=5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+def test_single_report_admitted_while_bundle_runs(db):
+    fill(db)
+
+    async def scenario():
+        gate = asyncio.Event()
+        service = gated_service(gate)
+        bundle = asyncio.create_task(service.build_campus_bundle('2024-01-01', '2024-01-31'))
+        # Архив, отчеты и данные всех групп уже строятся
+        await wait_until(lambda: len(service._inflight) == 1 + 2 * GROUPS)
+        assert service.pending == 1
+
+        single = asyncio.create_task(service.build_report(1, '2024-02-01', '2024-02-29'))
+        await wait_until(lambda: service.pending == 2 or single.done())
+        assert not single.done()
+
+        gate.set()
+        (content, groups_count, failed), report = await asyncio.gather(bundle, single)
+        return service, groups_count, failed, report
+
+    service, groups_count, failed, report = asyncio.run(scenario())
+    assert (groups_count, failed, report) == (GROUPS, [], ('Группа', b'xlsx'))
+    assert service.stats()['pending'] == 0
+    assert service.stats()['rejected'] == 0
+    # В кэше только отдельно запрошенный отчет и его данные, отчеты из архива не сохраняются
+    assert service.cache.stats()['size'] == 2
+
+def test_queue_limit_counts_admitted_reports(db):
+    fill(db)
+
+    async def scenario():
+        gate = asyncio.Event()
+        service = gated_service(gate)
+        service.max_pending = 2
+        first = [asyncio.create_task(service.build_report(n, '2024-01-01', '2024-01-31')) for n in (1, 2)]
+        await wait_until(lambda: service.pending == 2)
+        try:
+            await service.build_report(3, '2024-01-01', '2024-01-31')
+        except reports.ReportQueueFull:
+            rejected = True
+        else:
+            rejected = False
+        # Тот же отчет не занимает новое место в очереди
+        same = asyncio.create_task(service.build_report(1, '2024-01-01', '2024-01-31'))
+        await wait_until(lambda: service.shared == 1)
+        assert service.pending == 2
+        gate.set()
+        await asyncio.gather(*first, same)
+        return service, rejected
+
+    service, rejected = asyncio.run(scenario())
+    assert rejected
+    assert (service.stats()['rejected'], service.stats()['completed'], service.stats()['pending']) == (1, 4, 0)
\ No newline at end of file
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import main
+from callback_router import CallbackRouter
+from webhook import SECRET_TOKEN_HEADER
+
+TOKEN = '1:test'
+SECRET = 'webhook-secret'
+WEBHOOK_URL = 'https://bot.example.com/telegram'
+
+class StubBotApi:
+    """Подмена Bot API: HTTP сервер, отвечающий на запросы бота, как Telegram"""
+
+    def __init__(self):
+        self.calls = []  # [(метод, параметры)]
+        self._message_id = 0
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def sent_to(self, chat_id):
+        """Тексты sendMessage в чат chat_id"""
+        return [params['text'] for method, params in self.calls
+                if method == 'sendMessage' and params.get('chat_id') == str(chat_id)]
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+                params = dict(parse_qsl(body))
+                api.calls.append((method, params))
+
+                result = True
+                if method == 'getMe':
+                    result = {'id': 1, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+                elif method == 'sendMessage':
+                    api._message_id += 1
+                    result = {
+                        'message_id': api._message_id,
+                        'date': int(time.time()),
+                        'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                        'text': params['text'],
+                    }
+                data = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def start_command(update_id, user_id):
+    """Апдейт: пользователь user_id отправил /start"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Студент'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+def http(method, url, payload=None, headers=None):
+    """(код ответа, текст) HTTP запроса"""
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+async def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "не дождались"
+        await asyncio.sleep(0.01)
+
+def test_webhook_dispatches_updates_from_telegram_only(db, monkeypatch):
+    api = StubBotApi()
+    api.start()
+    monkeypatch.setattr(main, 'TELEGRAM_API_URL', api.url)
+    monkeypatch.setattr(main, 'WEBHOOK_LISTEN', '127.0.0.1')
+    monkeypatch.setattr(main, 'WEBHOOK_PORT', 0)
+    monkeypatch.setattr(main, 'WEBHOOK_PATH', '/telegram')
+    monkeypatch.setattr(main, 'WEBHOOK_SECRET', SECRET)
+    monkeypatch.setattr(main, 'WEBHOOK_URL', WEBHOOK_URL)
+    # Таблица маршрутов кнопок строится один раз на экземпляр бота
+    monkeypatch.setattr(main, 'callback_router', CallbackRouter())
+
+    bot = main.UniHelperBot(TOKEN)
+    bot.setup_handlers()
+
+    async def scenario():
+        stop = asyncio.Event()
+        runner = asyncio.create_task(bot.run_webhook(stop))
+        try:
+            await wait_until(lambda: bot.webhook_server is not None and bot.webhook_server.ready)
+            base = f"http://127.0.0.1:{bot.webhook_server.address[1]}"
+
+            assert await asyncio.to_thread(http, 'GET', f"{base}/healthz") == (200, 'ok')
+            assert await asyncio.to_thread(http, 'GET', f"{base}/readyz") == (200, 'ready')
+
+            wrong = await asyncio.to_thread(
+                http, 'POST', f"{base}/telegram", start_command(1, 41), {SECRET_TOKEN_HEADER: 'wrong'}
+            )
+            assert wrong[0] == 403
+            accepted = await asyncio.to_thread(
+                http, 'POST', f"{base}/telegram", start_command(2, 42), {SECRET_TOKEN_HEADER: SECRET}
+            )
+            assert accepted == (200, 'ok')
+
+            await wait_until(lambda: api.sent_to(42))
+        finally:
+            stop.set()
+            await runner
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        api.stop()
+
+    # Ответ пришел только на апдейт с верным секретом
+    assert api.sent_to(42)[0].startswith("👋")
+    assert api.sent_to(41) == []
+    assert bot.webhook_server.rejected == 1
+    assert bot.webhook_server.received == 1
+
+    set_webhook = [params for method, params in api.calls if method == 'setWebhook']
+    assert [(params['url'], params['secret_token']) for params in set_webhook] == [(WEBHOOK_URL, SECRET)]
+    assert not bot.application.running
\ No newline at end of file
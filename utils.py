@@ -1,44 +1,110 @@
 import logging
-from database import db_connection
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from database import async_db_connection
+from config import ROLE_CACHE_TTL, ROLE_CACHE_SIZE
 
 logger = logging.getLogger(__name__)
 
+class RoleCache:
+    """LRU-кэш ролей пользователей с ограниченным временем жизни записей"""
+
+    def __init__(self, ttl=ROLE_CACHE_TTL, max_size=ROLE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # telegram_id -> (role, expires_at)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        """Номер поколения кэша; увеличивается при каждой инвалидации"""
+        return self._generation
+
+    def get(self, user_id):
+        """Роль из кэша или None, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id, role, generation):
+        """Сохранить роль, если с момента начала запроса к БД не было инвалидации"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[user_id] = (role, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Сбросить роль пользователя (или весь кэш, если user_id не указан)"""
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total * 100 if total else 0.0,
+            }
+
+role_cache = RoleCache()
+
+def invalidate_user_role(user_id=None):
+    """Сбросить кэшированную роль после изменений в admins/students"""
+    role_cache.invalidate(user_id)
+
 async def check_admin_rights(user_id):
     """Проверка прав администратора"""
-    try:
-        with db_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT role FROM admins WHERE telegram_id = ? AND role = 'admin'", (user_id,))
-            return cur.fetchone() is not None
-    except Exception as e:
-        logger.error(f"Ошибка проверки прав: {e}")
-        return False
+    return await get_user_role(user_id) == 'admin'
 
 async def get_user_role(user_id):
     """Получить роль пользователя"""
+    role = role_cache.get(user_id)
+    if role is not None:
+        return role
+    
+    generation = role_cache.generation
     try:
-        with db_connection() as conn:
-            cur = conn.cursor()
-            
+        async with async_db_connection() as conn:
             # Проверяем админа
-            cur.execute("SELECT role FROM admins WHERE telegram_id = ?", (user_id,))
-            admin = cur.fetchone()
+            admin = await conn.fetchone("SELECT role FROM admins WHERE telegram_id = ?", (user_id,))
             if admin:
-                return admin['role']
-            
-            # Проверяем студента
-            cur.execute("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
-            student = cur.fetchone()
-            return 'student' if student else 'guest'
+                role = admin['role']
+            else:
+                # Проверяем студента
+                student = await conn.fetchone("SELECT id FROM students WHERE telegram_id = ?", (user_id,))
+                role = 'student' if student else 'guest'
             
     except Exception as e:
         logger.error(f"Ошибка получения роли: {e}")
         return 'guest'
-
-def create_fake_update(query):
-    """Создать fake update объект для обработки callback_query"""
-    class FakeUpdate:
-        def __init__(self, query):
-            self.callback_query = query
     
-    return FakeUpdate(query)
\ No newline at end of file
+    role_cache.set(user_id, role, generation)
+    return role
+
+def retry_after_seconds(error):
+    """Пауза из telegram.error.RetryAfter в секундах"""
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
\ No newline at end of file
@@ -0,0 +1,127 @@
+import asyncio
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+from database import db_connection
+from config import WEBHOOK_MAX_BODY_BYTES
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    """HTTP сервер для приема апдейтов Telegram через webhook.
+
+    Работает в отдельном потоке (только стандартная библиотека): принятый
+    апдейт сразу кладется в update_queue приложения и Telegram получает
+    ответ 200, не дожидаясь обработки. Кроме пути webhook отвечает на
+    /healthz (процесс жив) и /readyz (приложение запущено, webhook
+    зарегистрирован и БД доступна) - для проверок балансировщика.
+    """
+
+    def __init__(self, application, loop, listen, port, path, secret_token=None):
+        self.application = application
+        self.loop = loop
+        self.path = path
+        self.secret_token = secret_token
+        self.ready = False
+        self.received = 0
+        self.rejected = 0
+        self._httpd = ThreadingHTTPServer((listen, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address[:2]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/healthz':
+                    self._reply(200, 'ok')
+                elif self.path == '/readyz':
+                    if server.is_ready():
+                        self._reply(200, 'ready')
+                    else:
+                        self._reply(503, 'not ready')
+                else:
+                    self._reply(404, 'not found')
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404, 'not found')
+                    return
+                status, text = server.accept(self.headers, self.rfile)
+                self._reply(status, text)
+
+            def _reply(self, status, text):
+                body = text.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"webhook {self.address_string()} {format % args}")
+
+        return Handler
+
+    def accept(self, headers, body_stream):
+        """Проверить запрос Telegram и передать апдейт приложению; вернуть (код ответа, текст)"""
+        if self.secret_token is not None:
+            token = headers.get(SECRET_TOKEN_HEADER) or ''
+            if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+                self.rejected += 1
+                logger.warning("Отклонен запрос webhook с неверным секретным токеном")
+                return 403, 'forbidden'
+
+        try:
+            length = int(headers.get('Content-Length') or 0)
+        except ValueError:
+            return 400, 'bad request'
+        if length <= 0:
+            return 400, 'bad request'
+        if length > WEBHOOK_MAX_BODY_BYTES:
+            return 413, 'payload too large'
+
+        try:
+            update = Update.de_json(json.loads(body_stream.read(length)), self.application.bot)
+        except Exception as e:
+            logger.error(f"Ошибка разбора апдейта webhook: {e}")
+            return 400, 'bad request'
+
+        asyncio.run_coroutine_threadsafe(self.application.update_queue.put(update), self.loop)
+        self.received += 1
+        return 200, 'ok'
+
+    def is_ready(self):
+        """Готов ли экземпляр принимать апдейты"""
+        if not self.ready or not self.application.running:
+            return False
+        try:
+            with db_connection() as conn:
+                conn.execute("SELECT 1")
+        except Exception as e:
+            logger.error(f"Проверка готовности: БД недоступна: {e}")
+            return False
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='webhook-server', daemon=True)
+        self._thread.start()
+        host, port = self.address
+        logger.info(f"Webhook сервер слушает {host}:{port}{self.path}")
+
+    def stop(self):
+        self.ready = False
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
\ No newline at end of file